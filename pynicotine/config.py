@@ -172,7 +172,8 @@ class Config:
                 "autojoin": [],
                 "autoaway": 15,
                 "away": False,
-                "private_chatrooms": False
+                "private_chatrooms": False,
+                "network_backend": "selectors"
             },
             "transfers": {
                 "incompletedir": os.path.join(data_home_env, "incomplete"),
@@ -225,6 +226,9 @@ class Config:
                 "rescanonstartup": True,
                 "rescan_shares_daily": True,
                 "rescan_shares_hour": 0,
+                "share_scan_workers": 0,
+                "incremental_rescan": False,
+                "watch_shares": False,
                 "enablefilters": False,
                 "downloadfilters": [
                     ["*.DS_Store", 1],
@@ -323,6 +327,8 @@ class Config:
                 "search_results": True,
                 "max_displayed_results": 2500,
                 "min_search_chars": 3,
+                "max_user_search_requests": 20,
+                "max_search_requests": 600,
                 "private_search_results": False
             },
             "ui": {
@@ -124,8 +124,10 @@ class Core:
             self.portmapper = PortMapper()
 
         if "network_thread" in enabled_components:
+            from pynicotine.slskproto import NETWORK_BACKENDS
             from pynicotine.slskproto import NetworkThread
-            self._network_thread = NetworkThread()
+            network_thread_class = NETWORK_BACKENDS.get(config.sections["server"]["network_backend"], NetworkThread)
+            self._network_thread = network_thread_class()
         else:
             events.connect("schedule-quit", self._schedule_quit)
 
@@ -139,6 +139,7 @@ EVENT_NAMES = {
     # Shares
     "folder-contents-request",
     "shared-file-list-failed",
+    "shared-file-list-folders",
     "shared-file-list-progress",
     "shared-file-list-request",
     "shared-file-list-response",
@@ -72,6 +72,7 @@ class UserBrowses(IconNotebook):
             ("quit", self.quit),
             ("server-disconnect", self.server_disconnect),
             ("shared-file-list-failed", self.shared_file_list_failed),
+            ("shared-file-list-folders", self.shared_file_list_folders),
             ("shared-file-list-progress", self.shared_file_list_progress),
             ("shared-file-list-response", self.shared_file_list),
             ("user-browse-remove-user", self.remove_user),
@@ -185,6 +186,13 @@ class UserBrowses(IconNotebook):
         if page is not None:
             page.shared_file_list_progress(position, total)
 
+    def shared_file_list_folders(self, username, public_folders, private_folders):
+
+        page = self.pages.get(username)
+
+        if page is not None:
+            page.shared_file_list_folders(public_folders, private_folders)
+
     def shared_file_list(self, msg):
 
         page = self.pages.get(msg.username)
@@ -590,6 +598,19 @@ class UserBrowse:
 
         self.set_finished()
 
+    def shared_file_list_folders(self, public_folders, private_folders):
+        """Show folders of a large shares list while the rest of it is being
+        received. The folder tree is rebuilt in order once the whole list is
+        received."""
+
+        browsed_user = core.userbrowse.users[self.user]
+
+        self.create_folder_tree(dict(public_folders))
+        self.create_folder_tree(dict(private_folders), private=True)
+
+        self.num_folders_label.set_text(humanize(browsed_user.num_folders))
+        self.share_size_label.set_text(human_size(browsed_user.shared_size))
+
     def shared_file_list_failed(self, is_offline=False):
 
         if is_offline:
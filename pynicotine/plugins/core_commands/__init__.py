@@ -257,6 +257,11 @@ class Plugin(BasePlugin):
                 "disable": ["cli"],
                 "group": _CommandGroup.SEARCH_FILES,
                 "parameters": ["<user>", "<query>"]
+            },
+            "searchstats": {
+                "callback": self.search_stats_command,
+                "description": _("Show statistics of incoming search requests"),
+                "group": _CommandGroup.SEARCH_FILES
             }
         }
 
@@ -595,6 +600,30 @@ class Plugin(BasePlugin):
         user, query = args.split(maxsplit=1)
         self.core.search.do_search(query, "user", users=[user])
 
+    def search_stats_command(self, _args, **_unused):
+
+        stats = self.core.search.get_incoming_search_stats()
+
+        self.output(_("Incoming search requests:"))
+        self.output(_("• %(num)s accepted, %(user)s rejected by user limit, %(global)s rejected by global limit") % {
+            "num": stats["accepted"],
+            "user": stats["rejected_user_limit"],
+            "global": stats["rejected_global_limit"]
+        })
+        self.output(_("• %(num)s processed, %(dropped)s dropped, %(queued)s queued") % {
+            "num": stats["processed"],
+            "dropped": stats["dropped"],
+            "queued": stats["queued"]
+        })
+        self.output(_("• Latency: %(average)s ms average, %(max)s ms maximum") % {
+            "average": round(stats["average_latency"] * 1000, 1),
+            "max": round(stats["max_latency"] * 1000, 1)
+        })
+        self.output(_("• Result cache: %(hits)s hits, %(misses)s misses") % {
+            "hits": stats["cache_hits"],
+            "misses": stats["cache_misses"]
+        })
+
     # Plugin Commands #
 
     def plugin_handler_command(self, args, **_unused):
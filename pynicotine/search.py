@@ -10,9 +10,15 @@ import json
 import os
 import time
 
+from bisect import bisect_left
+from collections import OrderedDict
+from collections import deque
 from itertools import islice
 from operator import itemgetter
 from shlex import shlex
+from threading import Condition
+from threading import Lock
+from threading import Thread
 
 from pynicotine.config import config
 from pynicotine.core import core
@@ -107,9 +113,357 @@ class WishSearchRequest(SearchRequest):
         }
 
 
+class PhraseMatcher:
+    """Aho-Corasick automaton that finds any of a list of phrases in a
+    string, in a single pass over the string regardless of the number of
+    phrases. Short lists are searched one phrase at a time instead, which
+    is faster than stepping through the automaton."""
+
+    __slots__ = ("phrases", "_transitions", "_fail_states", "_matches")
+
+    MIN_AUTOMATON_PHRASES = 8
+
+    def __init__(self, phrases=None):
+
+        self.phrases = list(phrases) if phrases else []
+        self._transitions = self._fail_states = self._matches = None
+
+        if len(self.phrases) >= self.MIN_AUTOMATON_PHRASES:
+            self._build_automaton()
+
+    def _build_automaton(self):
+
+        transitions = [{}]
+        matches = [None]
+
+        # Trie of phrases
+        for phrase in self.phrases:
+            state = 0
+
+            for char in phrase:
+                next_state = transitions[state].get(char)
+
+                if next_state is None:
+                    next_state = len(transitions)
+                    transitions[state][char] = next_state
+                    transitions.append({})
+                    matches.append(None)
+
+                state = next_state
+
+            if matches[state] is None:
+                matches[state] = phrase
+
+        # Fail states point to the longest proper suffix of a state that is also
+        # in the trie, and are resolved breadth-first
+        fail_states = [0] * len(transitions)
+        pending_states = deque(transitions[0].values())
+
+        while pending_states:
+            state = pending_states.popleft()
+
+            for char, next_state in transitions[state].items():
+                fail_state = fail_states[state]
+
+                while fail_state and char not in transitions[fail_state]:
+                    fail_state = fail_states[fail_state]
+
+                fail_state = transitions[fail_state].get(char, 0)
+                fail_states[next_state] = fail_state
+
+                if matches[next_state] is None:
+                    matches[next_state] = matches[fail_state]
+
+                pending_states.append(next_state)
+
+        self._transitions = transitions
+        self._fail_states = fail_states
+        self._matches = matches
+
+    def find(self, text):
+        """Returns a phrase present in the text, or None."""
+
+        if self._transitions is None:
+            return next((phrase for phrase in self.phrases if phrase in text), None)
+
+        transitions = self._transitions
+        fail_states = self._fail_states
+        matches = self._matches
+        state = 0
+
+        if matches[state] is not None:
+            # Empty phrase
+            return matches[state]
+
+        for char in text:
+            while state and char not in transitions[state]:
+                state = fail_states[state]
+
+            state = transitions[state].get(char, 0)
+            match = matches[state]
+
+            if match is not None:
+                return match
+
+        return None
+
+
+class SearchResultCache:
+    """Least recently used cache of compressed result lists for incoming
+    search requests. The same popular search terms are sent by many users
+    on the distributed network, and are only looked up once for each
+    generation of share databases.
+
+    The generation of cached results increases every time the cache is
+    cleared. Results looked up during an older generation, e.g. before
+    excluded phrases changed, are not added to the cache."""
+
+    __slots__ = ("max_size", "word_index", "generation", "hits", "misses", "_results", "_lock")
+
+    def __init__(self, max_size=256):
+
+        self.max_size = max_size
+        self.word_index = None
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, key):
+
+        with self._lock:
+            results = self._results.get(key)
+
+            if results is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._results.move_to_end(key)
+            return results
+
+    def add(self, key, results, generation):
+
+        with self._lock:
+            if generation != self.generation:
+                # Results were looked up before the cache was cleared
+                return
+
+            self._results[key] = results
+
+            if len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+
+    def clear(self, word_index=None):
+        """Remove cached results, e.g. when the word index of a new
+        generation of share databases is loaded."""
+
+        with self._lock:
+            self.word_index = word_index
+            self.generation += 1
+            self._results.clear()
+
+    def get_generation(self, word_index):
+        """Returns the current generation of cached results, to pass to
+        add() once results are looked up. Results cached for a different
+        word index are removed first."""
+
+        with self._lock:
+            if word_index is not self.word_index:
+                # Share databases changed since results were cached
+                self.word_index = word_index
+                self.generation += 1
+                self._results.clear()
+
+            return self.generation
+
+
+class SearchRequestQueue:
+    """Bounded queue of incoming search requests, processed by a pool of
+    worker threads. When too many requests arrive, the oldest queued
+    requests are dropped, since their senders have most likely received
+    enough results from other users by the time they would be processed."""
+
+    __slots__ = ("callback", "num_workers", "max_size", "num_processed", "num_dropped", "total_latency",
+                 "max_latency", "_requests", "_condition", "_threads", "_is_active")
+
+    def __init__(self, callback, num_workers=2, max_size=100):
+
+        self.callback = callback
+        self.num_workers = num_workers
+        self.max_size = max_size
+        self.num_processed = 0
+        self.num_dropped = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self._requests = deque()
+        self._condition = Condition()
+        self._threads = []
+        self._is_active = False
+
+    def __len__(self):
+        return len(self._requests)
+
+    @property
+    def average_latency(self):
+
+        if not self.num_processed:
+            return 0.0
+
+        return self.total_latency / self.num_processed
+
+    def start(self):
+
+        if self._is_active:
+            return
+
+        self._is_active = True
+
+        for worker_index in range(self.num_workers):
+            thread = Thread(target=self._run, name=f"SearchRequestWorker{worker_index + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+
+        with self._condition:
+            self._is_active = False
+            self.num_dropped += len(self._requests)
+            self._requests.clear()
+            self._condition.notify_all()
+
+        for thread in self._threads:
+            thread.join()
+
+        self._threads.clear()
+
+    def put(self, *args):
+
+        with self._condition:
+            if len(self._requests) >= self.max_size:
+                self._requests.popleft()
+                self.num_dropped += 1
+
+            self._requests.append((time.monotonic(), args))
+            self._condition.notify()
+
+    def _run(self):
+
+        while True:
+            with self._condition:
+                while self._is_active and not self._requests:
+                    self._condition.wait()
+
+                if not self._is_active:
+                    return
+
+                queued_time, args = self._requests.popleft()
+
+            self.callback(*args)
+            latency = (time.monotonic() - queued_time)
+
+            with self._condition:
+                self.num_processed += 1
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+
+
+class SearchRequestLimiter:
+    """Token bucket rate limiter for incoming search requests, with a bucket
+    for each requesting user, and a global bucket shared by all users.
+    Buckets refill continuously at the configured rate, and hold up to
+    BURST_DURATION seconds worth of requests."""
+
+    __slots__ = ("num_accepted", "num_rejected_user", "num_rejected_global", "_user_buckets", "_global_bucket")
+
+    BURST_DURATION = 10
+    MAX_USER_BUCKETS = 5000
+
+    def __init__(self):
+
+        self.num_accepted = 0
+        self.num_rejected_user = 0
+        self.num_rejected_global = 0
+        self._user_buckets = OrderedDict()
+        self._global_bucket = None
+
+    def _refill(self, bucket, rate, current_time):
+        """Returns the number of tokens in a [tokens, last_time] bucket, or a
+        full bucket if none exists yet. Rates are in requests per minute."""
+
+        capacity = max(rate * self.BURST_DURATION / 60, 1)
+
+        if bucket is None:
+            return capacity
+
+        tokens, last_time = bucket
+        return min(tokens + ((current_time - last_time) * rate / 60), capacity)
+
+    def _prune_user_buckets(self, user_rate, current_time):
+        """Remove buckets of users that stopped searching, since they would
+        be full by now. Buckets are ordered by last use, and if all of them
+        are still in use, the least recently used ones are removed, keeping
+        the limits of users that are currently searching."""
+
+        refill_duration = max(self.BURST_DURATION, 60 / user_rate)
+        user_buckets = self._user_buckets
+
+        while user_buckets:
+            username = next(iter(user_buckets))
+            _tokens, last_time = user_buckets[username]
+
+            if current_time - last_time < refill_duration and len(user_buckets) < self.MAX_USER_BUCKETS:
+                break
+
+            del user_buckets[username]
+
+    def allow(self, username, user_rate, global_rate, current_time=None):
+        """Returns True if a search request from a user is within the limits,
+        and consumes a token from each bucket. A rate of 0 disables a
+        limit."""
+
+        if current_time is None:
+            current_time = time.monotonic()
+
+        user_tokens = global_tokens = None
+
+        if user_rate > 0:
+            user_tokens = self._refill(self._user_buckets.get(username), user_rate, current_time)
+
+            if user_tokens < 1:
+                # Keep the bucket of a user that is still searching
+                self._user_buckets.move_to_end(username)
+                self.num_rejected_user += 1
+                return False
+
+        if global_rate > 0:
+            global_tokens = self._refill(self._global_bucket, global_rate, current_time)
+
+            if global_tokens < 1:
+                self.num_rejected_global += 1
+                return False
+
+            self._global_bucket = [global_tokens - 1, current_time]
+
+        if user_tokens is not None:
+            if username not in self._user_buckets and len(self._user_buckets) >= self.MAX_USER_BUCKETS:
+                self._prune_user_buckets(user_rate, current_time)
+
+            self._user_buckets[username] = [user_tokens - 1, current_time]
+            self._user_buckets.move_to_end(username)
+
+        self.num_accepted += 1
+        return True
+
+
 class Search:
-    __slots__ = ("searches", "excluded_phrases", "wishlist", "wishlist_file_path", "wishlist_interval",
-                 "_token", "_own_tokens", "_allow_saving_wishlist", "_wishlist_timer_id")
+    __slots__ = ("searches", "wishlist", "wishlist_file_path", "wishlist_interval",
+                 "result_cache", "request_queue", "request_limiter", "_token", "_own_tokens", "_allow_saving_wishlist",
+                 "_wishlist_timer_id", "_excluded_phrase_matcher")
 
     SEARCH_HISTORY_LIMIT = 200
     RESULT_FILTER_HISTORY_LIMIT = 50
@@ -123,10 +477,13 @@ class Search:
     def __init__(self):
 
         self.searches = {}
-        self.excluded_phrases = []
         self.wishlist = {}
         self.wishlist_file_path = os.path.join(config.data_folder_path, "wishlist.json")
         self.wishlist_interval = 0
+        self.result_cache = SearchResultCache()
+        self.request_queue = SearchRequestQueue(callback=self._find_search_results)
+        self.request_limiter = SearchRequestLimiter()
+        self._excluded_phrase_matcher = PhraseMatcher()
 
         self._token = initial_token()
         self._own_tokens = set()
@@ -146,16 +503,29 @@ class Search:
         ):
             events.connect(event_name, callback)
 
+    @property
+    def excluded_phrases(self):
+        return self._excluded_phrase_matcher.phrases
+
+    @excluded_phrases.setter
+    def excluded_phrases(self, phrases):
+
+        # Phrases are compiled once, instead of searching for each phrase in every result
+        self._excluded_phrase_matcher = PhraseMatcher(phrases)
+        self.result_cache.clear(self.result_cache.word_index)
+
     def _start(self):
 
         self._load_wishlist()
         self._allow_saving_wishlist = True
+        self.request_queue.start()
 
         # Save wishlist every 3 minutes
         events.schedule(delay=180, callback=self._save_wishlist, repeat=True)
 
     def _quit(self):
 
+        self.request_queue.stop()
         self._save_wishlist()
         self.remove_all_searches()
         self._allow_saving_wishlist = False
@@ -171,7 +541,7 @@ class Search:
 
     def _server_disconnect(self, _msg):
 
-        self.excluded_phrases.clear()
+        self.excluded_phrases = []
         self._own_tokens.clear()
 
         events.cancel_scheduled(self._wishlist_timer_id)
@@ -662,9 +1032,9 @@ class Search:
 
     def _append_file_info(self, file_list, fileinfo):
 
-        file_path, *_unused = fileinfo
+        file_path, _packed_file_info = fileinfo
         file_path_lower = file_path.lower()
-        excluded_phrase = next((phrase for phrase in self.excluded_phrases if phrase in file_path_lower), None)
+        excluded_phrase = self._excluded_phrase_matcher.find(file_path_lower)
 
         # Check if file path contains phrase excluded from the search network
         if excluded_phrase:
@@ -677,8 +1047,9 @@ class Search:
 
         file_list.append(fileinfo)
 
-    def _create_file_info_list(self, results, max_results, permission_level):
-        """Given a list of file indices, retrieve the file information for each index."""
+    def _create_file_info_list(self, results, max_results, permission_level, share_dbs):
+        """Given a list of file indices, retrieve the virtual path and packed
+        file information for each index."""
 
         reveal_buddy_shares = config.sections["transfers"]["reveal_buddy_shares"]
         reveal_trusted_shares = config.sections["transfers"]["reveal_trusted_shares"]
@@ -689,33 +1060,37 @@ class Search:
         private_fileinfos = []
         num_fileinfos = 0
 
-        public_files = core.shares.share_dbs["public_files"]
-        buddy_files = core.shares.share_dbs["buddy_files"]
-        trusted_files = core.shares.share_dbs["trusted_files"]
+        get_public_file_info = share_dbs["public_files"].get_packed_file_info
+        get_buddy_file_info = share_dbs["buddy_files"].get_packed_file_info
+        get_trusted_file_info = share_dbs["trusted_files"].get_packed_file_info
+        file_path_index = share_dbs["file_paths"]
 
         for index in islice(results, min(len(results), max_results)):
-            file_path = core.shares.file_path_index[index]
+            file_path = file_path_index[index]
+            fileinfo = get_public_file_info(file_path)
 
-            if file_path in public_files:
-                self._append_file_info(fileinfos, public_files[file_path])
+            if fileinfo is not None:
+                self._append_file_info(fileinfos, fileinfo)
                 continue
 
-            if (is_buddy or reveal_buddy_shares) and file_path in buddy_files:
-                fileinfo = buddy_files[file_path]
+            if is_buddy or reveal_buddy_shares:
+                fileinfo = get_buddy_file_info(file_path)
 
-                if is_buddy:
-                    self._append_file_info(fileinfos, fileinfo)
-                else:
-                    self._append_file_info(private_fileinfos, fileinfo)
-                continue
+                if fileinfo is not None:
+                    if is_buddy:
+                        self._append_file_info(fileinfos, fileinfo)
+                    else:
+                        self._append_file_info(private_fileinfos, fileinfo)
+                    continue
 
-            if (is_trusted or reveal_trusted_shares) and file_path in trusted_files:
-                fileinfo = trusted_files[file_path]
+            if is_trusted or reveal_trusted_shares:
+                fileinfo = get_trusted_file_info(file_path)
 
-                if is_trusted:
-                    self._append_file_info(fileinfos, fileinfo)
-                else:
-                    self._append_file_info(private_fileinfos, fileinfo)
+                if fileinfo is not None:
+                    if is_trusted:
+                        self._append_file_info(fileinfos, fileinfo)
+                    else:
+                        self._append_file_info(private_fileinfos, fileinfo)
 
         results.clear()
 
@@ -729,105 +1104,197 @@ class Search:
         return num_fileinfos, fileinfos, private_fileinfos
 
     @staticmethod
-    def _update_search_results(results, word_indices, excluded=False):
-        """Updates the search result list with indices for a new word."""
+    def _gallop(word_indices, index, position):
+        """Returns the position of the first index not lower than the given
+        index in a sorted index sequence, starting from a known lower
+        position. Steps grow exponentially before a binary search, making
+        lookups cheap both for nearby and distant positions."""
 
-        if not word_indices:
-            if excluded:
-                # We don't care if an excluded word doesn't exist in our DB
-                return results
+        num_word_indices = len(word_indices)
+        upper_position = position
+        step = 1
 
-            # Included word does not exist in our DB, no results
-            return set()
+        while upper_position < num_word_indices and word_indices[upper_position] < index:
+            position = upper_position + 1
+            upper_position += step
+            step *= 2
 
-        if results is None:
-            if excluded:
-                # No results yet, but word is excluded. Bail.
-                return set()
+        return bisect_left(word_indices, index, position, min(upper_position, num_word_indices))
 
-            # First match for included word, return results
-            return set(word_indices)
+    def _intersect_sorted(self, results, word_indices):
+        """Returns common indices of two sorted index sequences. Indices of
+        the shorter sequence are looked up in the longer one."""
 
-        if excluded:
-            # Remove results for excluded word
-            results.difference_update(word_indices)
-        else:
-            # Only retain common results for all words so far
-            results.intersection_update(word_indices)
+        if len(results) > len(word_indices):
+            results, word_indices = word_indices, results
+
+        common_indices = []
+        num_word_indices = len(word_indices)
+        position = 0
+
+        for index in results:
+            position = self._gallop(word_indices, index, position)
+
+            if position == num_word_indices:
+                break
+
+            if word_indices[position] == index:
+                common_indices.append(index)
+
+        return common_indices
+
+    def _match_sorted(self, candidates, included_indices, excluded_indices, max_results=None):
+        """Returns sorted candidate indices present in all included index
+        sequences, and absent from all excluded index sequences. Since all
+        sequences are sorted, a position is kept in each of them, and only
+        advanced. Stops once max_results matches are found."""
+
+        results = []
+        sequences = [(word_indices, True) for word_indices in included_indices]
+        sequences += [(word_indices, False) for word_indices in excluded_indices]
+        positions = [0] * len(sequences)
+
+        for index in candidates:
+            is_match = True
+
+            for sequence_index, (word_indices, is_included) in enumerate(sequences):
+                position = positions[sequence_index] = self._gallop(word_indices, index, positions[sequence_index])
+                num_word_indices = len(word_indices)
+
+                if is_included and position == num_word_indices:
+                    # No further common indices
+                    return results
+
+                if (position < num_word_indices and word_indices[position] == index) != is_included:
+                    is_match = False
+                    break
+
+            if not is_match:
+                continue
+
+            results.append(index)
+
+            if len(results) == max_results:
+                break
 
         return results
 
-    def _create_search_result_list(self, included_words, excluded_words, partial_words, max_results, word_index):
-        """Returns a list of common file indices for each word in a search
-        term."""
+    def _create_search_result_list(self, included_words, excluded_words, partial_words, max_results, word_index,
+                                   word_suffixes=None):
+        """Returns a sorted list of common file indices for each word in a
+        search term.
+
+        Included words are processed from the shortest index sequence to
+        the longest, since the number of results can only decrease.
+        Excluded words are applied last.
+        """
+
+        included_indices = []
 
         for word in included_words:
-            if word not in word_index:
+            word_indices = word_index.get(word)
+
+            if not word_indices:
                 # No results
                 return None
 
-        start_word = next(iter(included_words), None)
+            included_indices.append(word_indices)
 
-        if not start_word:
+        if not included_indices:
             # Require at least one complete word to return results. Matches official clients.
             return None
 
-        results = None
-        has_single_word = (len(included_words) + len(excluded_words) + len(partial_words) == 1)
-        included_words.discard(start_word)
+        included_indices.sort(key=len)
+        excluded_indices = []
 
-        # Included search words (e.g. hello)
-        start_results = word_index[start_word]
+        for word in excluded_words:
+            word_indices = word_index.get(word)
 
-        if has_single_word:
-            # Attempt to avoid large memory usage if someone searches for e.g. "flac"
-            start_results = start_results[:max_results]
+            if word_indices:
+                excluded_indices.append(word_indices)
 
-        results = self._update_search_results(results, start_results)
+        # Included search words (e.g. hello)
+        if not partial_words:
+            # Attempt to avoid large memory usage if someone searches for e.g. "flac"
+            return self._match_sorted(
+                included_indices[0], included_indices[1:], excluded_indices, max_results) or None
 
-        for included_word in included_words:
-            results = self._update_search_results(results, word_index[included_word])
+        results = self._match_sorted(included_indices[0], included_indices[1:], excluded_indices=())
 
-            if not results:
-                return None
+        if not results:
+            return None
 
         # Partial search words (e.g. *ello)
         for partial_word in partial_words:
             partial_word_len = len(partial_word)
             partial_results = set()
 
-            for complete_word in word_index:
+            if word_suffixes is not None:
+                # Look up words ending with the partial word in the sorted table of reversed words
+                complete_words = word_suffixes.iter_words_ending_with(partial_word)
+            else:
+                complete_words = word_index
+
+            for complete_word in complete_words:
                 if len(complete_word) < partial_word_len or not complete_word.endswith(partial_word):
                     continue
 
-                indices = {i for i in word_index[complete_word] if i in results}
-
-                if indices:
-                    partial_results.update(indices)
+                partial_results.update(self._intersect_sorted(results, word_index[complete_word]))
 
             if not partial_results:
                 return None
 
-            results = self._update_search_results(results, partial_results)
-
-            if not results:
-                return None
+            # Partial results are already limited to previous results
+            results = sorted(partial_results)
 
         # Excluded search words (e.g. -hello)
-        if results:
-            for excluded_word in excluded_words:
-                if excluded_word not in word_index:
-                    continue
+        return self._match_sorted(results, included_indices=(), excluded_indices=excluded_indices,
+                                  max_results=max_results) or None
+
+    def get_incoming_search_stats(self):
+        """Returns statistics of incoming search requests since startup."""
+
+        request_queue = self.request_queue
+        request_limiter = self.request_limiter
+
+        return {
+            "accepted": request_limiter.num_accepted,
+            "rejected_user_limit": request_limiter.num_rejected_user,
+            "rejected_global_limit": request_limiter.num_rejected_global,
+            "queued": len(request_queue),
+            "processed": request_queue.num_processed,
+            "dropped": request_queue.num_dropped,
+            "average_latency": request_queue.average_latency,
+            "max_latency": request_queue.max_latency,
+            "cache_hits": self.result_cache.hits,
+            "cache_misses": self.result_cache.misses
+        }
 
-                results = self._update_search_results(results, word_index[excluded_word], excluded=True)
+    def _create_cached_results(self, included_words, excluded_words, partial_words, max_results,
+                               permission_level, share_dbs):
+        """Returns the number of results, and result lists compressed in
+        advance, for a search term."""
 
-                if not results:
-                    return None
+        # Find common file matches for each word in search term
+        results = self._create_search_result_list(
+            included_words, excluded_words, partial_words, max_results, share_dbs["words"],
+            share_dbs.get("word_suffixes"))
 
         if not results:
-            return None
+            return 0, None, None
 
-        return results
+        # Get file information for each file index in result list
+        num_results, fileinfos, private_fileinfos = self._create_file_info_list(
+            results, max_results, permission_level, share_dbs)
+
+        if not num_results:
+            return 0, None, None
+
+        return (
+            num_results,
+            FileSearchResponse.compress_result_list(fileinfos),
+            FileSearchResponse.compress_result_list(private_fileinfos) if private_fileinfos else None
+        )
 
     def _process_search_request(self, search_term, username, token):
         """This section is accessed every time a search request arrives,
@@ -857,6 +1324,12 @@ class Search:
 
             self._own_tokens.discard(token)
 
+        elif not self.request_limiter.allow(
+                username, config.sections["searches"]["max_user_search_requests"],
+                config.sections["searches"]["max_search_requests"]):
+            # Too many search requests from this user, or from all users
+            return
+
         max_results = config.sections["searches"]["maxresults"]
 
         if max_results <= 0:
@@ -874,7 +1347,38 @@ class Search:
         if "words" not in core.shares.share_dbs:
             return
 
-        word_index = core.shares.share_dbs["words"]
+        # Look up results in a worker thread, to avoid blocking the main thread
+        self.request_queue.put(search_term, username, token, permission_level, max_results)
+
+    def _get_cached_results(self, included_words, excluded_words, partial_words, max_results, permission_level,
+                            share_dbs):
+
+        word_index = share_dbs.get("words")
+
+        if word_index is None:
+            return None
+
+        # Generation is retrieved before looking up results, in case excluded phrases
+        # change in the meantime
+        cache_generation = self.result_cache.get_generation(word_index)
+        cache_key = (
+            frozenset(included_words), frozenset(excluded_words), frozenset(partial_words), permission_level,
+            max_results, config.sections["transfers"]["reveal_buddy_shares"],
+            config.sections["transfers"]["reveal_trusted_shares"]
+        )
+        cached_results = self.result_cache.get(cache_key)
+
+        if cached_results is None:
+            cached_results = self._create_cached_results(
+                included_words, excluded_words, partial_words, max_results, permission_level, share_dbs)
+            self.result_cache.add(cache_key, cached_results, cache_generation)
+
+        return cached_results
+
+    def _find_search_results(self, search_term, username, token, permission_level, max_results):
+        """Called in a worker thread to look up results for a queued search
+        request. Share databases are only read."""
+
         original_search_term = search_term
         search_term = search_term.lower()
 
@@ -902,28 +1406,43 @@ class Search:
         search_term = search_term.translate(TRANSLATE_PUNCTUATION).strip()
         included_words = (set(search_term.split()) - excluded_words - partial_words)
 
-        # Find common file matches for each word in search term
-        results = self._create_search_result_list(
-            included_words, excluded_words, partial_words, max_results, word_index)
+        # Databases stay open while looking up results, even if a rescan switches to a
+        # new generation of share databases in the meantime
+        share_dbs = core.shares.acquire_share_dbs()
 
-        if not results:
+        try:
+            cached_results = self._get_cached_results(
+                included_words, excluded_words, partial_words, max_results, permission_level, share_dbs)
+
+        finally:
+            core.shares.release_share_dbs(share_dbs)
+
+        if cached_results is None:
             return
 
-        # Get file information for each file index in result list
-        num_results, fileinfos, private_fileinfos = self._create_file_info_list(
-            results, max_results, permission_level)
+        num_results, result_list, private_result_list = cached_results
 
         if not num_results:
             return
 
+        events.invoke_main_thread(
+            self._send_search_response, original_search_term, username, token,
+            num_results, result_list, private_result_list
+        )
+
+    def _send_search_response(self, search_term, username, token, num_results, result_list, private_result_list):
+
+        if core.users.login_status == UserStatus.OFFLINE:
+            return
+
         core.send_message_to_peer(username, FileSearchResponse(
-            search_username=local_username,
+            search_username=core.users.login_username,
             token=token,
-            shares=fileinfos,
+            shares=result_list,
             freeulslots=core.uploads.is_new_upload_accepted(),
             ulspeed=core.uploads.upload_speed,
             inqueue=core.uploads.get_upload_queue_size(username),
-            private_shares=private_fileinfos
+            private_shares=private_result_list
         ))
 
         log.add_search(
@@ -933,7 +1452,7 @@ class Search:
                 num_results
             ), {
                 "user": username,
-                "query": original_search_term,
+                "query": search_term,
                 "num": humanize(num_results)
             }
         )
@@ -5,26 +5,31 @@
 # SPDX-FileCopyrightText: 2009 daelstorm <daelstorm@gmail.com>
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import atexit
+import errno
 import gc
 import mmap
 import os
 import re
+import select
 import stat
 import sys
 import time
 
+from array import array
+from bisect import bisect_left
 from collections import defaultdict
 from datetime import datetime
 from datetime import timedelta
 from itertools import chain
 from os import SEEK_END
 from os import SEEK_SET
-from pickle import HIGHEST_PROTOCOL
-from pickle import dumps
 from pickle import Unpickler
 from pickle import UnpicklingError
 from struct import Struct
+from threading import Lock
 from threading import Thread
+from zlib import crc32
 
 from pynicotine import rename_process
 from pynicotine.config import config
@@ -37,6 +42,7 @@ from pynicotine.slskmessages import FolderContentsResponse
 from pynicotine.slskmessages import GetUserStats
 from pynicotine.slskmessages import SharedFileListResponse
 from pynicotine.slskmessages import SharedFoldersFiles
+from pynicotine.slskmessages import SharesListSegment
 from pynicotine.utils import TRANSLATE_PUNCTUATION
 from pynicotine.utils import UINT32_LIMIT
 from pynicotine.utils import encode_path
@@ -98,133 +104,747 @@ class DatabaseVersionError(DatabaseError):
 
 
 class Database:
-    """Custom key-value database format for Nicotine+ shares."""
+    """Custom key-value database format for Nicotine+ shares.
 
-    __slots__ = ("_value_offsets", "_file_handle", "_file_offset", "_overwrite")
+    Values are stored as raw bytes. Subclasses encode other types of
+    values without pickling, allowing values to be decoded directly from
+    the memory-mapped file.
+
+    Records are followed by an open-addressing hash table of record
+    offsets, and a trailer pointing to the table. Opening a database only
+    reads the trailer, and lookups probe the table through the mmap,
+    instead of keeping a dict of every key in memory.
+    """
+
+    __slots__ = ("_value_offsets", "_file_handle", "_file_offset", "_overwrite", "_index_offset",
+                 "_index_mask", "_num_items")
 
     FILE_SIGNATURE = b"DBN+"
-    VERSION = 3
+    INDEX_SIGNATURE = b"IDX+"
+    VERSION = 5
+    UNINDEXED_VERSION = 4
+    LEGACY_VERSION = 3
     LENGTH_DATA_SIZE = 8
     PACK_LENGTHS = Struct("!II").pack
     UNPACK_LENGTHS = Struct("!II").unpack_from
-    PICKLE_PROTOCOL = min(HIGHEST_PROTOCOL, 5)  # Use version 5 when available
+    UNPACK_INDEX_OFFSET = Struct("!Q").unpack_from
+    INDEX_OFFSET_SIZE = 8
+    TRAILER = Struct("!QQQ4s")
 
     def __init__(self, file_path, overwrite=True):
 
         folder_path = os.path.dirname(file_path)
-        mode = "ab+" if overwrite else "rb"
 
         if not os.path.exists(folder_path):
             os.makedirs(folder_path)
 
-        if overwrite and os.path.exists(file_path):
-            os.remove(file_path)
-
-        self._value_offsets = self._load_value_offsets(file_path, mode)
+        self._overwrite = overwrite
+        self._value_offsets = None
+        self._index_offset = self._index_mask = self._num_items = 0
 
         if overwrite:
-            self._file_handle = open(file_path, mode)  # pylint: disable=consider-using-with
-        else:
-            with open(file_path, mode) as file_handle:
-                self._file_handle = mmap.mmap(file_handle.fileno(), length=0, access=mmap.ACCESS_READ)
+            if os.path.exists(file_path):
+                os.remove(file_path)
 
-        self._file_offset = self._file_handle.seek(0, SEEK_END)
-        self._overwrite = overwrite
+            self._value_offsets = {}
+            self._file_handle = open(file_path, "wb")  # pylint: disable=consider-using-with
+            self._file_handle.write(self.FILE_SIGNATURE + bytes([self.VERSION]))
+            self._file_offset = self._file_handle.tell()
+            return
 
-    def _parse_content(self, content, total_size):
+        with open(file_path, "rb") as file_handle:
+            self._file_handle = mmap.mmap(file_handle.fileno(), length=0, access=mmap.ACCESS_READ)
 
-        value_offsets = {}
-        file_signature_length = len(self.FILE_SIGNATURE)
+        try:
+            self._load_index()
+
+        except Exception:
+            self._file_handle.close()
+            raise
+
+        self._file_offset = self._index_offset
 
-        if content[:file_signature_length] != self.FILE_SIGNATURE:
+    def _load_index(self):
+
+        content = self._file_handle
+        file_size = len(content)
+        header_size = len(self.FILE_SIGNATURE) + 1
+
+        if content[:len(self.FILE_SIGNATURE)] != self.FILE_SIGNATURE:
             raise DatabaseError("Not a database file")
 
-        if content[file_signature_length:file_signature_length + 1][0] != self.VERSION:
+        if file_size < header_size or content[header_size - 1] != self.VERSION:
+            raise DatabaseVersionError("Incompatible version")
+
+        if file_size < header_size + self.TRAILER.size:
+            raise DatabaseError("Missing database index")
+
+        index_offset, num_slots, num_items, index_signature = self.TRAILER.unpack_from(
+            content, file_size - self.TRAILER.size)
+
+        if (index_signature != self.INDEX_SIGNATURE or num_slots & (num_slots - 1)
+                or index_offset + (num_slots * self.INDEX_OFFSET_SIZE) + self.TRAILER.size != file_size):
+            raise DatabaseError("Invalid database index")
+
+        self._index_offset = index_offset
+        self._index_mask = num_slots - 1
+        self._num_items = num_items
+
+    @classmethod
+    def _iter_items(cls, content, total_size, version=VERSION):
+        """Yield the key, record offset, value offset and value length of
+        each item in the database."""
+
+        file_signature_length = len(cls.FILE_SIGNATURE)
+
+        if content[:file_signature_length] != cls.FILE_SIGNATURE:
+            raise DatabaseError("Not a database file")
+
+        if content[file_signature_length:file_signature_length + 1][0] != version:
             raise DatabaseVersionError("Incompatible version")
 
         current_offset = (file_signature_length + 1)
 
         while current_offset < total_size:
-            key_offset = (current_offset + self.LENGTH_DATA_SIZE)
-            key_length, value_length = self.UNPACK_LENGTHS(content[current_offset:key_offset])
+            key_offset = (current_offset + cls.LENGTH_DATA_SIZE)
+            key_length, value_length = cls.UNPACK_LENGTHS(content, current_offset)
             value_offset = (key_offset + key_length)
             key = content[key_offset:value_offset].tobytes().decode("utf-8")
 
-            value_offsets[key] = value_offset
+            yield key, current_offset, value_offset, value_length
             current_offset = (value_offset + value_length)
 
-        return value_offsets
+    @classmethod
+    def upgrade_file(cls, file_path):
+        """Convert a database file from the legacy pickle-based format, or
+        add an index to a database file without one. Returns False if the
+        file is not in an older format."""
 
-    def _load_value_offsets(self, file_path, mode):
+        with open(file_path, "rb") as file_handle:
+            header = file_handle.read(len(cls.FILE_SIGNATURE) + 1)
 
-        value_offsets = {}
+            if header[:-1] != cls.FILE_SIGNATURE or header[-1] not in {cls.LEGACY_VERSION, cls.UNINDEXED_VERSION}:
+                return False
 
-        with open(file_path, mode) as file_handle:  # pylint: disable=unspecified-encoding
+            version = header[-1]
             file_size = os.fstat(file_handle.fileno()).st_size
+            temp_file_path = file_path + b".tmp"
+            database = cls(temp_file_path)
+
+            try:
+                with mmap.mmap(file_handle.fileno(), length=0, access=mmap.ACCESS_READ) as content:
+                    with memoryview(content) as content_view:
+                        for key, _offset, value_offset, value_length in cls._iter_items(
+                                content_view, file_size, version=version):
+                            if version == cls.UNINDEXED_VERSION:
+                                database.write_record(key, content[value_offset:value_offset + value_length])
+                                continue
 
-            if not file_size:
-                file_handle.write(self.FILE_SIGNATURE)
-                file_handle.write(bytes([self.VERSION]))
-                return value_offsets
+                            file_handle.seek(value_offset, SEEK_SET)
+                            database[key] = RestrictedUnpickler(file_handle).load()
+            finally:
+                database.close()
+
+        os.replace(temp_file_path, file_path)
+        return True
+
+    @staticmethod
+    def _encode_value(value):
+        return value
+
+    @staticmethod
+    def _decode_value(content, offset, length):
+        return content[offset:offset + length]
+
+    def _find_value(self, key):
+        """Returns the offset and length of the value for a key, or None if
+        the key is not in the database."""
 
-            file_handle.seek(0)
+        content = self._file_handle
+        encoded_key = key.encode("utf-8")
+        encoded_key_length = len(encoded_key)
+        index_offset = self._index_offset
+        index_mask = self._index_mask
+        slot = crc32(encoded_key) & index_mask
+
+        while True:
+            offset, = self.UNPACK_INDEX_OFFSET(content, index_offset + (slot * self.INDEX_OFFSET_SIZE))
+
+            if not offset:
+                return None
 
-            with mmap.mmap(file_handle.fileno(), length=0, access=mmap.ACCESS_READ) as content:
-                value_offsets = self._parse_content(memoryview(content), file_size)
+            key_offset = (offset + self.LENGTH_DATA_SIZE)
+            key_length, value_length = self.UNPACK_LENGTHS(content, offset)
 
-        return value_offsets
+            if key_length == encoded_key_length and content[key_offset:key_offset + key_length] == encoded_key:
+                return key_offset + key_length, value_length
+
+            slot = (slot + 1) & index_mask
 
     def __contains__(self, key):
-        return key in self._value_offsets
+
+        if self._value_offsets is not None:
+            return key in self._value_offsets
+
+        return self._find_value(key) is not None
 
     def __iter__(self):
-        yield from self._value_offsets
+
+        if self._value_offsets is not None:
+            yield from self._value_offsets
+            return
+
+        content = self._file_handle
+        current_offset = (len(self.FILE_SIGNATURE) + 1)
+
+        # Read keys from the mmap without a memoryview, since an unfinished
+        # iteration would otherwise prevent the file from being closed
+        while current_offset < self._index_offset:
+            key_offset = (current_offset + self.LENGTH_DATA_SIZE)
+            key_length, value_length = self.UNPACK_LENGTHS(content, current_offset)
+            value_offset = (key_offset + key_length)
+
+            yield content[key_offset:value_offset].decode("utf-8")
+            current_offset = (value_offset + value_length)
 
     def __len__(self):
-        return len(self._value_offsets)
+
+        if self._value_offsets is not None:
+            return len(self._value_offsets)
+
+        return self._num_items
 
     def __getitem__(self, key):
 
-        value_offset = self._value_offsets[key]
+        value = self._find_value(key)
+
+        if value is None:
+            raise KeyError(key)
 
-        self._file_handle.seek(value_offset, SEEK_SET)
-        return RestrictedUnpickler(self._file_handle).load()
+        value_offset, value_length = value
+        return self._decode_value(self._file_handle, value_offset, value_length)
 
     def __setitem__(self, key, value):
+        self.write_record(key, self._encode_value(value))
 
-        encoded_key = key.encode("utf-8")
-        pickled_value = dumps(value, protocol=self.PICKLE_PROTOCOL)
+    def write_record(self, key, encoded_value):
+        """Write an item with a value already encoded for this database."""
 
+        encoded_key = key.encode("utf-8")
         key_length = len(encoded_key)
-        length_data = self.PACK_LENGTHS(key_length, len(pickled_value))
-        item_data = (length_data + encoded_key + pickled_value)
+        length_data = self.PACK_LENGTHS(key_length, len(encoded_value))
+        item_data = (length_data + encoded_key + encoded_value)
 
         self._file_handle.write(item_data)
 
-        self._value_offsets[key] = self._file_offset + self.LENGTH_DATA_SIZE + key_length
+        self._value_offsets[key] = self._file_offset
         self._file_offset += len(item_data)
 
     def get(self, key, default=None):
 
-        if key in self._value_offsets:
-            return self[key]
+        value = self._find_value(key)
 
-        return default
+        if value is None:
+            return default
+
+        value_offset, value_length = value
+        return self._decode_value(self._file_handle, value_offset, value_length)
 
     def update(self, obj):
         for key, value in obj.items():
             self[key] = value
 
+    def _write_index(self):
+        """Write a hash table of record offsets, followed by a trailer
+        pointing to it. Slots are probed linearly, and kept at most 2/3
+        full to keep probe sequences short."""
+
+        num_items = len(self._value_offsets)
+        num_slots = 8
+
+        while num_slots * 2 < num_items * 3:
+            num_slots *= 2
+
+        index_mask = num_slots - 1
+        slots = array("Q", bytes(num_slots * self.INDEX_OFFSET_SIZE))
+
+        for key, offset in self._value_offsets.items():
+            slot = crc32(key.encode("utf-8")) & index_mask
+
+            while slots[slot]:
+                slot = (slot + 1) & index_mask
+
+            slots[slot] = offset
+
+        if sys.byteorder == "little":
+            slots.byteswap()
+
+        self._file_handle.write(slots.tobytes())
+        self._file_handle.write(self.TRAILER.pack(self._file_offset, num_slots, num_items, self.INDEX_SIGNATURE))
+
+    def close(self):
+
+        if self._overwrite:
+            self._write_index()
+            self._file_handle.flush()
+            os.fsync(self._file_handle.fileno())
+
+        self._file_handle.close()
+
+
+class FileDatabase(Database):
+    """Database of [virtual_path, size, quality, duration] file records,
+    stored as a fixed-size header followed by the file information packed
+    for network messages. Search responses reuse the packed file
+    information as-is. Missing quality values are stored as 0, since they
+    are never valid, and missing durations as UINT32_LIMIT."""
+
+    __slots__ = ()
+
+    # Values of previous versions were stored in a different format, and can't be copied
+    VERSION = 6
+    UNINDEXED_VERSION = None
+    HEADER = Struct("!BBIIII")
+    PACK_HEADER = HEADER.pack
+    UNPACK_HEADER = HEADER.unpack_from
+    HEADER_SIZE = HEADER.size
+    UNPACK_PATH_LENGTH = Struct("<I").unpack_from
+    UNPACK_SIZE = Struct("<Q").unpack_from
+    PATH_OFFSET = HEADER_SIZE + 5  # Code (uint8) and path length (uint32)
+    NO_DURATION = UINT32_LIMIT
+
+    @classmethod
+    def _encode_value(cls, value):
+
+        _virtual_file_path, _size, quality, duration = value
+        has_quality = (quality is not None)
+        bitrate = is_vbr = samplerate = bitdepth = 0
+
+        if has_quality:
+            bitrate, is_vbr, samplerate, bitdepth = quality
+
+        if duration is None:
+            duration = cls.NO_DURATION
+
+        return cls.PACK_HEADER(
+            has_quality, is_vbr, bitrate or 0, samplerate or 0, bitdepth or 0, duration
+        ) + FileListMessage.pack_file_info(value)
+
+    @classmethod
+    def _decode_virtual_path(cls, content, offset):
+
+        path_offset = (offset + cls.PATH_OFFSET)
+        path_length, = cls.UNPACK_PATH_LENGTH(content, path_offset - 4)
+        size_offset = (path_offset + path_length)
+
+        return content[path_offset:size_offset].decode("utf-8"), size_offset
+
+    @classmethod
+    def _decode_value(cls, content, offset, length):
+
+        has_quality, is_vbr, bitrate, samplerate, bitdepth, duration = cls.UNPACK_HEADER(content, offset)
+        virtual_file_path, size_offset = cls._decode_virtual_path(content, offset)
+        size, = cls.UNPACK_SIZE(content, size_offset)
+        quality = (bitrate or None, is_vbr, samplerate or None, bitdepth or None) if has_quality else None
+
+        if duration == cls.NO_DURATION:
+            duration = None
+
+        return [virtual_file_path, size, quality, duration]
+
+    def get_packed_file_info(self, key):
+        """Returns the virtual path of a file and its file information packed
+        for network messages, or None if the file is not in the database."""
+
+        value = self._find_value(key)
+
+        if value is None:
+            return None
+
+        value_offset, value_length = value
+        content = self._file_handle
+        virtual_file_path, _size_offset = self._decode_virtual_path(content, value_offset)
+
+        return virtual_file_path, content[value_offset + self.HEADER_SIZE:value_offset + value_length]
+
+
+class MtimeDatabase(Database):
+    """Database of file modification times."""
+
+    __slots__ = ()
+
+    MTIME = Struct("!d")
+    PACK_MTIME = MTIME.pack
+    UNPACK_MTIME = MTIME.unpack_from
+
+    @classmethod
+    def _encode_value(cls, value):
+        return cls.PACK_MTIME(value)
+
+    @classmethod
+    def _decode_value(cls, content, offset, length):
+        mtime, = cls.UNPACK_MTIME(content, offset)
+        return mtime
+
+
+class MetadataDatabase(Database):
+    """Database of (quality, duration) audio metadata, keyed by the device,
+    inode, size and modification time of files. Missing values are stored
+    like in FileDatabase."""
+
+    __slots__ = ()
+
+    METADATA = Struct("!BBIIII")
+    PACK_METADATA = METADATA.pack
+    UNPACK_METADATA = METADATA.unpack_from
+    NO_DURATION = UINT32_LIMIT
+
+    @classmethod
+    def _encode_value(cls, value):
+
+        quality, duration = value
+        has_quality = (quality is not None)
+        bitrate = is_vbr = samplerate = bitdepth = 0
+
+        if has_quality:
+            bitrate, is_vbr, samplerate, bitdepth = quality
+
+        if duration is None:
+            duration = cls.NO_DURATION
+
+        return cls.PACK_METADATA(has_quality, is_vbr, bitrate or 0, samplerate or 0, bitdepth or 0, duration)
+
+    @classmethod
+    def _decode_value(cls, content, offset, length):
+
+        has_quality, is_vbr, bitrate, samplerate, bitdepth, duration = cls.UNPACK_METADATA(content, offset)
+        quality = (bitrate or None, is_vbr, samplerate or None, bitdepth or None) if has_quality else None
+
+        if duration == cls.NO_DURATION:
+            duration = None
+
+        return quality, duration
+
+
+class WordDatabase(Database):
+    """Database of file indices containing each word, stored as sorted
+    arrays of unsigned 32-bit integers. Arrays are returned as memoryviews
+    of the memory-mapped file, without copying or creating an int object
+    for every file index."""
+
+    __slots__ = ()
+
+    @staticmethod
+    def _encode_value(value):
+        return array("I", value).tobytes()
+
+    @staticmethod
+    def _decode_value(content, offset, length):
+        return memoryview(content)[offset:offset + length].cast("I")
+
+    def close(self):
+
+        try:
+            super().close()
+
+        except BufferError:
+            # Posting lists are still referenced somewhere. The file is closed once
+            # they are garbage collected.
+            pass
+
+
+class LowercasePathDatabase(Database):
+    """Database of lowercase basenames and file indices in each folder."""
+
+    __slots__ = ()
+
+    ENTRY_HEADER = Struct("!II")
+    PACK_ENTRY_HEADER = ENTRY_HEADER.pack
+    UNPACK_ENTRY_HEADER = ENTRY_HEADER.unpack_from
+    ENTRY_HEADER_SIZE = ENTRY_HEADER.size
+
+    @classmethod
+    def _encode_value(cls, value):
+
+        encoded_value = bytearray()
+
+        for basename, file_index in value.items():
+            encoded_basename = basename.encode("utf-8")
+            encoded_value += cls.PACK_ENTRY_HEADER(file_index, len(encoded_basename))
+            encoded_value += encoded_basename
+
+        return bytes(encoded_value)
+
+    @classmethod
+    def _decode_value(cls, content, offset, length):
+
+        basenames = {}
+        end_offset = offset + length
+
+        while offset < end_offset:
+            file_index, basename_length = cls.UNPACK_ENTRY_HEADER(content, offset)
+            offset += cls.ENTRY_HEADER_SIZE
+            basenames[content[offset:offset + basename_length].decode("utf-8")] = file_index
+            offset += basename_length
+
+        return basenames
+
+
+class FolderDatabase(Database):
+    """Database of [mtime_ns, inode, scan_options_checksum, subfolder_names,
+    basenames] folder records, used for incremental rescans."""
+
+    __slots__ = ()
+
+    HEADER = Struct("!qQIII")
+    PACK_HEADER = HEADER.pack
+    UNPACK_HEADER = HEADER.unpack_from
+    HEADER_SIZE = HEADER.size
+
+    @classmethod
+    def _encode_value(cls, value):
+
+        mtime_ns, inode, scan_options_checksum, subfolder_names, basenames = value
+        names = "\x00".join(chain(subfolder_names, basenames)).encode("utf-8")
+
+        return cls.PACK_HEADER(
+            mtime_ns, inode, scan_options_checksum, len(subfolder_names), len(basenames)) + names
+
+    @classmethod
+    def _decode_value(cls, content, offset, length):
+
+        mtime_ns, inode, scan_options_checksum, num_subfolders, num_basenames = cls.UNPACK_HEADER(content, offset)
+        names = []
+
+        if num_subfolders or num_basenames:
+            names = content[offset + cls.HEADER_SIZE:offset + length].decode("utf-8").split("\x00")
+
+        return [mtime_ns, inode, scan_options_checksum, names[:num_subfolders], names[num_subfolders:]]
+
+
+class StringTable:
+    """Table of strings, stored as an array of string offsets followed by
+    the UTF-8 encoded strings. Strings are read by position from the
+    memory-mapped file, without loading the whole table into memory."""
+
+    __slots__ = ("_strings", "_file_handle", "_overwrite", "_num_items", "_data_offset")
+
+    FILE_SIGNATURE = b"STR+"
+    VERSION = 1
+    HEADER = Struct("!4sBQ")
+    OFFSET_SIZE = 8
+    UNPACK_OFFSET = Struct("!Q").unpack_from
+    UNPACK_OFFSETS = Struct("!QQ").unpack_from
+
+    def __init__(self, file_path, overwrite=True):
+
+        folder_path = os.path.dirname(file_path)
+
+        if not os.path.exists(folder_path):
+            os.makedirs(folder_path)
+
+        self._overwrite = overwrite
+        self._strings = None
+        self._num_items = self._data_offset = 0
+
+        if overwrite:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+            self._strings = []
+            self._file_handle = open(file_path, "wb")  # pylint: disable=consider-using-with
+            return
+
+        with open(file_path, "rb") as file_handle:
+            self._file_handle = mmap.mmap(file_handle.fileno(), length=0, access=mmap.ACCESS_READ)
+
+        try:
+            self._load_header()
+
+        except Exception:
+            self._file_handle.close()
+            raise
+
+    def _load_header(self):
+
+        content = self._file_handle
+        file_size = len(content)
+
+        if file_size < self.HEADER.size or content[:len(self.FILE_SIGNATURE)] != self.FILE_SIGNATURE:
+            raise DatabaseError("Not a string table file")
+
+        _signature, version, num_items = self.HEADER.unpack_from(content)
+
+        if version != self.VERSION:
+            raise DatabaseVersionError("Incompatible version")
+
+        data_offset = self.HEADER.size + ((num_items + 1) * self.OFFSET_SIZE)
+
+        if file_size < data_offset:
+            raise DatabaseError("Invalid string table")
+
+        data_length, = self.UNPACK_OFFSET(content, data_offset - self.OFFSET_SIZE)
+
+        if data_offset + data_length != file_size:
+            raise DatabaseError("Invalid string table")
+
+        self._num_items = num_items
+        self._data_offset = data_offset
+
+    @classmethod
+    def upgrade_file(cls, _file_path):
+        """String tables have no older format to convert from."""
+        return False
+
+    def __iter__(self):
+
+        if self._strings is not None:
+            yield from self._strings
+            return
+
+        for index in range(self._num_items):
+            yield self[index]
+
+    def __len__(self):
+
+        if self._strings is not None:
+            return len(self._strings)
+
+        return self._num_items
+
+    def __getitem__(self, index):
+
+        if index < 0:
+            index += self._num_items
+
+        if not 0 <= index < self._num_items:
+            raise IndexError("string table index out of range")
+
+        start_offset, end_offset = self.UNPACK_OFFSETS(self._file_handle, self.HEADER.size + (index * self.OFFSET_SIZE))
+        data_offset = self._data_offset
+
+        return self._file_handle[data_offset + start_offset:data_offset + end_offset].decode("utf-8")
+
+    def update(self, strings):
+        self._strings.extend(strings)
+
+    def _write_table(self):
+
+        encoded_strings = [string.encode("utf-8") for string in self._strings]
+        offsets = array("Q", [0])
+        current_offset = 0
+
+        for encoded_string in encoded_strings:
+            current_offset += len(encoded_string)
+            offsets.append(current_offset)
+
+        if sys.byteorder == "little":
+            offsets.byteswap()
+
+        self._file_handle.write(self.HEADER.pack(self.FILE_SIGNATURE, self.VERSION, len(encoded_strings)))
+        self._file_handle.write(offsets.tobytes())
+        self._file_handle.writelines(encoded_strings)
+
     def close(self):
 
         if self._overwrite:
-            os.fsync(self._file_handle)
+            self._write_table()
+            self._file_handle.flush()
+            os.fsync(self._file_handle.fileno())
 
         self._file_handle.close()
 
 
+class WordSuffixTable(StringTable):
+    """Sorted table of reversed words in the search index, used for partial
+    word searches (e.g. *ello). Words ending with the same suffix share a
+    common prefix when reversed, and are found with a binary search instead
+    of comparing the suffix with every word in the index."""
+
+    __slots__ = ()
+
+    def update(self, strings):
+        self._strings.extend(word[::-1] for word in strings)
+
+    def _write_table(self):
+        self._strings.sort()
+        super()._write_table()
+
+    def iter_words_ending_with(self, suffix):
+
+        reversed_suffix = suffix[::-1]
+        index = bisect_left(self, reversed_suffix)
+        num_items = self._num_items
+
+        while index < num_items:
+            reversed_word = self[index]
+
+            if not reversed_word.startswith(reversed_suffix):
+                break
+
+            yield reversed_word[::-1]
+            index += 1
+
+
+class PathPrefixTrie:
+    """Trie of path components, used to find the shared folders a path
+    belongs to by walking the components of the path, instead of testing
+    the path against every shared folder. Values added first take
+    precedence, matching the order shared folders are configured in."""
+
+    __slots__ = ("_root", "_num_items")
+
+    def __init__(self):
+        # Each node is a [children, values] pair
+        self._root = [{}, []]
+        self._num_items = 0
+
+    def __len__(self):
+        return self._num_items
+
+    def add(self, components, value):
+
+        node = self._root
+
+        for component in components:
+            children = node[0]
+            child_node = children.get(component)
+
+            if child_node is None:
+                child_node = children[component] = [{}, []]
+
+            node = child_node
+
+        node[1].append((self._num_items, value))
+        self._num_items += 1
+
+    def iter_prefixes(self, components):
+        """Yield (depth, value) for every value stored at a prefix of the
+        components, in the order the values were added."""
+
+        node = self._root
+        matches = [(order, 0, value) for order, value in node[1]]
+
+        for depth, component in enumerate(components, start=1):
+            node = node[0].get(component)
+
+            if node is None:
+                break
+
+            for order, value in node[1]:
+                matches.append((order, depth, value))
+
+        if len(matches) > 1:
+            matches.sort()
+
+        for _order, depth, value in matches:
+            yield depth, value
+
+
 class ScannerState:
     INITIALIZED = "initialized"
+    LOADED = "loaded"
+    COMMITTED = "committed"
     SUCCESS = "success"
 
 
@@ -243,29 +863,36 @@ class Scanner:
     databases and writing them to disk.
     """
 
-    __slots__ = ("writer", "share_groups", "share_dbs", "share_db_paths", "init",
-                 "rescan", "rebuild", "reveal_buddy_shares", "reveal_trusted_shares",
-                 "files", "streams", "mtimes", "word_index", "processed_share_names",
+    __slots__ = ("writer", "share_groups", "share_dbs", "share_db_paths", "new_share_db_paths", "init",
+                 "rescan", "rebuild",
+                 "incremental", "files", "streams", "mtimes", "folders", "word_index", "processed_share_names",
                  "processed_share_paths", "current_file_index", "current_folder_count",
-                 "lowercase_paths", "share_filters", "file_filter_regex", "folder_filter_regex")
+                 "lowercase_paths", "share_filters", "file_filter_regex", "folder_filter_regex",
+                 "scan_options_checksum",
+                 "num_workers", "worker_pool", "pending_folders", "pending_files", "changed_folder_paths",
+                 "metadata", "old_metadata", "real_path_trie")
 
-    def __init__(self, writer, share_groups, share_db_paths, init=False, rescan=True,
-                 rebuild=False, reveal_buddy_shares=False, reveal_trusted_shares=False,
-                 share_filters=None):
+    METADATA_BATCH_SIZE = 2048
+
+    def __init__(self, writer, share_groups, share_db_paths, new_share_db_paths=None, init=False, rescan=True,
+                 rebuild=False,
+                 share_filters=None, num_workers=1, incremental=False, changed_folder_paths=None):
 
         self.writer = writer
         self.share_groups = share_groups
         self.share_dbs = {}
         self.share_db_paths = share_db_paths
+        self.new_share_db_paths = new_share_db_paths
         self.init = init
         self.rescan = rescan
         self.rebuild = rebuild
-        self.reveal_buddy_shares = reveal_buddy_shares
-        self.reveal_trusted_shares = reveal_trusted_shares
         self.share_filters = share_filters
+        self.incremental = incremental
+        self.changed_folder_paths = changed_folder_paths
         self.files = {}
         self.streams = {}
         self.mtimes = {}
+        self.folders = {}
         self.lowercase_paths = defaultdict(dict)
         self.word_index = defaultdict(list)
         self.processed_share_names = set()
@@ -274,6 +901,14 @@ class Scanner:
         self.current_folder_count = 0
         self.file_filter_regex = None
         self.folder_filter_regex = None
+        self.scan_options_checksum = 0
+        self.num_workers = num_workers
+        self.worker_pool = None
+        self.pending_folders = []
+        self.pending_files = []
+        self.metadata = {}
+        self.old_metadata = None
+        self.real_path_trie = None
 
     def run(self):
 
@@ -282,15 +917,20 @@ class Scanner:
 
             if self.init:
                 try:
+                    Shares.upgrade_db_files(self.share_db_paths)
                     self.create_compressed_shares()
                     self.create_file_path_index()
 
                     # Attempt to load remaining dbs
                     Shares.load_shares(
-                        self.share_dbs, self.share_db_paths, destinations={"words", "lowercase_paths"}
+                        self.share_dbs, self.share_db_paths,
+                        destinations={"words", "word_suffixes", "lowercase_paths", "file_paths"}
                     )
                     Shares.close_shares(self.share_dbs)
 
+                    # Shares of the current generation are usable
+                    self.writer.send(ScannerState.LOADED)
+
                 except DatabaseVersionError:
                     # Database version mismatch, rebuild
                     self.rescan = self.rebuild = True
@@ -306,15 +946,11 @@ class Scanner:
                     ScannerLogMessage(_("Rebuilding shares…") if self.rebuild else _("Rescanning shares…"))
                 )
                 self.load_filters()
+                self.load_metadata_cache()
 
-                # Delete previous word index and lowercase path databases. This ensures that we don't
-                # end up with inconsistent data in case the scanner process is terminated. A rescan
-                # will also be attempted on startup due to the missing databases.
-                for destination in ("words", "lowercase_paths"):
-                    share_db_path = self.share_db_paths[destination]
-                    Shares.remove_db_file(share_db_path)
-
-                # Scan shares
+                # Scan shares. Previous databases are only read, and a new generation of databases
+                # is written to a separate folder. In case the scanner process is terminated, the
+                # previous generation remains in use.
                 for permission_level in (
                     PermissionLevel.PUBLIC,
                     PermissionLevel.BUDDY,
@@ -322,13 +958,19 @@ class Scanner:
                 ):
                     self.rescan_dirs(permission_level)
 
+                self.save_metadata_cache()
                 self.set_shares(word_index=self.word_index, lowercase_paths=self.lowercase_paths)
                 self.word_index.clear()
                 self.lowercase_paths.clear()
 
+                # All databases of the new generation are written, switch to it
+                self.share_db_paths = self.new_share_db_paths
                 self.create_compressed_shares()
                 self.create_file_path_index()
 
+                Shares.commit_share_generation(os.path.dirname(next(iter(self.share_db_paths.values()))))
+                self.writer.send(ScannerState.COMMITTED)
+
                 self.writer.send(
                     ScannerLogMessage(
                         ngettext(
@@ -357,11 +999,17 @@ class Scanner:
             )
 
         finally:
+            self.stop_worker_pool()
+            self.close_metadata_cache()
             Shares.close_shares(self.share_dbs)
             self.writer.close()
 
     def load_filters(self):
 
+        # Folders scanned with different filters can't be reused during incremental rescans,
+        # since previously filtered files are not part of their records
+        self.scan_options_checksum = crc32("\n".join(sorted(self.share_filters or ())).encode("utf-8"))
+
         if not self.share_filters:
             return
 
@@ -383,28 +1031,57 @@ class Scanner:
         if folder_filters:
             self.folder_filter_regex = re.compile("(\\\\(" + "|".join(folder_filters) + ")$)", flags=re.IGNORECASE)
 
-    def create_compressed_shares_message(self, permission_level):
-        """Create a message that will later contain a compressed list of our
-        shares."""
+    @staticmethod
+    def _init_worker():
+        """Exit worker process once the scanner process exits or is terminated."""
+
+        import multiprocessing
+
+        def _watch_parent_process():
+            multiprocessing.parent_process().join()
+            os._exit(0)  # pylint: disable=protected-access
 
-        public_streams = self.share_dbs["public_streams"]
-        buddy_streams = self.share_dbs["buddy_streams"]
-        trusted_streams = self.share_dbs["trusted_streams"]
+        Thread(target=_watch_parent_process, name="ScannerWorkerWatcher", daemon=True).start()
 
-        if permission_level == PermissionLevel.PUBLIC and not self.reveal_buddy_shares:
-            buddy_streams = None
+    def start_worker_pool(self):
+        """Start worker processes for parsing file metadata."""
 
-        if permission_level in {PermissionLevel.PUBLIC, PermissionLevel.BUDDY} and not self.reveal_trusted_shares:
-            trusted_streams = None
+        import multiprocessing
 
-        compressed_shares = SharedFileListResponse(
-            public_shares=public_streams, buddy_shares=buddy_streams, trusted_shares=trusted_streams,
-            permission_level=permission_level
+        context = multiprocessing.get_context(method="spawn")
+        self.worker_pool = context.Pool(processes=self.num_workers, initializer=self._init_worker)
+
+    def stop_worker_pool(self):
+
+        if self.worker_pool is None:
+            return
+
+        self.worker_pool.terminate()
+        self.worker_pool.join()
+        self.worker_pool = None
+
+    def create_shares_list_segment(self, share_group):
+        """Write the compressed folders of a share group to a file. Segments
+        are later joined into the shares lists sent to peers browsing our
+        shares, so folders are only compressed once for all permission
+        levels."""
+
+        file_path_encoded = encode_path(
+            Shares.get_shares_list_segment_path(os.path.dirname(self.share_db_paths["public_streams"]), share_group)
         )
-        compressed_shares.make_network_message()
-        compressed_shares.public_shares = compressed_shares.buddy_shares = compressed_shares.trusted_shares = None
 
-        self.writer.send(compressed_shares)
+        if os.path.isfile(file_path_encoded):
+            # Databases in a generation never change, reuse previous segment
+            return
+
+        temp_file_path_encoded = file_path_encoded + b".tmp"
+
+        with open(temp_file_path_encoded, "wb") as file_handle:
+            SharesListSegment.write(file_handle, self.share_dbs[f"{share_group}_streams"])
+            file_handle.flush()
+            os.fsync(file_handle.fileno())
+
+        os.replace(temp_file_path_encoded, file_path_encoded)
 
     def create_compressed_shares(self):
 
@@ -412,68 +1089,99 @@ class Scanner:
             self.share_dbs, self.share_db_paths, destinations={"public_streams", "buddy_streams", "trusted_streams"}
         )
 
-        for permission_level in (PermissionLevel.PUBLIC, PermissionLevel.BUDDY, PermissionLevel.TRUSTED):
-            self.create_compressed_shares_message(permission_level)
+        for share_group in (PermissionLevel.PUBLIC, PermissionLevel.BUDDY, PermissionLevel.TRUSTED):
+            self.create_shares_list_segment(share_group)
 
         Shares.close_shares(self.share_dbs)
 
     def create_file_path_index(self):
+        """Write the real paths of all shared files to a string table, in the
+        order of file indices in the word index. The main process reads
+        paths from the memory-mapped table when needed, instead of keeping
+        all of them in memory."""
+
+        file_path_index_path_encoded = encode_path(self.share_db_paths["file_paths"])
+
+        if os.path.isfile(file_path_index_path_encoded):
+            # Databases in a generation never change, reuse previous index
+            return
 
         Shares.load_shares(
             self.share_dbs, self.share_db_paths, destinations={"public_files", "buddy_files", "trusted_files"}
         )
 
-        file_path_index = tuple(chain(
-            self.share_dbs["public_files"],
-            self.share_dbs["buddy_files"],
-            self.share_dbs["trusted_files"]
-        ))
-        self.writer.send(file_path_index)
+        temp_file_path_encoded = file_path_index_path_encoded + b".tmp"
+        file_path_index = StringTable(temp_file_path_encoded)
 
-        Shares.close_shares(self.share_dbs)
+        try:
+            file_path_index.update(chain(
+                self.share_dbs["public_files"],
+                self.share_dbs["buddy_files"],
+                self.share_dbs["trusted_files"]
+            ))
 
-    def real2virtual(self, real_path):
+        finally:
+            file_path_index.close()
+            Shares.close_shares(self.share_dbs)
 
-        real_path = real_path.replace("/", "\\")
+        os.replace(temp_file_path_encoded, file_path_index_path_encoded)
+
+    def create_real_path_trie(self):
+
+        real_path_trie = PathPrefixTrie()
 
         for shared_folder_paths in self.share_groups:
             for virtual_name, folder_path, *_unused in shared_folder_paths:
                 folder_path = folder_path.replace("/", "\\")
 
-                if real_path == folder_path:
-                    return virtual_name
-
                 # Use rstrip to remove trailing separator from root folders
-                folder_path = folder_path.rstrip("\\") + "\\"
+                real_path_trie.add(folder_path.rstrip("\\").split("\\"), (virtual_name, folder_path))
+
+        return real_path_trie
+
+    def real2virtual(self, real_path):
+
+        if self.real_path_trie is None:
+            self.real_path_trie = self.create_real_path_trie()
+
+        real_path = real_path.replace("/", "\\")
+        components = real_path.split("\\")
+
+        for depth, (virtual_name, folder_path) in self.real_path_trie.iter_prefixes(components):
+            if real_path == folder_path:
+                return virtual_name
 
-                if real_path.startswith(folder_path):
-                    real_path_no_prefix = real_path[len(folder_path):]
-                    virtual_path = f"{virtual_name}\\{real_path_no_prefix}"
-                    return virtual_path
+            if depth < len(components):
+                real_path_no_prefix = "\\".join(components[depth:])
+                virtual_path = f"{virtual_name}\\{real_path_no_prefix}"
+                return virtual_path
 
         raise ValueError(f"Cannot find virtual path for {real_path}")
 
-    def set_shares(self, permission_level=None, files=None, streams=None, mtimes=None, word_index=None,
-                   lowercase_paths=None):
+    def set_shares(self, permission_level=None, files=None, streams=None, mtimes=None, folders=None,
+                   word_index=None, lowercase_paths=None, metadata=None):
 
         for source, destination in (
             (files, "files"),
             (streams, "streams"),
             (mtimes, "mtimes"),
+            (folders, "folders"),
             (word_index, "words"),
-            (lowercase_paths, "lowercase_paths")
+            (word_index, "word_suffixes"),
+            (lowercase_paths, "lowercase_paths"),
+            (metadata, "metadata")
         ):
             if source is None:
                 continue
 
-            if destination not in {"words", "lowercase_paths"}:
+            if destination not in {"words", "word_suffixes", "lowercase_paths", "metadata"}:
                 destination = f"{permission_level}_{destination}"
 
             share_db = None
 
             try:
-                share_db_path = self.share_db_paths[destination]
-                share_db = Shares.create_db_file(share_db_path)
+                share_db_path = self.new_share_db_paths[destination]
+                share_db = Shares.create_db_file(share_db_path, destination)
                 share_db.update(source)
 
             finally:
@@ -493,17 +1201,39 @@ class Scanner:
         else:
             shared_folder_paths = sorted(shared_public_folders)
 
+        # Databases of the previous generation can still be in use by the main process,
+        # don't remove them if loading fails
         try:
             Shares.load_shares(
                 self.share_dbs, self.share_db_paths,
-                destinations={f"{permission_level}_files", f"{permission_level}_mtimes"})
+                destinations={f"{permission_level}_files", f"{permission_level}_mtimes"}, remove_failed=False)
 
         except Exception:
             # No previous share databases, create them later
             pass
 
+        if self.incremental and not self.rebuild:
+            # Loaded separately, in order to keep the file databases open in case folder
+            # databases are missing
+            folder_dbs = {}
+
+            try:
+                Shares.load_shares(
+                    folder_dbs, self.share_db_paths,
+                    destinations={f"{permission_level}_streams", f"{permission_level}_folders"},
+                    remove_failed=False)
+
+            except Exception:
+                # No previous folder databases, scan all folders
+                pass
+
+            else:
+                self.share_dbs.update(folder_dbs)
+
         old_files = self.share_dbs.get(f"{permission_level}_files")
         old_mtimes = self.share_dbs.get(f"{permission_level}_mtimes")
+        old_streams = self.share_dbs.get(f"{permission_level}_streams")
+        old_folders = self.share_dbs.get(f"{permission_level}_folders")
 
         for virtual_name, folder_path, *_unused in shared_folder_paths:
             if virtual_name in self.processed_share_names:
@@ -514,16 +1244,17 @@ class Scanner:
                 # No duplicate folder paths
                 continue
 
-            self.scan_shared_folder(folder_path, old_mtimes, old_files)
+            self.scan_shared_folder(folder_path, old_mtimes, old_files, old_streams, old_folders)
 
             self.processed_share_names.add(virtual_name)
             self.processed_share_paths.add(folder_path)
 
         # Save data to databases
         Shares.close_shares(self.share_dbs)
-        self.set_shares(permission_level, files=self.files, streams=self.streams, mtimes=self.mtimes)
+        self.set_shares(
+            permission_level, files=self.files, streams=self.streams, mtimes=self.mtimes, folders=self.folders)
 
-        for dictionary in (self.files, self.streams, self.mtimes):
+        for dictionary in (self.files, self.streams, self.mtimes, self.folders):
             dictionary.clear()
 
         gc.collect()
@@ -550,10 +1281,119 @@ class Scanner:
 
         return False
 
-    def scan_shared_folder(self, shared_folder_path, old_mtimes, old_files):
+    def add_file(self, path, basename_escaped, file_data, virtual_folder_path_lower, virtual_folder_words):
+        """Add a file to the file index, word index and lowercase path index."""
+
+        file_index = self.current_file_index
+        basename_escaped_lower = basename_escaped.lower()
+
+        # Deduplicate words in a deterministic order
+        for k in dict.fromkeys(
+            virtual_folder_words + basename_escaped_lower.translate(TRANSLATE_PUNCTUATION).split()
+        ):
+            self.word_index[k].append(file_index)
+
+        self.files[path] = file_data
+        self.lowercase_paths[virtual_folder_path_lower][basename_escaped_lower] = file_index
+
+        self.current_file_index += 1
+
+    def load_metadata_cache(self):
+        """Load audio metadata of the previous scan. Unlike other databases,
+        the cache is also used when rebuilding shares, since entries are
+        keyed by file identity instead of path."""
+
+        try:
+            self.old_metadata = MetadataDatabase(encode_path(self.share_db_paths["metadata"]), overwrite=False)
+
+        except Exception:
+            # No previous cache
+            self.old_metadata = None
+
+    def save_metadata_cache(self):
+
+        if self.incremental and self.old_metadata is not None:
+            # Files in unchanged folders are not stat'ed during incremental rescans, keep all
+            # previous entries. Entries of removed files are pruned during the next full rescan.
+            for metadata_key in self.old_metadata:
+                if metadata_key not in self.metadata:
+                    self.metadata[metadata_key] = self.old_metadata[metadata_key]
+
+        self.set_shares(metadata=self.metadata)
+        self.metadata.clear()
+        self.close_metadata_cache()
+
+    def close_metadata_cache(self):
+
+        if self.old_metadata is not None:
+            self.old_metadata.close()
+            self.old_metadata = None
+
+    @staticmethod
+    def get_metadata_key(device, inode, size, mtime_ns):
+        return f"{device}:{inode}:{size}:{mtime_ns}"
+
+    def reuse_unchanged_folder(self, folder_path, folder_stat, virtual_folder_path, folder_paths,
+                               old_mtimes, old_files, old_streams, old_folders):
+        """Reuse previous data of a folder if its modification time and inode
+        are unchanged, i.e. no entries were added, removed or renamed. If
+        folder_stat is None, the folder is already known to be unchanged.
+        Returns False if the folder needs to be scanned."""
+
+        folder_data = old_folders.get(folder_path)
+
+        if folder_data is None:
+            return False
+
+        mtime_ns, inode, scan_options_checksum, subfolder_names, basenames = folder_data
+
+        if scan_options_checksum != self.scan_options_checksum:
+            # Share filters changed
+            return False
+
+        if folder_stat is not None and (mtime_ns != folder_stat.st_mtime_ns or inode != folder_stat.st_ino):
+            return False
+
+        file_paths = [os.path.join(folder_path, basename) for basename in basenames]
+
+        for path in file_paths:
+            if path in self.files or path not in old_files or path not in old_mtimes:
+                return False
+
+        file_list = []
+        virtual_folder_path_lower = virtual_folder_path.lower()
+        virtual_folder_words = virtual_folder_path_lower.translate(TRANSLATE_PUNCTUATION).split()
+
+        for path, basename in zip(file_paths, basenames):
+            basename_escaped = basename.replace("\\", Shares.BACKSLASH_SENTINEL)
+            file_data = old_files[path]
+            file_data[0] = f"{virtual_folder_path}\\{basename_escaped}"  # Virtual name might have changed
+
+            self.mtimes[path] = old_mtimes[path]
+            self.add_file(path, basename_escaped, file_data, virtual_folder_path_lower, virtual_folder_words)
+            file_list.append((basename_escaped, file_data))
+
+        for subfolder_name in subfolder_names:
+            folder_paths.append(os.path.join(folder_path, subfolder_name))
+
+        self.folders[folder_path] = folder_data
+        stream = old_streams.get(virtual_folder_path)
+
+        if stream is not None:
+            self.streams[virtual_folder_path] = stream
+        else:
+            # Virtual name changed, pack folder again
+            self.streams[virtual_folder_path] = None
+            self.pending_folders.append((virtual_folder_path, file_list))
+
+        return True
+
+    def scan_shared_folder(self, shared_folder_path, old_mtimes, old_files, old_streams=None, old_folders=None):
         """Scan a shared folder for all subfolders, files and their metadata."""
 
         folder_paths = [shared_folder_path]
+        reuse_folders = (not self.rebuild and old_mtimes is not None and old_files is not None
+                         and old_streams is not None and old_folders is not None)
 
         while folder_paths:
             folder_path = folder_paths.pop()
@@ -571,11 +1411,33 @@ class Scanner:
             self.writer.send(self.current_folder_count)
 
             file_list = []
+            subfolder_names = []
+            basenames = []
             virtual_folder_path_lower = virtual_folder_path.lower()
             virtual_folder_words = virtual_folder_path_lower.translate(TRANSLATE_PUNCTUATION).split()
 
             try:
-                with os.scandir(encode_path(folder_path, prefix=False)) as entries:
+                folder_path_encoded = encode_path(folder_path, prefix=False)
+                folder_stat = None
+
+                # Files in folders reported as changed can be rewritten in place, which leaves the
+                # folder's modification time unchanged. Always check their files again.
+                is_changed_folder = (self.changed_folder_paths is not None
+                                     and folder_path in self.changed_folder_paths)
+
+                if self.changed_folder_paths is None:
+                    folder_stat = os.stat(folder_path_encoded)
+
+                if reuse_folders and not is_changed_folder and self.reuse_unchanged_folder(
+                        folder_path, folder_stat, virtual_folder_path, folder_paths,
+                        old_mtimes, old_files, old_streams, old_folders):
+                    self.current_folder_count += 1
+                    continue
+
+                if folder_stat is None:
+                    folder_stat = os.stat(folder_path_encoded)
+
+                with os.scandir(folder_path_encoded) as entries:
                     for entry in entries:
                         basename = basename_escaped = entry.name.decode("utf-8", "replace")
 
@@ -593,6 +1455,7 @@ class Scanner:
                                 continue
 
                             folder_paths.append(path)
+                            subfolder_names.append(basename)
                             continue
 
                         try:
@@ -606,142 +1469,509 @@ class Scanner:
 
                             virtual_file_path = f"{virtual_folder_path}\\{basename_escaped}"
 
-                            if (self.file_filter_regex
-                                    and self.file_filter_regex.search("\\" + virtual_file_path) is not None):
-                                continue
+                            if (self.file_filter_regex
+                                    and self.file_filter_regex.search("\\" + virtual_file_path) is not None):
+                                continue
+
+                            file_stat = entry.stat()
+                            self.mtimes[path] = file_mtime = file_stat.st_mtime
+
+                            if (not self.rebuild and old_mtimes and old_files
+                                    and file_mtime == old_mtimes.get(path) and path in old_files
+                                    and file_stat.st_size == old_files[path][1]):
+                                full_path_file_data = old_files[path]
+                                full_path_file_data[0] = virtual_file_path  # Virtual name might have changed
+
+                                _virtual_file_path, _size, quality, duration = full_path_file_data
+
+                                if file_stat.st_ino and (quality is not None or duration is not None):
+                                    # Keep metadata of the file in the cache. Skipped on Windows, where
+                                    # retrieving the inode requires an additional system call.
+                                    self.metadata[self.get_metadata_key(
+                                        folder_stat.st_dev, file_stat.st_ino, file_stat.st_size,
+                                        file_stat.st_mtime_ns
+                                    )] = (quality, duration)
+                            else:
+                                full_path_file_data = [virtual_file_path, file_stat.st_size, None, None]
+
+                                # We skip metadata scanning of files without meaningful content
+                                if file_stat.st_size > 128:
+                                    metadata_key = self.get_metadata_key(
+                                        folder_stat.st_dev, file_stat.st_ino or entry.inode(), file_stat.st_size,
+                                        file_stat.st_mtime_ns
+                                    )
+                                    self.pending_files.append((path, full_path_file_data, metadata_key))
+
+                            file_list.append((basename_escaped, full_path_file_data))
+                            basenames.append(basename)
+                            self.add_file(
+                                path, basename_escaped, full_path_file_data,
+                                virtual_folder_path_lower, virtual_folder_words
+                            )
+
+                        except OSError as error:
+                            self.writer.send(
+                                ScannerLogMessage(
+                                    _("Error while scanning file %(path)s: %(error)s"),
+                                    {"path": path, "error": error}
+                                )
+                            )
+
+                # Remember folder entries for incremental rescans
+                self.folders[folder_path] = [
+                    folder_stat.st_mtime_ns, folder_stat.st_ino, self.scan_options_checksum, subfolder_names, basenames
+                ]
+
+            except OSError as error:
+                self.writer.send(
+                    ScannerLogMessage(
+                        _("Error while scanning folder %(path)s: %(error)s"),
+                        {"path": folder_path, "error": error}
+                    )
+                )
+
+            # Folder is packed once metadata of its files is available
+            self.streams[virtual_folder_path] = None
+            self.pending_folders.append((virtual_folder_path, file_list))
+            self.current_folder_count += 1
+
+            if len(self.pending_files) >= self.METADATA_BATCH_SIZE:
+                self.process_pending_files()
+
+        self.process_pending_files()
+
+    def process_pending_files(self):
+        """Parse metadata of files scanned so far, using worker processes if
+        enabled, and pack the folders containing them. Results are merged in
+        scanning order, ensuring identical databases regardless of the number
+        of workers. Files found in the metadata cache are not parsed again."""
+
+        if self.pending_files:
+            uncached_files = []
+
+            for path, file_data, metadata_key in self.pending_files:
+                metadata = self.metadata.get(metadata_key)
+
+                if metadata is None and self.old_metadata is not None:
+                    metadata = self.old_metadata.get(metadata_key)
+
+                if metadata is None:
+                    uncached_files.append((path, file_data, metadata_key))
+                    continue
+
+                self.metadata[metadata_key] = metadata
+                file_data[2], file_data[3] = metadata
+
+            file_paths = (path for path, _file_data, _metadata_key in uncached_files)
+
+            if self.worker_pool is None and self.num_workers > 1 and len(uncached_files) > 64:
+                self.start_worker_pool()
+
+            if self.worker_pool is not None:
+                results = self.worker_pool.imap(self.get_file_metadata, file_paths, chunksize=32)
+            else:
+                results = map(self.get_file_metadata, file_paths)
+
+            for (path, file_data, metadata_key), (quality, duration, error) in zip(uncached_files, results):
+                if error is not None:
+                    self.writer.send(
+                        ScannerLogMessage(
+                            _("Error while scanning metadata for file %(path)s: %(error)s"),
+                            {"path": path, "error": error}
+                        )
+                    )
+
+                elif quality is not None or duration is not None:
+                    # Only cache audio files, other files are skipped quickly when parsing
+                    self.metadata[metadata_key] = (quality, duration)
+
+                file_data[2] = quality
+                file_data[3] = duration
+
+            self.pending_files.clear()
+
+        for virtual_folder_path, file_list in self.pending_folders:
+            self.streams[virtual_folder_path] = self.get_folder_stream(
+                [[basename, *file_data[1:]] for basename, file_data in file_list]
+            )
+
+        self.pending_folders.clear()
+
+    @staticmethod
+    def get_audio_tag(file_path):
+
+        try:
+            tag = TinyTag.get(
+                encode_path(file_path), tags=False, duration=True, image=False,
+                check_magic_bytes=False
+            )
+        except UnsupportedFormatError:
+            tag = None
+
+        return tag
+
+    @staticmethod
+    def get_file_metadata(file_path):
+        """Get audio quality and duration of a file. Called in worker processes
+        when parallel scanning is enabled."""
+
+        quality = None
+        duration = None
+
+        try:
+            tag = Scanner.get_audio_tag(file_path)
+
+        except Exception as error:
+            return quality, duration, str(error)
+
+        if tag is None:
+            return quality, duration, None
+
+        bitrate = tag.bitrate
+        samplerate = tag.samplerate
+        bitdepth = tag.bitdepth
+        duration = tag.duration
+
+        if bitrate is not None:
+            bitrate = int(bitrate + 0.5)  # Round the value with minimal performance loss
+
+            if not UINT32_LIMIT > bitrate > 0:
+                bitrate = None
+
+        if samplerate is not None:
+            samplerate = int(samplerate)
+
+            if not UINT32_LIMIT > samplerate > 0:
+                samplerate = None
+
+        if bitdepth is not None:
+            bitdepth = int(bitdepth)
+
+            if not UINT32_LIMIT > bitdepth > 0:
+                bitdepth = None
+
+        if duration is not None:
+            duration = int(duration)
+
+            if not UINT32_LIMIT > duration >= 0:
+                duration = None
+
+        quality = (bitrate, int(tag.is_vbr), samplerate, bitdepth)
+        return quality, duration, None
+
+    @staticmethod
+    def get_folder_stream(file_list):
+        """Pack all files and metadata in folder."""
+
+        stream = bytearray()
+        stream += FileListMessage.pack_uint32(len(file_list))
+
+        for fileinfo in file_list:
+            stream += FileListMessage.pack_file_info(fileinfo)
+
+        return bytes(stream)
+
+
+class SharesWatcher(Thread):
+    """Thread that watches shared folders for changes, using inotify on
+    GNU/Linux, and polling of folder modification times elsewhere. Changed
+    folders are reported in batches once no new changes have occurred for a
+    while, to avoid rescanning repeatedly during bulk copies.
+    """
+
+    __slots__ = ("folder_paths", "callback", "debounce_delay", "poll_interval", "_stop_reader", "_stop_writer",
+                 "_inotify", "_inotify_fd", "_watched_folders")
+
+    # inotify event masks
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+                  | IN_ONLYDIR)
+    UNPACK_EVENT = Struct("iIII").unpack_from
+    EVENT_SIZE = 16
+
+    def __init__(self, folder_paths, callback, debounce_delay=10, poll_interval=300):
+
+        super().__init__(name="SharesWatcher", daemon=True)
+
+        self.folder_paths = folder_paths
+        self.callback = callback
+        self.debounce_delay = debounce_delay
+        self.poll_interval = poll_interval
+        self._stop_reader, self._stop_writer = os.pipe()
+        self._inotify = None
+        self._inotify_fd = None
+        self._watched_folders = {}
+
+    def stop(self):
+
+        try:
+            os.write(self._stop_writer, b"\x00")
+
+        except OSError:
+            # Watcher already exited
+            pass
+
+        os.close(self._stop_writer)
+
+    def _init_inotify(self):
+
+        if sys.platform != "linux":
+            return False
+
+        try:
+            import ctypes
+
+            self._inotify = libc = ctypes.CDLL(None, use_errno=True)
+            self._inotify_fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+
+        except (AttributeError, OSError):
+            return False
+
+        return self._inotify_fd >= 0
+
+    def _add_inotify_watches(self, folder_path):
+
+        folder_paths = [folder_path]
+
+        while folder_paths:
+            folder_path = folder_paths.pop()
+            watch_descriptor = self._inotify.inotify_add_watch(
+                self._inotify_fd, encode_path(folder_path, prefix=False), self.WATCH_MASK)
+
+            if watch_descriptor < 0:
+                import ctypes
+                error = OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+
+                if error.errno == errno.ENOSPC:
+                    # Reached the maximum number of watches (fs.inotify.max_user_watches)
+                    raise error
+
+                continue
+
+            self._watched_folders[watch_descriptor] = folder_path
+
+            try:
+                with os.scandir(encode_path(folder_path, prefix=False)) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            folder_paths.append(os.path.join(folder_path, entry.name.decode("utf-8", "replace")))
+
+            except OSError:
+                pass
+
+    def _remove_inotify_watches(self, folder_path):
+
+        folder_path_prefix = os.path.join(folder_path, "")
+
+        for watch_descriptor, watched_folder_path in list(self._watched_folders.items()):
+            if watched_folder_path == folder_path or watched_folder_path.startswith(folder_path_prefix):
+                self._inotify.inotify_rm_watch(self._inotify_fd, watch_descriptor)
+                del self._watched_folders[watch_descriptor]
+
+    def _read_inotify_events(self, changed_folder_paths):
+        """Read pending inotify events. Returns the number of events read, and
+        False if events were lost due to a full event queue."""
+
+        try:
+            data = os.read(self._inotify_fd, 65536)
+
+        except BlockingIOError:
+            return 0, True
+
+        num_events = 0
+        offset = 0
+
+        while offset < len(data):
+            watch_descriptor, mask, _cookie, name_length = self.UNPACK_EVENT(data, offset)
+            name = data[offset + self.EVENT_SIZE:offset + self.EVENT_SIZE + name_length].rstrip(b"\x00")
+            offset += self.EVENT_SIZE + name_length
+            num_events += 1
+
+            if mask & self.IN_Q_OVERFLOW:
+                return num_events, False
+
+            if mask & self.IN_IGNORED:
+                self._watched_folders.pop(watch_descriptor, None)
+                continue
+
+            folder_path = self._watched_folders.get(watch_descriptor)
+
+            if folder_path is None:
+                continue
+
+            changed_folder_paths.add(folder_path)
+
+            if not mask & self.IN_ISDIR:
+                continue
+
+            subfolder_path = os.path.join(folder_path, name.decode("utf-8", "replace"))
+
+            if mask & self.IN_MOVED_FROM:
+                self._remove_inotify_watches(subfolder_path)
 
-                            file_stat = entry.stat()
-                            self.mtimes[path] = file_mtime = file_stat.st_mtime
+            elif mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                self._add_inotify_watches(subfolder_path)
+                changed_folder_paths.add(subfolder_path)
 
-                            if (not self.rebuild and old_mtimes and old_files
-                                    and file_mtime == old_mtimes.get(path) and path in old_files):
-                                full_path_file_data = old_files[path]
-                                full_path_file_data[0] = virtual_file_path  # Virtual name might have changed
-                            else:
-                                full_path_file_data = self.get_file_info(virtual_file_path, path, file_stat)
+        return num_events, True
 
-                            basename_file_data = full_path_file_data[:]
-                            basename_file_data[0] = basename_escaped
-                            file_list.append(basename_file_data)
+    def _poll_folder_mtimes(self):
 
-                            file_index = self.current_file_index
-                            basename_escaped_lower = basename_escaped.lower()
+        folder_mtimes = {}
+        folder_paths = list(self.folder_paths)
 
-                            for k in set(
-                                virtual_folder_words + basename_escaped_lower.translate(TRANSLATE_PUNCTUATION).split()
-                            ):
-                                self.word_index[k].append(file_index)
+        while folder_paths:
+            folder_path = folder_paths.pop()
 
-                            self.files[path] = full_path_file_data
-                            self.lowercase_paths[virtual_folder_path_lower][basename_escaped_lower] = file_index
+            try:
+                folder_mtimes[folder_path] = os.stat(encode_path(folder_path, prefix=False)).st_mtime_ns
 
-                            self.current_file_index += 1
+                with os.scandir(encode_path(folder_path, prefix=False)) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            folder_paths.append(os.path.join(folder_path, entry.name.decode("utf-8", "replace")))
 
-                        except OSError as error:
-                            self.writer.send(
-                                ScannerLogMessage(
-                                    _("Error while scanning file %(path)s: %(error)s"),
-                                    {"path": path, "error": error}
-                                )
-                            )
+            except OSError:
+                pass
 
-            except OSError as error:
-                self.writer.send(
-                    ScannerLogMessage(
-                        _("Error while scanning folder %(path)s: %(error)s"),
-                        {"path": folder_path, "error": error}
-                    )
-                )
+        return folder_mtimes
 
-            self.streams[virtual_folder_path] = self.get_folder_stream(file_list)
-            self.current_folder_count += 1
+    def _wait(self, timeout):
+        """Wait for inotify events or a stop request. Returns False if the
+        watcher was stopped."""
 
-    def get_audio_tag(self, file_path):
+        read_fds = [self._stop_reader]
 
-        try:
-            tag = TinyTag.get(
-                encode_path(file_path), tags=False, duration=True, image=False,
-                check_magic_bytes=False
-            )
-        except UnsupportedFormatError:
-            tag = None
+        if self._inotify_fd is not None:
+            read_fds.append(self._inotify_fd)
 
-        return tag
+        readable, _writable, _exceptional = select.select(read_fds, [], [], timeout)
+        return self._stop_reader not in readable
 
-    def get_file_info(self, virtual_file_path, file_path, file_stat):
-        """Get file metadata."""
+    def _run_inotify(self):
 
-        tag = None
-        quality = None
-        duration = None
-        size = file_stat.st_size
+        changed_folder_paths = set()
+        has_changes = False
+        is_complete = True
 
-        # We skip metadata scanning of files without meaningful content
-        if size > 128:
-            try:
-                tag = self.get_audio_tag(file_path)
+        try:
+            for folder_path in self.folder_paths:
+                self._add_inotify_watches(folder_path)
 
-            except Exception as error:
-                self.writer.send(
-                    ScannerLogMessage(
-                        _("Error while scanning metadata for file %(path)s: %(error)s"),
-                        {"path": file_path, "error": error}
-                    )
-                )
+        except OSError as error:
+            log.add(_("Unable to watch shared folders for changes: %s"), error)
+            return
 
-        if tag is not None:
-            bitrate = tag.bitrate
-            samplerate = tag.samplerate
-            bitdepth = tag.bitdepth
-            duration = tag.duration
+        while self._wait(timeout=(self.debounce_delay if has_changes else None)):
+            num_events, is_complete_batch = self._read_inotify_events(changed_folder_paths)
 
-            if bitrate is not None:
-                bitrate = int(bitrate + 0.5)  # Round the value with minimal performance loss
+            if not is_complete_batch:
+                # Event queue overflowed, all folders need to be checked
+                is_complete = False
 
-                if not UINT32_LIMIT > bitrate > 0:
-                    bitrate = None
+            if num_events:
+                # Wait until no new changes occur
+                has_changes = True
+                continue
 
-            if samplerate is not None:
-                samplerate = int(samplerate)
+            if has_changes and (changed_folder_paths or not is_complete):
+                self.callback(changed_folder_paths if is_complete else None)
 
-                if not UINT32_LIMIT > samplerate > 0:
-                    samplerate = None
+            if has_changes:
+                changed_folder_paths = set()
+                has_changes = False
+                is_complete = True
 
-            if bitdepth is not None:
-                bitdepth = int(bitdepth)
+    def _run_polling(self):
 
-                if not UINT32_LIMIT > bitdepth > 0:
-                    bitdepth = None
+        folder_mtimes = self._poll_folder_mtimes()
 
-            if duration is not None:
-                duration = int(duration)
+        while self._wait(timeout=self.poll_interval):
+            new_folder_mtimes = self._poll_folder_mtimes()
+            changed_folder_paths = {
+                folder_path for folder_path, mtime in new_folder_mtimes.items()
+                if folder_mtimes.get(folder_path) != mtime
+            }
 
-                if not UINT32_LIMIT > duration >= 0:
-                    duration = None
+            for folder_path in folder_mtimes:
+                if folder_path not in new_folder_mtimes:
+                    # Removed folder, parent folder has changed too
+                    changed_folder_paths.add(os.path.dirname(folder_path))
 
-            quality = (bitrate, int(tag.is_vbr), samplerate, bitdepth)
+            folder_mtimes = new_folder_mtimes
 
-        return [virtual_file_path, size, quality, duration]
+            if changed_folder_paths:
+                self.callback(changed_folder_paths)
 
-    @staticmethod
-    def get_folder_stream(file_list):
-        """Pack all files and metadata in folder."""
+    def run(self):
 
-        stream = bytearray()
-        stream += FileListMessage.pack_uint32(len(file_list))
+        try:
+            if self._init_inotify():
+                self._run_inotify()
+            else:
+                self._run_polling()
 
-        for fileinfo in file_list:
-            stream += FileListMessage.pack_file_info(fileinfo)
+        finally:
+            if self._inotify_fd is not None:
+                os.close(self._inotify_fd)
 
-        return bytes(stream)
+            os.close(self._stop_reader)
 
 
 class Shares:
     __slots__ = ("share_dbs", "initialized", "compressed_shares", "share_db_paths",
-                 "file_path_index", "_scanner_process", "_scanner_reader", "_rescan_daily_timer_id",
-                 "_requested_share_times")
+                 "_scanner_process", "_scanner_reader", "_rescan_daily_timer_id",
+                 "_requested_share_times", "_watcher", "_pending_changed_folder_paths",
+                 "_share_generations_folder_path", "_share_generation", "_scanned_shares",
+                 "_virtual_path_trie", "_virtual_path_trie_share_groups", "_share_dbs_lock",
+                 "_share_dbs_num_readers", "_retired_share_dbs")
 
     BACKSLASH_SENTINEL = "@@BACKSLASH@@"
+    DATABASE_CLASSES = {
+        "words": WordDatabase,
+        "lowercase_paths": LowercasePathDatabase,
+        "files": FileDatabase,
+        "mtimes": MtimeDatabase,
+        "streams": Database,
+        "folders": FolderDatabase,
+        "metadata": MetadataDatabase,
+        "word_suffixes": WordSuffixTable,
+        "file_paths": StringTable
+    }
+    DB_FILE_NAMES = {
+        "words": "words.dbn",
+        "word_suffixes": "wordsuffixes.dbn",
+        "lowercase_paths": "lowercasepaths.dbn",
+        "public_files": "publicfiles.dbn",
+        "public_mtimes": "publicmtimes.dbn",
+        "public_streams": "publicstreams.dbn",
+        "public_folders": "publicfolders.dbn",
+        "buddy_files": "buddyfiles.dbn",
+        "buddy_mtimes": "buddymtimes.dbn",
+        "buddy_streams": "buddystreams.dbn",
+        "buddy_folders": "buddyfolders.dbn",
+        "trusted_files": "trustedfiles.dbn",
+        "trusted_mtimes": "trustedmtimes.dbn",
+        "trusted_streams": "trustedstreams.dbn",
+        "trusted_folders": "trustedfolders.dbn",
+        "metadata": "metadata.dbn",
+        "file_paths": "filepaths.dbn"
+    }
+    LOADED_DB_DESTINATIONS = {
+        "words", "word_suffixes", "lowercase_paths", "public_files", "public_streams", "buddy_files",
+        "buddy_streams", "trusted_files", "trusted_streams", "file_paths"
+    }
+    CURRENT_GENERATION_FILE_NAME = "current"
+    NO_GENERATION = "0"
 
     def __init__(self):
 
@@ -753,25 +1983,22 @@ class Shares:
             PermissionLevel.TRUSTED: SharedFileListResponse(permission_level=PermissionLevel.TRUSTED),
             PermissionLevel.BANNED: SharedFileListResponse(permission_level=PermissionLevel.BANNED)
         }
-        self.share_db_paths = {
-            "words": os.path.join(config.data_folder_path, "words.dbn"),
-            "lowercase_paths": os.path.join(config.data_folder_path, "lowercasepaths.dbn"),
-            "public_files": os.path.join(config.data_folder_path, "publicfiles.dbn"),
-            "public_mtimes": os.path.join(config.data_folder_path, "publicmtimes.dbn"),
-            "public_streams": os.path.join(config.data_folder_path, "publicstreams.dbn"),
-            "buddy_files": os.path.join(config.data_folder_path, "buddyfiles.dbn"),
-            "buddy_mtimes": os.path.join(config.data_folder_path, "buddymtimes.dbn"),
-            "buddy_streams": os.path.join(config.data_folder_path, "buddystreams.dbn"),
-            "trusted_files": os.path.join(config.data_folder_path, "trustedfiles.dbn"),
-            "trusted_mtimes": os.path.join(config.data_folder_path, "trustedmtimes.dbn"),
-            "trusted_streams": os.path.join(config.data_folder_path, "trustedstreams.dbn")
-        }
-        self.file_path_index = ()
+        self._share_generations_folder_path = os.path.join(config.data_folder_path, "shares")
+        self._share_generation = self._read_share_generation()
+        self.share_db_paths = self.get_share_db_paths(self._get_share_generation_folder_path(self._share_generation))
 
         self._scanner_process = None
         self._scanner_reader = None
         self._rescan_daily_timer_id = None
         self._requested_share_times = {}
+        self._watcher = None
+        self._pending_changed_folder_paths = set()
+        self._scanned_shares = None
+        self._virtual_path_trie = None
+        self._virtual_path_trie_share_groups = None
+        self._share_dbs_lock = Lock()
+        self._share_dbs_num_readers = {}
+        self._retired_share_dbs = []
 
         for event_name, callback in (
             ("folder-contents-request", self._folder_contents_request),
@@ -798,8 +2025,10 @@ class Shares:
 
     def _quit(self):
 
+        self.stop_watcher()
         self.stop_scanner()
-        self.close_shares(self.share_dbs)
+        self._retire_share_dbs(self._share_generation, self.share_dbs)
+        self.share_dbs = {}
         self.initialized = False
 
     def _server_login(self, msg):
@@ -812,9 +2041,148 @@ class Shares:
     # Shares-related Actions #
 
     @classmethod
-    def create_db_file(cls, db_path):
+    def get_database_class(cls, destination):
+
+        for permission_level in (PermissionLevel.PUBLIC, PermissionLevel.BUDDY, PermissionLevel.TRUSTED):
+            destination = destination.removeprefix(f"{permission_level}_")
+
+        return cls.DATABASE_CLASSES[destination]
+
+    @classmethod
+    def create_db_file(cls, db_path, destination):
         cls.remove_db_file(db_path)
-        return Database(encode_path(db_path))
+        return cls.get_database_class(destination)(encode_path(db_path))
+
+    @staticmethod
+    def get_shares_list_segment_path(folder_path, share_group):
+        return os.path.join(folder_path, f"{share_group}shares.seg")
+
+    @classmethod
+    def get_share_db_paths(cls, folder_path):
+        return {
+            destination: os.path.join(folder_path, file_name) for destination, file_name in cls.DB_FILE_NAMES.items()
+        }
+
+    def _get_share_generation_folder_path(self, share_generation):
+        return os.path.join(self._share_generations_folder_path, share_generation)
+
+    def _read_share_generation(self):
+        """Returns the name of the current generation of share databases."""
+
+        file_path = os.path.join(self._share_generations_folder_path, self.CURRENT_GENERATION_FILE_NAME)
+
+        try:
+            with open(encode_path(file_path), "rb") as file_handle:
+                share_generation = file_handle.read().decode("ascii", "replace").strip()
+
+        except OSError:
+            share_generation = None
+
+        if not share_generation or not share_generation.isdigit():
+            return self.NO_GENERATION
+
+        return share_generation
+
+    def _create_share_generation(self):
+        """Returns the name of a new, unused generation of share databases."""
+
+        generation_numbers = [int(self._share_generation)]
+
+        try:
+            for folder_name in os.listdir(encode_path(self._share_generations_folder_path)):
+                if folder_name.isdigit():
+                    generation_numbers.append(int(folder_name))
+
+        except OSError:
+            # No generations yet
+            pass
+
+        return str(max(generation_numbers) + 1)
+
+    @staticmethod
+    def _sync_folder(folder_path):
+
+        if sys.platform == "win32":
+            # Folders cannot be opened for syncing on Windows
+            return
+
+        folder_fd = os.open(encode_path(folder_path), os.O_RDONLY)
+
+        try:
+            os.fsync(folder_fd)
+        finally:
+            os.close(folder_fd)
+
+    @classmethod
+    def commit_share_generation(cls, generation_folder_path):
+        """Atomically make a generation of share databases the current one,
+        after all of its databases are written to disk."""
+
+        generations_folder_path, share_generation = os.path.split(generation_folder_path)
+        file_path = os.path.join(generations_folder_path, cls.CURRENT_GENERATION_FILE_NAME)
+        temp_file_path = f"{file_path}.tmp"
+
+        cls._sync_folder(generation_folder_path)
+
+        with open(encode_path(temp_file_path), "wb") as file_handle:
+            file_handle.write(share_generation.encode("ascii"))
+            file_handle.flush()
+            os.fsync(file_handle.fileno())
+
+        os.replace(encode_path(temp_file_path), encode_path(file_path))
+        cls._sync_folder(generations_folder_path)
+
+    def _remove_old_share_generations(self):
+        """Remove generations of share databases no longer in use, as well as
+        incomplete ones left behind by an interrupted scan."""
+
+        if self.rescanning:
+            return
+
+        generations_folder_path_encoded = encode_path(self._share_generations_folder_path)
+        used_generations_encoded = {self._share_generation.encode("ascii")}
+
+        with self._share_dbs_lock:
+            # Databases of previous generations can still be read by worker threads
+            for share_generation, _share_dbs in self._retired_share_dbs:
+                used_generations_encoded.add(share_generation.encode("ascii"))
+
+        try:
+            folder_names = os.listdir(generations_folder_path_encoded)
+
+        except OSError:
+            # No generations yet
+            return
+
+        for folder_name in folder_names:
+            if not folder_name.isdigit() or folder_name in used_generations_encoded:
+                continue
+
+            folder_path_encoded = os.path.join(generations_folder_path_encoded, folder_name)
+
+            try:
+                import shutil
+                shutil.rmtree(folder_path_encoded)
+
+            except OSError as error:
+                log.add_debug("Failed to remove old share databases %s: %s", (folder_path_encoded, error))
+
+    @classmethod
+    def upgrade_db_files(cls, share_db_paths):
+        """Convert share databases from the legacy pickle-based format."""
+
+        for destination, db_path in share_db_paths.items():
+            db_path_encoded = encode_path(db_path)
+
+            if not os.path.isfile(db_path_encoded):
+                continue
+
+            try:
+                cls.get_database_class(destination).upgrade_file(db_path_encoded)
+
+            except Exception:
+                # Unable to convert database, rescan
+                cls.remove_db_file(db_path)
 
     @staticmethod
     def remove_db_file(db_path):
@@ -828,6 +2196,12 @@ class Shares:
             import shutil
             shutil.rmtree(db_path_encoded)
 
+    @property
+    def file_path_index(self):
+        """Real paths of shared files, indexed by the file indices in the
+        word index."""
+        return self.share_dbs.get("file_paths", ())
+
     def get_lowercase_path_index(self, virtual_path):
 
         virtual_folder_path, _separator, basename = virtual_path.rpartition("\\")
@@ -839,6 +2213,24 @@ class Shares:
 
         return index
 
+    def get_virtual_path_trie(self):
+        """Return a trie of virtual share names, rebuilt whenever the shared
+        folders in the config change."""
+
+        share_groups = self.get_shared_folders()
+
+        if self._virtual_path_trie is None or share_groups != self._virtual_path_trie_share_groups:
+            virtual_path_trie = PathPrefixTrie()
+
+            for shares in share_groups:
+                for virtual_name, folder_path, *_unused in shares:
+                    virtual_path_trie.add(virtual_name.split("\\"), (virtual_name, folder_path))
+
+            self._virtual_path_trie = virtual_path_trie
+            self._virtual_path_trie_share_groups = tuple(shares[:] for shares in share_groups)
+
+        return self._virtual_path_trie
+
     def virtual2real(self, virtual_path, revert_backslash=False, is_lowercase_path=False):
 
         if is_lowercase_path:
@@ -848,21 +2240,20 @@ class Shares:
                 # Mangled path from a Soulseek NS client (all lowercase)
                 return self.file_path_index[real_path_index]
 
-        share_groups = self.get_shared_folders()
+        components = virtual_path.split("\\")
 
-        for shares in share_groups:
-            for virtual_name, folder_path, *_unused in shares:
-                if virtual_path == virtual_name:
-                    return folder_path
+        for depth, (virtual_name, folder_path) in self.get_virtual_path_trie().iter_prefixes(components):
+            if virtual_path == virtual_name:
+                return folder_path
 
-                if virtual_path.startswith(virtual_name + "\\"):
-                    real_path = folder_path.rstrip(os.sep) + virtual_path[len(virtual_name):].replace("\\", os.sep)
+            if depth < len(components):
+                real_path = folder_path.rstrip(os.sep) + virtual_path[len(virtual_name):].replace("\\", os.sep)
 
-                    if revert_backslash and self.BACKSLASH_SENTINEL in virtual_path:
-                        # Real path contains non-separator backslashes. Revert backslash substitutions.
-                        real_path = real_path.replace(self.BACKSLASH_SENTINEL, "\\")
+                if revert_backslash and self.BACKSLASH_SENTINEL in virtual_path:
+                    # Real path contains non-separator backslashes. Revert backslash substitutions.
+                    real_path = real_path.replace(self.BACKSLASH_SENTINEL, "\\")
 
-                    return real_path
+                return real_path
 
         return "__INVALID_SHARE__" + virtual_path
 
@@ -905,8 +2296,41 @@ class Shares:
             except OSError as error:
                 log.add_debug("Failed to remove old share database %s: %s", (file_path, error))
 
+        # Move share databases stored directly in the data folder to a generation folder
+        if self._share_generation == self.NO_GENERATION:
+            self._move_legacy_db_files()
+
+    def _move_legacy_db_files(self):
+
+        legacy_db_paths = {
+            destination: db_path for destination, db_path in self.get_share_db_paths(config.data_folder_path).items()
+            if os.path.isfile(encode_path(db_path))
+        }
+
+        if not legacy_db_paths:
+            return
+
+        share_generation = self._create_share_generation()
+        generation_folder_path = self._get_share_generation_folder_path(share_generation)
+        share_db_paths = self.get_share_db_paths(generation_folder_path)
+
+        try:
+            os.makedirs(encode_path(generation_folder_path), exist_ok=True)
+
+            for destination, legacy_db_path in legacy_db_paths.items():
+                os.replace(encode_path(legacy_db_path), encode_path(share_db_paths[destination]))
+
+            self.commit_share_generation(generation_folder_path)
+
+        except OSError as error:
+            log.add_debug("Failed to move old share databases to %s: %s", (generation_folder_path, error))
+            return
+
+        self._share_generation = share_generation
+        self.share_db_paths = share_db_paths
+
     @classmethod
-    def load_shares(cls, share_dbs, share_db_paths, destinations=None):
+    def load_shares(cls, share_dbs, share_db_paths, destinations=None, remove_failed=True):
 
         exception = None
 
@@ -915,11 +2339,14 @@ class Shares:
                 continue
 
             try:
-                share_dbs[destination] = Database(encode_path(db_path), overwrite=False)
+                database_class = cls.get_database_class(destination)
+                share_dbs[destination] = database_class(encode_path(db_path), overwrite=False)
 
             except Exception as error:
                 exception = error
-                cls.remove_db_file(db_path)
+
+                if remove_failed:
+                    cls.remove_db_file(db_path)
 
         if exception:
             cls.close_shares(share_dbs)
@@ -1089,6 +2516,67 @@ class Shares:
             if database is not None:
                 database.close()
 
+    def acquire_share_dbs(self):
+        """Returns the current share databases, and keeps them open until
+        release_share_dbs() is called. Used by worker threads that read the
+        databases while a rescan can switch to a new generation."""
+
+        with self._share_dbs_lock:
+            share_dbs = self.share_dbs
+            share_dbs_id = id(share_dbs)
+            self._share_dbs_num_readers[share_dbs_id] = self._share_dbs_num_readers.get(share_dbs_id, 0) + 1
+
+        return share_dbs
+
+    def release_share_dbs(self, share_dbs):
+        """Called once a worker thread no longer reads share databases
+        returned by acquire_share_dbs()."""
+
+        share_dbs_id = id(share_dbs)
+
+        with self._share_dbs_lock:
+            num_readers = self._share_dbs_num_readers[share_dbs_id] - 1
+
+            if num_readers:
+                self._share_dbs_num_readers[share_dbs_id] = num_readers
+                return
+
+            del self._share_dbs_num_readers[share_dbs_id]
+            is_retired = any(
+                retired_share_dbs is share_dbs for _share_generation, retired_share_dbs in self._retired_share_dbs)
+
+        if is_retired:
+            events.invoke_main_thread(self._close_retired_share_dbs)
+
+    def _retire_share_dbs(self, share_generation, share_dbs):
+        """Close share databases of a previous generation, once no worker
+        thread reads them anymore."""
+
+        with self._share_dbs_lock:
+            self._retired_share_dbs.append((share_generation, share_dbs))
+
+        self._close_retired_share_dbs()
+
+    def _close_retired_share_dbs(self):
+
+        unused_share_dbs = []
+
+        with self._share_dbs_lock:
+            for retired_item in self._retired_share_dbs.copy():
+                _share_generation, share_dbs = retired_item
+
+                if id(share_dbs) not in self._share_dbs_num_readers:
+                    self._retired_share_dbs.remove(retired_item)
+                    unused_share_dbs.append(share_dbs)
+
+        if not unused_share_dbs:
+            return
+
+        for share_dbs in unused_share_dbs:
+            self.close_shares(share_dbs)
+
+        self._remove_old_share_generations()
+
     def send_num_shared_folders_files(self):
         """Send number of publicly shared files to the server."""
 
@@ -1132,9 +2620,11 @@ class Shares:
     def rebuild_shares(self, use_thread=True):
         return self.rescan_shares(rebuild=True, use_thread=use_thread)
 
-    def rescan_shares(self, init=False, rescan=True, rebuild=False, use_thread=True, force=False):
+    def rescan_shares(self, init=False, rescan=True, rebuild=False, use_thread=True, force=False,
+                      changed_folder_paths=None):
 
         self.stop_scanner()
+        self._pending_changed_folder_paths = set()
 
         if rescan and not force:
             # Verify all shares are mounted before allowing destructive rescan
@@ -1152,14 +2642,18 @@ class Shares:
         # Hand over database control to the scanner process
         share_groups = self.get_shared_folders()
         self._scanner_process, self._scanner_reader, writer = self._build_scanner_process(
-            share_groups, init, rescan, rebuild)
-
-        self.close_shares(self.share_dbs)
-        self.file_path_index = ()
+            share_groups, init, rescan, rebuild, changed_folder_paths)
 
+        # Shares of the current generation are served until the scanner is done
         events.emit("shares-scanning")
         self._scanner_process.start()
 
+        # A scanner process with worker processes is not daemonic, and multiprocessing
+        # waits for it to finish when the interpreter exits. Terminate it first, by
+        # registering our exit handler after the one multiprocessing registers on start.
+        atexit.unregister(self.stop_scanner)
+        atexit.register(self.stop_scanner)
+
         # Ensure only the scanner process owns a handle, in order to promptly exit the
         # message reader thread after the scanner process is terminated
         writer.close()
@@ -1169,7 +2663,7 @@ class Shares:
                 target=self._process_scanner, args=(
                     self._scanner_process, self._scanner_reader, events.emit_main_thread
                 ),
-                name="ProcessShareScanner"
+                name="ProcessShareScanner", daemon=True
             ).start()
             return None
 
@@ -1177,6 +2671,10 @@ class Shares:
         self._scanner_process = None
         self._scanner_reader = None
 
+        scanned_shares = self._scanned_shares
+        self._scanned_shares = None
+        self._apply_scanned_shares(scanned_shares, load_dbs=False)
+
         return successful
 
     @property
@@ -1230,24 +2728,85 @@ class Shares:
         self._rescan_daily_timer_id = events.schedule_at(
             timestamp=target_time.timestamp(), callback=self.rescan_shares)
 
-    def _build_scanner_process(self, share_groups=None, init=False, rescan=True, rebuild=False):
+    def start_watcher(self):
+
+        folder_paths = sorted({
+            folder_path for shares in self.get_shared_folders() for _virtual_name, folder_path, *_unused in shares
+        })
+
+        if self._watcher is not None:
+            if self._watcher.folder_paths == folder_paths:
+                return
+
+            self.stop_watcher()
+
+        if not config.sections["transfers"]["watch_shares"] or not folder_paths:
+            return
+
+        self._watcher = SharesWatcher(
+            folder_paths, callback=lambda changed_folder_paths: events.invoke_main_thread(
+                self._shares_changed, changed_folder_paths)
+        )
+        self._watcher.start()
+
+    def stop_watcher(self):
+
+        if self._watcher is None:
+            return
+
+        self._watcher.stop()
+        self._watcher = None
+
+    def _shares_changed(self, changed_folder_paths):
+        """Called when the shares watcher detects changes in shared folders.
+        changed_folder_paths is None if all folders need to be checked."""
+
+        if self._watcher is None:
+            return
+
+        if self.rescanning:
+            # Rescan again once the current scan finishes
+            if changed_folder_paths is None or self._pending_changed_folder_paths is None:
+                self._pending_changed_folder_paths = None
+            else:
+                self._pending_changed_folder_paths.update(changed_folder_paths)
+            return
+
+        self.rescan_shares(changed_folder_paths=changed_folder_paths)
+
+    def _build_scanner_process(self, share_groups=None, init=False, rescan=True, rebuild=False,
+                               changed_folder_paths=None):
 
         import multiprocessing
 
         context = multiprocessing.get_context(method="spawn")
         reader, writer = context.Pipe(duplex=False)
+        num_workers = config.sections["transfers"]["share_scan_workers"]
+
+        if num_workers <= 0:
+            # Automatic, one worker per CPU core
+            num_workers = os.cpu_count() or 1
+
+        new_share_db_paths = self.get_share_db_paths(
+            self._get_share_generation_folder_path(self._create_share_generation()))
+
         scanner_obj = Scanner(
             writer,
             share_groups,
             self.share_db_paths,
+            new_share_db_paths,
             init,
             rescan,
             rebuild,
-            reveal_buddy_shares=config.sections["transfers"]["reveal_buddy_shares"],
-            reveal_trusted_shares=config.sections["transfers"]["reveal_trusted_shares"],
-            share_filters=config.sections["transfers"]["share_filters"]
+            share_filters=config.sections["transfers"]["share_filters"],
+            num_workers=num_workers,
+            incremental=(config.sections["transfers"]["incremental_rescan"] or changed_folder_paths is not None),
+            changed_folder_paths=changed_folder_paths
         )
-        scanner = context.Process(target=scanner_obj.run, daemon=True)
+
+        # Daemonic processes are not allowed to start worker processes. The scanner
+        # process is still terminated when quitting, or when the interpreter exits.
+        scanner = context.Process(target=scanner_obj.run, daemon=(num_workers <= 1))
         return scanner, reader, writer
 
     def _process_scanner(self, process, reader, emit_event=None):
@@ -1255,6 +2814,8 @@ class Shares:
         successful = False
         current_folder_count = None
         last_count_update = time.monotonic()
+        is_generation_committed = False
+        initial_shares = None
 
         while True:
             try:
@@ -1270,15 +2831,19 @@ class Shares:
             elif isinstance(item, ScannerLogMessage):
                 log.add(item.msg, item.msg_args)
 
-            elif isinstance(item, tuple):
-                self.file_path_index = item
+            elif item == ScannerState.LOADED:
+                # Shares of the current generation
+                initial_shares = False
 
-            elif isinstance(item, SharedFileListResponse):
-                self.compressed_shares[item.permission_level] = item
+                if emit_event is not None:
+                    events.invoke_main_thread(self._current_shares_loaded, process)
 
             elif item == ScannerState.INITIALIZED:
                 self.initialized = True
 
+            elif item == ScannerState.COMMITTED:
+                is_generation_committed = True
+
             elif item == ScannerState.SUCCESS:
                 successful = True
 
@@ -1297,11 +2862,27 @@ class Shares:
             # Already closed in the main thread
             pass
 
+        if successful and is_generation_committed:
+            # Shares of the new generation
+            self._scanned_shares = True
+        else:
+            self._scanned_shares = initial_shares
+
         if emit_event is not None:
             emit_event("shares-ready", successful)
 
         return successful
 
+    def _current_shares_loaded(self, process):
+        """Called once shares of the current generation are usable, in order
+        to serve them while the scanner is still rescanning."""
+
+        if self._scanner_process is not process:
+            # Scanner was stopped or restarted
+            return
+
+        self._apply_scanned_shares(False)
+
     def _shares_ready(self, successful):
 
         if self._scanner_process is not None and self._scanner_process.is_alive():
@@ -1311,25 +2892,108 @@ class Shares:
         self._scanner_process = None
         self._scanner_reader = None
 
-        # Scanning done, load shares in the main process again
-        if successful:
-            try:
-                self.load_shares(
-                    self.share_dbs, self.share_db_paths, destinations={
-                        "words", "lowercase_paths", "public_files", "public_streams", "buddy_files",
-                        "buddy_streams", "trusted_files", "trusted_streams"
-                    })
+        # Scanning done, switch to the new generation of shares
+        scanned_shares = self._scanned_shares
+        self._scanned_shares = None
 
-            except Exception:
-                successful = False
+        if not self._apply_scanned_shares(scanned_shares):
+            successful = False
 
         self.start_rescan_daily_timer()
+        pending_changed_folder_paths = self._pending_changed_folder_paths
+        self._pending_changed_folder_paths = set()
 
         if not successful:
-            self.file_path_index = ()
             return
 
         self.send_num_shared_folders_files()
+        self.start_watcher()
+
+        if pending_changed_folder_paths is None or pending_changed_folder_paths:
+            self._shares_changed(pending_changed_folder_paths)
+
+    @classmethod
+    def _load_shares_list_segment(cls, generation_folder_path, share_group):
+        """Map a shares list segment file written by the scanner, in order to
+        send it to peers without keeping it in memory."""
+
+        file_path = cls.get_shares_list_segment_path(generation_folder_path, share_group)
+
+        try:
+            with open(encode_path(file_path), "rb") as file_handle:
+                return SharesListSegment.from_buffer(
+                    mmap.mmap(file_handle.fileno(), length=0, access=mmap.ACCESS_READ))
+
+        except (OSError, ValueError) as error:
+            log.add_debug("Failed to load shares list segment %s: %s", (file_path, error))
+
+        return None
+
+    def _load_compressed_shares(self, generation_folder_path):
+
+        public_segment, buddy_segment, trusted_segment = (
+            self._load_shares_list_segment(generation_folder_path, share_group)
+            for share_group in (PermissionLevel.PUBLIC, PermissionLevel.BUDDY, PermissionLevel.TRUSTED)
+        )
+
+        for permission_level in (PermissionLevel.PUBLIC, PermissionLevel.BUDDY, PermissionLevel.TRUSTED):
+            buddy_shares = buddy_segment
+            trusted_shares = trusted_segment
+
+            if permission_level == PermissionLevel.PUBLIC and not config.sections["transfers"]["reveal_buddy_shares"]:
+                buddy_shares = None
+
+            if (permission_level in {PermissionLevel.PUBLIC, PermissionLevel.BUDDY}
+                    and not config.sections["transfers"]["reveal_trusted_shares"]):
+                trusted_shares = None
+
+            self.compressed_shares[permission_level] = SharedFileListResponse(
+                public_shares=public_segment, buddy_shares=buddy_shares, trusted_shares=trusted_shares,
+                permission_level=permission_level
+            )
+
+    def _apply_scanned_shares(self, is_new_generation, load_dbs=True):
+        """Switch to the generation of share databases and compressed shares
+        reported by the scanner, and close databases of the previous
+        generation. Returns False if no usable shares were found, i.e.
+        is_new_generation is None."""
+
+        if is_new_generation is None:
+            return False
+
+        if not is_new_generation and load_dbs and self.share_dbs:
+            # Shares of the current generation are already served
+            return True
+
+        share_generation = self._read_share_generation() if is_new_generation else self._share_generation
+        generation_folder_path = self._get_share_generation_folder_path(share_generation)
+        share_db_paths = self.get_share_db_paths(generation_folder_path)
+        share_dbs = {}
+
+        if load_dbs:
+            try:
+                self.load_shares(share_dbs, share_db_paths, destinations=self.LOADED_DB_DESTINATIONS)
+
+            except Exception:
+                return False
+
+        old_share_generation = self._share_generation
+        old_share_dbs = self.share_dbs
+
+        with self._share_dbs_lock:
+            self.share_dbs = share_dbs
+
+        self.share_db_paths = share_db_paths
+        self._share_generation = share_generation
+
+        # Segments of the previous generation are closed once no longer referenced by
+        # messages waiting to be sent
+        self._load_compressed_shares(generation_folder_path)
+
+        # Databases of the previous generation are closed and removed once search
+        # workers no longer read them
+        self._retire_share_dbs(old_share_generation, old_share_dbs)
+        return True
 
     # Network Messages #
 
@@ -18,6 +18,7 @@ from random import randint
 from socket import inet_aton
 from socket import inet_ntoa
 from struct import Struct
+from struct import error as StructError
 
 from pynicotine.utils import UINT32_LIMIT
 from pynicotine.utils import human_length
@@ -40,6 +41,7 @@ UINT32_PACK = Struct("<I").pack
 UINT64_PACK = Struct("<Q").pack
 
 ZLIB_COMPRESSION_LEVEL = 4
+ADLER32_BASE = 65521
 
 
 def initial_token():
@@ -60,6 +62,32 @@ def increment_token(token):
     return token
 
 
+def adler32_combine(checksum1, checksum2, length2):
+    """Return the Adler-32 checksum of two concatenated pieces of data, from
+    the checksums of each piece and the length of the second piece. Ported
+    from adler32_combine() in zlib, which Python does not expose."""
+
+    remainder = length2 % ADLER32_BASE
+    sum1 = checksum1 & 0xffff
+    sum2 = (remainder * sum1) % ADLER32_BASE
+    sum1 += (checksum2 & 0xffff) + ADLER32_BASE - 1
+    sum2 += ((checksum1 >> 16) & 0xffff) + ((checksum2 >> 16) & 0xffff) + ADLER32_BASE - remainder
+
+    if sum1 >= ADLER32_BASE:
+        sum1 -= ADLER32_BASE
+
+    if sum1 >= ADLER32_BASE:
+        sum1 -= ADLER32_BASE
+
+    if sum2 >= (ADLER32_BASE << 1):
+        sum2 -= (ADLER32_BASE << 1)
+
+    if sum2 >= ADLER32_BASE:
+        sum2 -= ADLER32_BASE
+
+    return sum1 | (sum2 << 16)
+
+
 # Constants #
 
 
@@ -3268,6 +3296,82 @@ class SharedFileListRequest(PeerMessage):
         pass
 
 
+class SharesListSegment:
+    """Folders of one share group in a shares list, compressed as a raw
+    deflate segment. Segments end on a byte boundary without a final block,
+    allowing them to be joined into a single compressed stream for any
+    combination of share groups."""
+
+    __slots__ = ("num_folders", "checksum", "length", "data")
+
+    HEADER = Struct("!IIQ")
+
+    def __init__(self, num_folders=0, checksum=1, length=0, data=b""):
+        self.num_folders = num_folders
+        self.checksum = checksum
+        self.length = length
+        self.data = data
+
+    def __len__(self):
+        return self.num_folders
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """Read a segment previously written to a file with write()."""
+
+        num_folders, checksum, length = cls.HEADER.unpack_from(buffer)
+        return cls(num_folders, checksum, length, memoryview(buffer)[cls.HEADER.size:])
+
+    @classmethod
+    def compress(cls, content):
+
+        compressor = zlib.compressobj(ZLIB_COMPRESSION_LEVEL, wbits=-zlib.MAX_WBITS)
+        data = compressor.compress(content) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        return cls(checksum=zlib.adler32(content), length=len(content), data=data)
+
+    @classmethod
+    def write(cls, file_handle, shares):
+        """Compress the folders of a share group to a file, one folder at a
+        time."""
+
+        compressor = zlib.compressobj(ZLIB_COMPRESSION_LEVEL, wbits=-zlib.MAX_WBITS)
+        checksum = 1
+        length = 0
+
+        file_handle.write(cls.HEADER.pack(0, checksum, length))
+
+        for key in shares:
+            for content in (SlskMessage.pack_string(key), shares[key]):
+                checksum = zlib.adler32(content, checksum)
+                length += len(content)
+                file_handle.write(compressor.compress(content))
+
+        file_handle.write(compressor.flush(zlib.Z_SYNC_FLUSH))
+        file_handle.seek(0)
+        file_handle.write(cls.HEADER.pack(len(shares), checksum, length))
+
+    @staticmethod
+    def join(segments):
+        """Join segments into a single zlib-compressed message, without
+        recompressing them."""
+
+        compressor = zlib.compressobj(ZLIB_COMPRESSION_LEVEL)
+        msg_chunks = [compressor.compress(b"")]  # zlib header
+        checksum = 1
+
+        for segment in segments:
+            msg_chunks.append(segment.data)
+            checksum = adler32_combine(checksum, segment.checksum, segment.length)
+
+        # Empty final block, and checksum of the uncompressed content
+        final_compressor = zlib.compressobj(ZLIB_COMPRESSION_LEVEL, wbits=-zlib.MAX_WBITS)
+        msg_chunks.append(final_compressor.flush())
+        msg_chunks.append(checksum.to_bytes(4, "big"))
+
+        return b"".join(msg_chunks)
+
+
 class SharedFileListResponse(PeerMessage):
     """Peer code 5.
 
@@ -3291,38 +3395,24 @@ class SharedFileListResponse(PeerMessage):
         self.unknown = 0
         self.built = None
 
-    def _make_shares_list(self, share_groups):
-
-        try:
-            msg_list = bytearray()
-            num_folders = 0
-
-            for shares in share_groups:
-                num_folders += len(shares)
+    def _iter_shares_list(self, share_groups):
 
-            msg_list += self.pack_uint32(num_folders)
+        num_folders = 0
 
-            for shares in share_groups:
-                for key in shares:
-                    msg_list += self.pack_string(key)
-                    msg_list += shares[key]
+        for shares in share_groups:
+            num_folders += len(shares)
 
-        except Exception as error:
-            from pynicotine.logfacility import log
-            msg_list = self.pack_uint32(0)
-            log.add(_("Unable to read shares database. Please rescan your shares. Error: %s"), error)
+        yield self.pack_uint32(num_folders)
 
-        return msg_list
+        for shares in share_groups:
+            for key in shares:
+                yield self.pack_string(key)
+                yield shares[key]
 
-    def make_network_message(self):
-        # Elaborate hack to save CPU
-        # Store packed message contents in self.built, and use instead of repacking it
-        if self.built is not None:
-            return self.built
+    def _get_share_groups(self):
 
         from pynicotine.shares import PermissionLevel
 
-        msg = bytearray()
         share_groups = []
         private_share_groups = []
 
@@ -3335,19 +3425,74 @@ class SharedFileListResponse(PeerMessage):
         if self.permission_level == PermissionLevel.TRUSTED and self.trusted_shares:
             share_groups.append(self.trusted_shares)
 
-        msg += self._make_shares_list(share_groups)
-
-        # Unknown purpose, but official clients always send a value of 0
-        msg += self.pack_uint32(self.unknown)
-
         for shares in (self.buddy_shares, self.trusted_shares):
             if shares and shares not in share_groups:
                 private_share_groups.append(shares)
 
+        return share_groups, private_share_groups
+
+    def _compress_message_content(self, write_func, share_groups, private_share_groups):
+        """Compress the message content one folder at a time, without
+        building the whole uncompressed message in memory."""
+
+        compressor = zlib.compressobj(ZLIB_COMPRESSION_LEVEL)
+
+        for content in self._iter_shares_list(share_groups):
+            write_func(compressor.compress(content))
+
+        # Unknown purpose, but official clients always send a value of 0
+        write_func(compressor.compress(self.pack_uint32(self.unknown)))
+
         if private_share_groups:
-            msg += self._make_shares_list(share_groups=private_share_groups)
+            for content in self._iter_shares_list(private_share_groups):
+                write_func(compressor.compress(content))
+
+        write_func(compressor.flush())
+
+    def _join_segments(self, share_groups, private_share_groups):
+        """Join precompressed share group segments into a compressed shares
+        list, without recompressing them."""
+
+        segments = [SharesListSegment.compress(self.pack_uint32(sum(len(shares) for shares in share_groups)))]
+        segments += share_groups
+
+        # Unknown purpose, but official clients always send a value of 0
+        segments.append(SharesListSegment.compress(self.pack_uint32(self.unknown)))
+
+        if private_share_groups:
+            segments.append(
+                SharesListSegment.compress(self.pack_uint32(sum(len(shares) for shares in private_share_groups))))
+            segments += private_share_groups
+
+        return SharesListSegment.join(segments)
+
+    def make_network_message(self):
+        # Elaborate hack to save CPU
+        # Store packed message contents in self.built, and use instead of repacking it
+        if self.built is not None:
+            return self.built
+
+        share_groups, private_share_groups = self._get_share_groups()
+
+        if any(isinstance(shares, SharesListSegment) for shares in share_groups + private_share_groups):
+            # Segments are joined once, and the result is reused for every peer browsing
+            # our shares until the next rescan creates a new message
+            self.built = self._join_segments(share_groups, private_share_groups)
+            return self.built
+
+        msg_chunks = []
+
+        try:
+            self._compress_message_content(msg_chunks.append, share_groups, private_share_groups)
+
+        except Exception as error:
+            from pynicotine.logfacility import log
+            log.add(_("Unable to read shares database. Please rescan your shares. Error: %s"), error)
+
+            msg_chunks.clear()
+            self._compress_message_content(msg_chunks.append, share_groups=[], private_share_groups=[])
 
-        self.built = zlib.compress(msg, ZLIB_COMPRESSION_LEVEL)
+        self.built = b"".join(msg_chunks)
         return self.built
 
     def parse_network_message(self):
@@ -3364,32 +3509,32 @@ class SharedFileListResponse(PeerMessage):
 
         self.parse_network_message()
 
-    def _parse_result_list(self):
-        ndir = self.unpack_uint32()
+    def unpack_folder(self):
+
+        directory = self.unpack_string().replace("/", "\\")
+        nfiles = self.unpack_uint32()
 
         ext = None
-        shares = []
+        files = []
 
-        for _ in range(ndir):
-            directory = self.unpack_string().replace("/", "\\")
-            nfiles = self.unpack_uint32()
+        for _ in range(nfiles):
+            code = self.unpack_uint8()
+            name = self.unpack_string()
+            size = self.unpack_file_size()
+            ext_len = self.unpack_uint32()  # Obsolete, ignore
+            self._offset += ext_len
+            attrs = self.unpack_file_attributes()
 
-            files = []
+            files.append((code, name, size, ext, attrs))
 
-            for _ in range(nfiles):
-                code = self.unpack_uint8()
-                name = self.unpack_string()
-                size = self.unpack_file_size()
-                ext_len = self.unpack_uint32()  # Obsolete, ignore
-                self._offset += ext_len
-                attrs = self.unpack_file_attributes()
-
-                files.append((code, name, size, ext, attrs))
+        if nfiles > 1:
+            files.sort(key=itemgetter(1))
 
-            if nfiles > 1:
-                files.sort(key=itemgetter(1))
+        return directory, files
 
-            shares.append((directory, files))
+    def _parse_result_list(self):
+        ndir = self.unpack_uint32()
+        shares = [self.unpack_folder() for _ in range(ndir)]
 
         if ndir > 1:
             shares.sort(key=itemgetter(0))
@@ -3406,6 +3551,146 @@ class SharedFileListResponse(PeerMessage):
             self.privatelist = self._parse_result_list()
 
 
+class SharedFileListParser:
+    """Parses a SharedFileListResponse while its compressed content is still
+    being received. Each chunk is decompressed as it arrives, and complete
+    folders are parsed right away, so only the part of the uncompressed list
+    that has not been parsed yet is kept in memory."""
+
+    __slots__ = ("msg", "_decompressor", "_buffer", "_section", "_num_folders_left",
+                 "_num_uncompressed_bytes", "_min_parse_length")
+
+    MAX_UNCOMPRESSED_SIZE = 2147483648  # 2 GiB, same limit as SharedFileListResponse
+    MAX_DECOMPRESSED_CHUNK_SIZE = 1048576  # 1 MiB
+
+    (
+        SECTION_PUBLIC_FOLDER_COUNT,
+        SECTION_PUBLIC_FOLDERS,
+        SECTION_UNKNOWN,
+        SECTION_PRIVATE_FOLDER_COUNT,
+        SECTION_PRIVATE_FOLDERS,
+        SECTION_DONE
+    ) = range(6)
+
+    def __init__(self, msg):
+
+        self.msg = msg
+        self._decompressor = zlib.decompressobj()
+        self._buffer = bytearray()
+        self._section = self.SECTION_PUBLIC_FOLDER_COUNT
+        self._num_folders_left = 0
+        self._num_uncompressed_bytes = 0
+        self._min_parse_length = 0
+
+    def feed(self, data):
+        """Decompress a chunk of the compressed message content, and parse the
+        folders it completes. Returns lists of the new public and private
+        folders."""
+
+        decompressor = self._decompressor
+        public_folders = []
+        private_folders = []
+
+        while data:
+            max_length = min(self.MAX_UNCOMPRESSED_SIZE - self._num_uncompressed_bytes,
+                             self.MAX_DECOMPRESSED_CHUNK_SIZE)
+
+            if max_length <= 0:
+                raise ValueError("Shares list exceeds maximum uncompressed size")
+
+            uncompressed_data = decompressor.decompress(data, max_length)
+            data = decompressor.unconsumed_tail
+
+            self._num_uncompressed_bytes += len(uncompressed_data)
+            self._buffer += uncompressed_data
+
+            if len(self._buffer) >= self._min_parse_length:
+                self._parse_folders(public_folders, private_folders)
+
+        return public_folders, private_folders
+
+    def finish(self):
+        """Parse any remaining folders once all content is received, and sort
+        the folder lists of the message. Returns the message."""
+
+        public_folders = []
+        private_folders = []
+        self._parse_folders(public_folders, private_folders)
+
+        if self._section in {self.SECTION_PUBLIC_FOLDER_COUNT, self.SECTION_PUBLIC_FOLDERS,
+                             self.SECTION_PRIVATE_FOLDERS}:
+            raise ValueError("Shares list is incomplete")
+
+        msg = self.msg
+        msg.list.sort(key=itemgetter(0))
+        msg.privatelist.sort(key=itemgetter(0))
+
+        self._buffer.clear()
+        return msg
+
+    def _parse_next_item(self, public_folders, private_folders):
+
+        msg = self.msg
+        section = self._section
+
+        if section == self.SECTION_PUBLIC_FOLDERS or section == self.SECTION_PRIVATE_FOLDERS:
+            if not self._num_folders_left:
+                self._section += 1
+                return
+
+            folder = msg.unpack_folder()
+
+            if section == self.SECTION_PUBLIC_FOLDERS:
+                msg.list.append(folder)
+                public_folders.append(folder)
+            else:
+                msg.privatelist.append(folder)
+                private_folders.append(folder)
+
+            self._num_folders_left -= 1
+            return
+
+        if section == self.SECTION_UNKNOWN:
+            msg.unknown = msg.unpack_uint32()
+        else:
+            self._num_folders_left = msg.unpack_uint32()
+
+        self._section += 1
+
+    def _parse_folders(self, public_folders, private_folders):
+
+        msg = self.msg
+        buffer = self._buffer
+        buffer_len = len(buffer)
+        offset = 0
+
+        with memoryview(buffer) as message:
+            msg._message = message  # pylint: disable=protected-access
+            msg._offset = 0         # pylint: disable=protected-access
+
+            try:
+                while self._section != self.SECTION_DONE:
+                    self._parse_next_item(public_folders, private_folders)
+
+                    if msg._offset > buffer_len:  # pylint: disable=protected-access
+                        # Strings are truncated instead of raising an error, but
+                        # something is always unpacked after them
+                        raise IndexError
+
+                    offset = msg._offset  # pylint: disable=protected-access
+
+            except (IndexError, StructError):
+                # Item is incomplete, wait for more data. Items are large at times, so
+                # wait for twice the data before parsing it again, to avoid parsing
+                # large folders over and over while they are received.
+                self._min_parse_length = (buffer_len - offset) * 2
+
+            finally:
+                msg.finish_parsing()
+
+        del buffer[:offset]
+
+
 class FileSearchRequest(PeerMessage):
     """Peer code 8.
 
@@ -3459,7 +3744,43 @@ class FileSearchResponse(PeerMessage):
         self.inqueue = inqueue
         self.unknown = 0
 
+    @classmethod
+    def compress_result_list(cls, fileinfos):
+        """Compress a result list of (virtual_path, packed_file_info) items,
+        with file information packed in advance using
+        FileListMessage.pack_file_info(), as a segment. The segment can be
+        reused in responses to multiple search requests."""
+
+        msg = bytearray()
+        msg += cls.pack_uint32(len(fileinfos))
+
+        for _virtual_file_path, packed_file_info in fileinfos:
+            msg += packed_file_info
+
+        return SharesListSegment.compress(msg)
+
+    def _join_result_list_segments(self):
+
+        segments = [
+            SharesListSegment.compress(self.pack_string(self.search_username) + self.pack_uint32(self.token)),
+            self.list,
+            SharesListSegment.compress(
+                self.pack_bool(self.freeulslots) + self.pack_uint32(self.ulspeed)
+                + self.pack_uint32(self.inqueue) + self.pack_uint32(self.unknown)
+            )
+        ]
+
+        if self.privatelist is not None:
+            segments.append(self.privatelist)
+
+        return SharesListSegment.join(segments)
+
     def make_network_message(self):
+
+        if isinstance(self.list, SharesListSegment):
+            # Result lists compressed in advance with compress_result_list()
+            return self._join_result_list_segments()
+
         msg = bytearray()
         msg += self.pack_string(self.search_username)
         msg += self.pack_uint32(self.token)
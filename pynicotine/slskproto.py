@@ -6,7 +6,9 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import errno
+import os
 import random
+import select
 import selectors
 import socket
 import struct
@@ -14,7 +16,9 @@ import sys
 import time
 
 from collections import defaultdict
+from collections import deque
 from queue import Empty, SimpleQueue
+from threading import Lock
 from threading import Thread
 
 from pynicotine.events import events
@@ -70,6 +74,7 @@ from pynicotine.slskmessages import ServerReconnect
 from pynicotine.slskmessages import SetDownloadLimit
 from pynicotine.slskmessages import SetUploadLimit
 from pynicotine.slskmessages import SetWaitPort
+from pynicotine.slskmessages import SharedFileListParser
 from pynicotine.slskmessages import SharedFileListResponse
 from pynicotine.slskmessages import UnwatchUser
 from pynicotine.slskmessages import UploadFile
@@ -107,7 +112,7 @@ class ServerConnection(Connection):
 
 
 class PeerConnection(Connection):
-    __slots__ = ("init", "pierce_token", "has_post_init_activity")
+    __slots__ = ("init", "pierce_token", "has_post_init_activity", "shares_list_stream", "parser_queue")
 
     def __init__(self, *args, init=None, pierce_token=None, **kwargs):
 
@@ -116,6 +121,34 @@ class PeerConnection(Connection):
         self.init = init
         self.pierce_token = pierce_token
         self.has_post_init_activity = False
+        self.shares_list_stream = None
+        self.parser_queue = None
+
+
+class PeerParserQueue:
+    """Messages of a peer connection waiting for a parser worker. A lock
+    ensures that only one worker handles the queue at a time, so messages
+    are delivered in the order they were received."""
+
+    __slots__ = ("items", "lock")
+
+    def __init__(self):
+        self.items = deque()
+        self.lock = Lock()
+
+
+class SharesListStream:
+    """Shares list being received on a peer connection. Chunks are parsed by
+    a parser worker as they arrive."""
+
+    __slots__ = ("parser", "num_bytes_total", "num_bytes_left", "is_cancelled")
+
+    def __init__(self, parser, num_bytes_total, num_bytes_left):
+
+        self.parser = parser
+        self.num_bytes_total = num_bytes_total
+        self.num_bytes_left = num_bytes_left
+        self.is_cancelled = False
 
 
 class UserAddress:
@@ -328,6 +361,56 @@ class NetworkInterfaces:
         sock.bind((address, 0))
 
 
+class MessageParserPool:
+    """Pool of worker threads that parse large incoming messages, so that
+    decompressing and parsing e.g. a shares list doesn't stall every other
+    socket on the networking thread. Parsed messages are delivered to the
+    main thread by the queued callbacks."""
+
+    __slots__ = ("num_workers", "_queue", "_threads")
+
+    def __init__(self, num_workers=2):
+
+        self.num_workers = num_workers
+        self._queue = SimpleQueue()
+        self._threads = []
+
+    def start(self):
+
+        if self._threads:
+            return
+
+        for worker_index in range(self.num_workers):
+            thread = Thread(target=self._run, name=f"MessageParserWorker{worker_index + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Stop the workers once queued messages are parsed."""
+
+        for _thread in self._threads:
+            self._queue.put(None)
+
+        for thread in self._threads:
+            thread.join()
+
+        self._threads.clear()
+
+    def put(self, callback, *args, **kwargs):
+        self._queue.put((callback, args, kwargs))
+
+    def _run(self):
+
+        while True:
+            item = self._queue.get()
+
+            if item is None:
+                break
+
+            callback, args, kwargs = item
+            callback(*args, **kwargs)
+
+
 class NetworkThread(Thread):
     """This is the networking thread that does all the communication with the
     Soulseek server and peers. Communication with the core is done through
@@ -351,6 +434,13 @@ class NetworkThread(Thread):
     TCP_BUFFER_SIZE_MEDIUM = 208896              # 204 KiB, maximum limit NetBSD accepts by default
     TCP_BUFFER_SIZE_SMALL = 16384                # 16 KiB
     MAX_ACCEPTED_USERNAME_SIZE = 256             # 256 bytes, for future flexibility beyond the actual 30 byte limit
+    MIN_WORKER_PARSED_MESSAGE_SIZE = 16384       # 16 KiB, smaller messages are parsed faster than handed off
+    WORKER_PARSED_MESSAGE_CLASSES = {
+        FileSearchResponse,
+        FolderContentsResponse,
+        SharedFileListResponse,
+        UserInfoResponse
+    }
     SERVER_USERNAME = "server"
     ALLOWED_PEER_CONN_TYPES = {
         ConnectionType.PEER,
@@ -358,10 +448,14 @@ class NetworkThread(Thread):
         ConnectionType.DISTRIBUTED
     }
 
-    # Looping max ~240 times per second (SLEEP_MIN_IDLE) on high activity
-    # ~20 (SLEEP_MAX_IDLE + SLEEP_MIN_IDLE) by default
-    SLEEP_MAX_IDLE = 0.04584
-    SLEEP_MIN_IDLE = 0.00416
+    # Connection timeouts and bandwidth statistics are checked once per cycle
+    CYCLE_INTERVAL = 1
+
+    # Send uploaded files straight from the file to the socket when possible
+    USE_SENDFILE = hasattr(os, "sendfile")
+    SENDFILE_UNSUPPORTED_ERRORS = {
+        errno.EINVAL, errno.ENOSYS, errno.ENOTSOCK, errno.EOPNOTSUPP, getattr(errno, "ENOTSUP", errno.EOPNOTSUPP)
+    }
 
     try:
         import resource
@@ -392,6 +486,7 @@ class NetworkThread(Thread):
         super().__init__(name="NetworkThread")
 
         self._message_queue = SimpleQueue()
+        self._message_parser_pool = MessageParserPool()
         self._pending_peer_conns = {}
         self._pending_init_msgs = defaultdict(list)
         self._indirect_token_init_msgs = {}
@@ -400,6 +495,9 @@ class NetworkThread(Thread):
         self._allowed_message_responses = defaultdict(set)
         self._should_process_queue = False
         self._want_abort = False
+        self._wakeup_reader = None
+        self._wakeup_writer = None
+        self._is_wakeup_pending = False
 
         self._selector = None
         self._listen_socket = None
@@ -433,11 +531,13 @@ class NetworkThread(Thread):
         self._last_cycle_time = 0
 
         self._conns = {}
+        self._throttled_conns = set()
         self._indirect_token = initial_token()
 
         self._file_init_msgs = {}
         self._file_download_msgs = {}
         self._file_upload_msgs = {}
+        self._sendfile_upload_conns = set()
         self._conns_downloaded = defaultdict(int)
         self._conns_uploaded = defaultdict(int)
         self._calc_upload_limit_function = self._calc_upload_limit_none
@@ -460,6 +560,63 @@ class NetworkThread(Thread):
 
     def _schedule_quit(self):
         self._want_abort = True
+        self._wake_up()
+
+    # Wakeups #
+
+    def _create_wakeup_sockets(self):
+        """Create a socket pair the main thread writes to when there is
+        something for the network thread to do. The reading end is watched
+        alongside the other sockets, so the loop wakes up immediately instead
+        of polling at a fixed interval."""
+
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+
+    def _close_wakeup_sockets(self):
+
+        for sock in (self._wakeup_reader, self._wakeup_writer):
+            if sock is not None:
+                self._close_socket(sock)
+
+        self._wakeup_reader = self._wakeup_writer = None
+
+    def _wake_up(self):
+
+        wakeup_writer = self._wakeup_writer
+
+        if wakeup_writer is None or self._is_wakeup_pending:
+            # Loop not started yet, or a wakeup is already on its way
+            return
+
+        self._is_wakeup_pending = True
+
+        try:
+            wakeup_writer.send(b"\0")
+
+        except OSError:
+            # Socket buffer full (the loop will wake up anyway), or socket closed during shutdown
+            pass
+
+    def _clear_wakeup(self):
+
+        self._is_wakeup_pending = False
+
+        try:
+            while self._wakeup_reader.recv(4096):
+                pass
+
+        except OSError:
+            # No more data to read
+            pass
+
+    def _wait_for_wakeup(self, timeout):
+
+        readable_socks, _writable_socks, _error_socks = select.select((self._wakeup_reader,), (), (), timeout)
+
+        if readable_socks:
+            self._clear_wakeup()
 
     # Message Queue #
 
@@ -470,6 +627,7 @@ class NetworkThread(Thread):
 
         self._clear_message_queue()
         self._should_process_queue = True
+        self._wake_up()
 
     def _disable_message_queue(self):
 
@@ -490,6 +648,7 @@ class NetworkThread(Thread):
     def _queue_network_message(self, msg):
         if self._should_process_queue:
             self._message_queue.put_nowait(msg)
+            self._wake_up()
 
     def _process_queue_messages(self):
 
@@ -522,7 +681,7 @@ class NetworkThread(Thread):
             self._close_listen_socket()
             return False
 
-        self._selector.register(self._listen_socket, selectors.EVENT_READ)
+        self._register_socket(self._listen_socket, selectors.EVENT_READ)
         return True
 
     def _close_listen_socket(self):
@@ -531,7 +690,7 @@ class NetworkThread(Thread):
             return
 
         try:
-            self._selector.unregister(self._listen_socket)
+            self._unregister_socket(self._listen_socket)
 
         except KeyError:
             # Socket was not registered
@@ -736,6 +895,73 @@ class NetworkThread(Thread):
 
         return None
 
+    @staticmethod
+    def _is_parser_queue_pending(conn):
+        """Whether messages of a peer connection are still waiting for a
+        parser worker. Later messages need to wait for them too."""
+
+        parser_queue = conn.parser_queue
+        return parser_queue is not None and (parser_queue.items or parser_queue.lock.locked())
+
+    def _queue_peer_parser_work(self, conn, callback, *args, **kwargs):
+
+        parser_queue = conn.parser_queue
+
+        if parser_queue is None:
+            parser_queue = conn.parser_queue = PeerParserQueue()
+
+        parser_queue.items.append((callback, args, kwargs))
+        self._message_parser_pool.put(self._process_peer_parser_queue, parser_queue)
+
+    def _process_peer_parser_queue(self, parser_queue):
+        """Called from a parser worker thread. Processes the queued messages
+        of a peer connection, unless another worker is already processing
+        them."""
+
+        while parser_queue.items and parser_queue.lock.acquire(blocking=False):
+            try:
+                while parser_queue.items:
+                    callback, args, kwargs = parser_queue.items.popleft()
+                    callback(*args, **kwargs)
+
+            finally:
+                parser_queue.lock.release()
+
+    def _parse_worker_message(self, msg_class, msg_content, msg_size, **kwargs):
+        """Called from a parser worker thread."""
+
+        msg = self._unpack_network_message(msg_class, msg_content, msg_size, **kwargs)
+        self._emit_network_message_event(msg)
+
+    def _parse_shares_list_chunk(self, stream, chunk):
+        """Called from a parser worker thread. A chunk of None marks the end
+        of the shares list."""
+
+        if stream.is_cancelled:
+            return
+
+        parser = stream.parser
+        msg = parser.msg
+        public_folders = private_folders = None
+
+        try:
+            if chunk is None:
+                parser.finish()
+            else:
+                public_folders, private_folders = parser.feed(chunk)
+
+        except Exception as error:
+            log.add_debug("Unable to parse peer message type %s, size %s. Error: %s",
+                          (msg.__class__, stream.num_bytes_total, error))
+            stream.is_cancelled = True
+            return
+
+        if public_folders or private_folders:
+            events.emit_main_thread("shared-file-list-folders", msg.username, public_folders, private_folders)
+
+        if chunk is None:
+            self._emit_network_message_event(msg)
+
     @classmethod
     def _unpack_embedded_message(cls, msg, sock=None, username=None):
         """This message embeds a distributed message.
@@ -777,12 +1003,41 @@ class NetworkThread(Thread):
             event_name = NETWORK_MESSAGE_EVENTS[msg_class]
             events.emit_main_thread(event_name, msg)
 
+    def _register_socket(self, sock, io_events):
+        self._selector.register(sock, io_events)
+
+    def _unregister_socket(self, sock):
+        self._selector.unregister(sock)
+
+    def _modify_socket_events(self, sock, io_events):
+        self._selector.modify(sock, io_events)
+
     def _modify_connection_events(self, conn, io_events):
 
         if conn.io_events != io_events:
-            self._selector.modify(conn.sock, io_events)
+            if conn not in self._throttled_conns:
+                self._modify_socket_events(conn.sock, io_events)
+
             conn.io_events = io_events
 
+    def _throttle_connection(self, conn):
+        """Stop watching a connection that reached its bandwidth limit until
+        the next cycle. Otherwise, the socket would keep waking up the loop
+        while we have nothing to do with it."""
+
+        if conn in self._throttled_conns:
+            return
+
+        self._unregister_socket(conn.sock)
+        self._throttled_conns.add(conn)
+
+    def _unthrottle_connections(self):
+
+        for conn in self._throttled_conns:
+            self._register_socket(conn.sock, conn.io_events)
+
+        self._throttled_conns.clear()
+
     def _process_conn_messages(self, init):
         """A connection is established with the peer, time to queue up our peer
         messages for delivery."""
@@ -1000,7 +1255,11 @@ class NetworkThread(Thread):
             # Disconnecting from server, clean up connections and queue
             self._server_disconnect()
 
-        self._selector.unregister(sock)
+        if conn in self._throttled_conns:
+            self._throttled_conns.remove(conn)
+        else:
+            self._unregister_socket(sock)
+
         self._close_socket(sock)
         self._num_sockets -= 1
 
@@ -1016,6 +1275,10 @@ class NetworkThread(Thread):
         if conn.__class__ is not PeerConnection:
             return
 
+        if conn.shares_list_stream is not None:
+            conn.shares_list_stream.is_cancelled = True
+            conn.shares_list_stream = None
+
         init = conn.init
 
         if init is None:
@@ -1067,6 +1330,7 @@ class NetworkThread(Thread):
 
         elif conn in self._file_upload_msgs:
             del self._file_upload_msgs[conn]
+            self._sendfile_upload_conns.discard(conn)
             self._total_uploads -= 1
 
             if not self._total_uploads:
@@ -1303,7 +1567,7 @@ class NetworkThread(Thread):
             return
 
         self._server_conn = self._conns[sock] = conn
-        self._selector.register(sock, io_events)
+        self._register_socket(sock, io_events)
         self._num_sockets += 1
 
     def _establish_outgoing_server_connection(self, conn):
@@ -1839,7 +2103,7 @@ class NetworkThread(Thread):
 
             # Event flags are modified to include 'write' in subsequent loops, if necessary.
             # Don't do it here, otherwise connections may break.
-            self._selector.register(incoming_sock, io_events)
+            self._register_socket(incoming_sock, io_events)
             conn.is_established = True
 
             log.add_conn("Incoming connection from address %s", (incoming_addr,))
@@ -1896,12 +2160,63 @@ class NetworkThread(Thread):
 
         init.sock = sock
         self._conns[sock] = conn
-        self._selector.register(sock, io_events)
+        self._register_socket(sock, io_events)
         self._num_sockets += 1
 
+    def _start_shares_list_stream(self, conn, msg_size):
+
+        msg = SharedFileListResponse()
+        msg.sock = conn.sock
+        msg.addr = conn.addr
+        msg.username = conn.init.target_user
+        msg.allowed_responses = self._allowed_message_responses.get(SharedFileListResponse, set())
+
+        conn.shares_list_stream = SharesListStream(
+            SharedFileListParser(msg), num_bytes_total=msg_size + 4, num_bytes_left=msg_size - 4)
+
+    def _process_shares_list_stream_input(self, conn):
+        """Hands over received parts of a large shares list to a parser
+        worker, so that folders can be shown before the whole list is
+        received."""
+
+        stream = conn.shares_list_stream
+        in_buffer = conn.in_buffer
+        buffer_len = len(in_buffer)
+
+        if not buffer_len:
+            return
+
+        if buffer_len <= stream.num_bytes_left:
+            # Data belongs to the shares list, hand it over without copying
+            chunk = in_buffer
+            conn.in_buffer = bytearray()
+        else:
+            chunk = in_buffer[:stream.num_bytes_left]
+            del in_buffer[:stream.num_bytes_left]
+
+        stream.num_bytes_left -= len(chunk)
+        conn.has_post_init_activity = True
+
+        events.emit_main_thread(
+            "shared-file-list-progress", conn.init.target_user, conn.sock,
+            stream.num_bytes_total - stream.num_bytes_left, stream.num_bytes_total)
+
+        if not stream.is_cancelled:
+            self._queue_peer_parser_work(conn, self._parse_shares_list_chunk, stream, chunk)
+
+        if not stream.num_bytes_left:
+            self._queue_peer_parser_work(conn, self._parse_shares_list_chunk, stream, None)
+            conn.shares_list_stream = None
+
     def _process_peer_input(self, conn):
         """Reads messages from the input buffer of a 'P' connection."""
 
+        if conn.shares_list_stream is not None:
+            self._process_shares_list_stream_input(conn)
+
+            if conn.shares_list_stream is not None:
+                return
+
         in_buffer = conn.in_buffer
         buffer_len = len(in_buffer)
         msg_content_offset = 8
@@ -1949,11 +2264,17 @@ class NetworkThread(Thread):
                     "user-info-progress", conn.init.target_user, conn.sock, buffer_len, msg_size_total)
 
             if msg_size_total > buffer_len:
+                if msg_class is SharedFileListResponse and msg_size >= self.MIN_WORKER_PARSED_MESSAGE_SIZE:
+                    # Parse large shares lists while they are being received
+                    self._start_shares_list_stream(conn, msg_size)
+                    idx += msg_content_offset
+
                 # Buffer is being filled
                 break
 
             # Unpack peer messages
-            if msg_class:
+            if msg_class is not None and (msg_class not in self.WORKER_PARSED_MESSAGE_CLASSES
+                                          or msg_size < self.MIN_WORKER_PARSED_MESSAGE_SIZE):
                 msg = self._unpack_network_message(
                     msg_class,
                     memoryview(in_buffer)[idx + msg_content_offset:idx + msg_size_total],
@@ -1968,7 +2289,35 @@ class NetworkThread(Thread):
                 if msg_class is FileSearchResponse:
                     search_result_received = True
 
-                self._emit_network_message_event(msg)
+                if self._is_parser_queue_pending(conn):
+                    # Keep the order messages were received in
+                    self._queue_peer_parser_work(conn, self._emit_network_message_event, msg)
+                else:
+                    self._emit_network_message_event(msg)
+
+            elif msg_class is not None:
+                if idx == 0 and msg_size_total == buffer_len:
+                    # Message fills the whole buffer, hand it over without copying
+                    msg_buffer = in_buffer
+                    conn.in_buffer = in_buffer = bytearray()
+                else:
+                    msg_buffer = in_buffer[idx:idx + msg_size_total]
+
+                self._queue_peer_parser_work(
+                    conn,
+                    self._parse_worker_message,
+                    msg_class,
+                    memoryview(msg_buffer)[msg_content_offset:msg_size_total],
+                    msg_size,
+                    conn_type="peer",
+                    sock=conn.sock,
+                    addr=conn.addr,
+                    username=conn.init.target_user,
+                    allowed_responses=self._allowed_message_responses.get(msg_class, set())
+                )
+
+                if msg_class is FileSearchResponse:
+                    search_result_received = True
             else:
                 msg_content = in_buffer[idx + msg_content_offset:idx + min(50, msg_size_total)]
                 log.add_debug("Peer message type %s size %s contents %s unknown, from user: %s, address %s",
@@ -1986,6 +2335,10 @@ class NetworkThread(Thread):
             # as we need to get rid of peer connections before they pile up.
 
             self._close_connection(conn)
+            return
+
+        if conn.shares_list_stream is not None:
+            self._process_shares_list_stream_input(conn)
 
     def _process_peer_output(self, conn, msg):
 
@@ -2157,7 +2510,7 @@ class NetworkThread(Thread):
         size = file_upload.size
 
         try:
-            if total_read_bytes < size:
+            if total_read_bytes < size and conn not in self._sendfile_upload_conns:
                 num_bytes_to_read = int(
                     (max(4096, num_sent_bytes * 1.25) / max(1, current_time - conn.last_active))
                     - out_buffer_len
@@ -2631,6 +2984,9 @@ class NetworkThread(Thread):
             if conn is not None:
                 self._file_upload_msgs[conn] = msg
 
+                if self.USE_SENDFILE:
+                    self._sendfile_upload_conns.add(conn)
+
                 self._total_uploads += 1
                 self._calc_upload_limit_function()
                 self._process_conn_incoming_messages(conn)
@@ -2674,6 +3030,7 @@ class NetworkThread(Thread):
         if (self._download_limit_split
                 and conn in self._conns_downloaded
                 and self._conns_downloaded[conn] >= self._download_limit_split):
+            self._throttle_connection(conn)
             return
 
         conn_error = None
@@ -2718,6 +3075,7 @@ class NetworkThread(Thread):
         if (self._upload_limit_split
                 and conn in self._conns_uploaded
                 and self._conns_uploaded[conn] >= self._upload_limit_split):
+            self._throttle_connection(conn)
             return
 
         try:
@@ -2730,16 +3088,21 @@ class NetworkThread(Thread):
 
         self._close_connection(conn)
 
-    def _process_ready_sockets(self, current_time):
+    def _process_ready_sockets(self, timeout):
 
-        if self._listen_socket is None:
-            # We can't call select() when no sockets are registered (WinError 10022)
-            return
+        ready_sockets = self._selector.select(timeout=timeout)
 
-        for key, io_events in self._selector.select(timeout=self.SLEEP_MAX_IDLE):
+        # Waiting for sockets can take a while, use the time they became ready
+        current_time = time.monotonic()
+
+        for key, io_events in ready_sockets:
             sock = key.fileobj
 
             if io_events & selectors.EVENT_READ:
+                if sock is self._wakeup_reader:
+                    self._clear_wakeup()
+                    continue
+
                 if sock is self._listen_socket:
                     self._accept_incoming_peer_connections()
                     continue
@@ -2885,11 +3248,78 @@ class NetworkThread(Thread):
         conn.last_active = current_time
         return True
 
+    def _write_file_data(self, conn, file_upload, current_time):
+        """Send upload data straight from the file to the socket with
+        sendfile(), instead of reading it into the output buffer first."""
+
+        position = file_upload.offset + file_upload.sentbytes
+        num_bytes = file_upload.size - position
+
+        if self._upload_limit_split:
+            limit = (self._upload_limit_split - self._conns_uploaded[conn])
+
+            if num_bytes > limit:  # pylint: disable=consider-using-min-builtin
+                num_bytes = limit
+
+        num_bytes_sent = 0
+
+        try:
+            if num_bytes > 0:
+                num_bytes_sent = os.sendfile(conn.sock.fileno(), file_upload.file.fileno(), position, num_bytes)
+
+                if not num_bytes_sent:
+                    # End of file reached early, file was truncated during the upload
+                    events.emit_main_thread(
+                        "upload-file-error",
+                        username=conn.init.target_user, token=file_upload.token,
+                        error=EOFError(_("File was truncated during upload"))
+                    )
+                    return False  # Close the connection
+
+        except BlockingIOError:
+            # Socket buffer full
+            pass
+
+        except (OSError, ValueError) as error:
+            if not isinstance(error, ValueError) and error.errno not in self.SENDFILE_UNSUPPORTED_ERRORS:
+                raise
+
+            # File or socket doesn't support sendfile(), fall back to reading the file
+            log.add_conn("Cannot use sendfile() for upload to user %s, reading file instead. Error: %s",
+                         (conn.init.target_user, error))
+            self._sendfile_upload_conns.discard(conn)
+
+            try:
+                file_upload.file.seek(position)
+
+            except (OSError, ValueError):
+                # Reported when reading the file
+                pass
+
+        if self._upload_limit_split:
+            self._conns_uploaded[conn] += num_bytes_sent
+
+        if not self._process_upload(conn, num_bytes_sent, current_time):
+            return False  # Close the connection
+
+        if conn in self._sendfile_upload_conns and file_upload.offset + file_upload.sentbytes >= file_upload.size:
+            # Nothing else to send, stop watching connection for writes
+            self._modify_connection_events(conn, selectors.EVENT_READ)
+
+        conn.last_active = current_time
+        return True
+
     def _write_data(self, conn, current_time):
 
         sock = conn.sock
         out_buffer = conn.out_buffer
-        is_file_upload = (conn in self._file_upload_msgs)
+        file_upload = self._file_upload_msgs.get(conn)
+        is_file_upload = (file_upload is not None)
+        is_sendfile_upload = (
+            is_file_upload and file_upload.offset is not None and conn in self._sendfile_upload_conns)
+
+        if is_sendfile_upload and not out_buffer:
+            return self._write_file_data(conn, file_upload, current_time)
 
         if is_file_upload and self._upload_limit_split:
             limit = (self._upload_limit_split - self._conns_uploaded[conn])
@@ -2908,7 +3338,7 @@ class NetworkThread(Thread):
         if is_file_upload and not self._process_upload(conn, num_bytes_sent, current_time):
             return False  # Close the connection
 
-        if not out_buffer:
+        if not out_buffer and not is_sendfile_upload:
             # Nothing else to send, stop watching connection for writes
             self._modify_connection_events(conn, selectors.EVENT_READ)
 
@@ -2917,49 +3347,63 @@ class NetworkThread(Thread):
 
     # Networking Loop #
 
-    def _loop(self):
+    def _process_timers(self, current_time):
+        """Run periodic checks that are due, and return the number of seconds
+        until the next one."""
 
-        while not self._want_abort:
-            current_time = time.monotonic()
+        if (current_time - self._last_cycle_time) >= self.CYCLE_INTERVAL:
+            self._unthrottle_connections()
+            self._check_connections(current_time)
+            self._check_indirect_request_timeouts(current_time)
+
+            events.emit_main_thread(
+                "set-connection-stats",
+                total_conns=self._num_sockets,
+                download_bandwidth=self._total_download_bandwidth,
+                upload_bandwidth=self._total_upload_bandwidth
+            )
+
+            self._conns_downloaded.clear()
+            self._conns_uploaded.clear()
 
-            if (current_time - self._last_cycle_time) >= 1:
-                self._check_connections(current_time)
-                self._check_indirect_request_timeouts(current_time)
+            self._total_download_bandwidth = 0
+            self._total_upload_bandwidth = 0
 
+            self._last_cycle_time = current_time
+
+        timeout = self._last_cycle_time + self.CYCLE_INTERVAL - current_time
+
+        if not self._should_process_queue and self._server_timeout_time:
+            server_timeout = self._server_timeout_time - current_time
+
+            if server_timeout <= 0:
+                self._server_timeout_time = None
                 events.emit_main_thread(
-                    "set-connection-stats",
-                    total_conns=self._num_sockets,
-                    download_bandwidth=self._total_download_bandwidth,
-                    upload_bandwidth=self._total_upload_bandwidth
+                    "server-reconnect",
+                    ServerReconnect(manual_reconnect=self._manual_server_reconnect)
                 )
+            else:
+                timeout = min(timeout, server_timeout)
 
-                self._conns_downloaded.clear()
-                self._conns_uploaded.clear()
+        return timeout
 
-                self._total_download_bandwidth = 0
-                self._total_upload_bandwidth = 0
+    def _loop(self):
+
+        while not self._want_abort:
+            current_time = time.monotonic()
 
-                self._last_cycle_time = current_time
+            # Sleep until the next periodic check, unless something wakes us up earlier
+            timeout = self._process_timers(current_time)
 
             if not self._should_process_queue:
-                if self._server_timeout_time and (self._server_timeout_time - current_time) <= 0:
-                    self._server_timeout_time = None
-                    events.emit_main_thread(
-                        "server-reconnect",
-                        ServerReconnect(manual_reconnect=self._manual_server_reconnect)
-                    )
-
-                time.sleep(self.SLEEP_MAX_IDLE + self.SLEEP_MIN_IDLE)
+                self._wait_for_wakeup(timeout)
                 continue
 
             # Process queue messages
             self._process_queue_messages()
 
-            # Check which connections are ready to send/receive data
-            self._process_ready_sockets(current_time)
-
-            # Don't exhaust the CPU
-            time.sleep(self.SLEEP_MIN_IDLE)
+            # Wait until connections are ready to send/receive data
+            self._process_ready_sockets(timeout)
 
     def run(self):
 
@@ -2968,6 +3412,9 @@ class NetworkThread(Thread):
         # Watch sockets for I/0 readiness with the selectors module. Only call register() after a socket
         # is bound, otherwise watching the socket not guaranteed to work (breaks on OpenBSD at least)
         self._selector = selectors.DefaultSelector()
+        self._create_wakeup_sockets()
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ)
+        self._message_parser_pool.start()
 
         try:
             self._loop()
@@ -2976,7 +3423,153 @@ class NetworkThread(Thread):
             # Networking thread aborted
             self._manual_server_disconnect = True
             self._close_connection(self._server_conn)
+            self._message_parser_pool.stop()
             self._selector.close()
+            self._close_wakeup_sockets()
+
+            # We're ready to quit
+            events.emit_main_thread("quit")
+
+
+class AsyncioNetworkThread(NetworkThread):
+    """Networking thread driven by an asyncio event loop instead of our own
+    selector loop. Sockets are watched with add_reader() and add_writer(),
+    periodic checks are scheduled with call_later(), and the main thread
+    wakes up the loop with call_soon_threadsafe().
+
+    A selector event loop is always used, since add_reader() and
+    add_writer() are not available in the proactor event loop asyncio
+    defaults to on Windows.
+    """
+
+    def __init__(self):
+
+        super().__init__()
+
+        self._event_loop = None
+        self._timer_handle = None
+        self._loop_error = None
+
+    # Wakeups #
+
+    def _wake_up(self):
+
+        event_loop = self._event_loop
+
+        if event_loop is None or self._is_wakeup_pending:
+            # Loop not started yet, or a wakeup is already on its way
+            return
+
+        self._is_wakeup_pending = True
+
+        try:
+            event_loop.call_soon_threadsafe(self._process_wakeup)
+
+        except RuntimeError:
+            # Event loop closed during shutdown
+            pass
+
+    def _process_wakeup(self):
+
+        self._is_wakeup_pending = False
+
+        if self._want_abort:
+            self._event_loop.stop()
+            return
+
+        if self._should_process_queue:
+            self._process_queue_messages()
+
+    # Sockets #
+
+    def _register_socket(self, sock, io_events):
+        self._modify_socket_events(sock, io_events)
+
+    def _unregister_socket(self, sock):
+        self._event_loop.remove_reader(sock)
+        self._event_loop.remove_writer(sock)
+
+    def _modify_socket_events(self, sock, io_events):
+
+        event_loop = self._event_loop
+
+        if io_events & selectors.EVENT_READ:
+            event_loop.add_reader(sock, self._process_readable_socket, sock)
+        else:
+            event_loop.remove_reader(sock)
+
+        if io_events & selectors.EVENT_WRITE:
+            event_loop.add_writer(sock, self._process_writable_socket, sock)
+        else:
+            event_loop.remove_writer(sock)
+
+    def _process_readable_socket(self, sock):
+
+        if sock is self._listen_socket:
+            self._accept_incoming_peer_connections()
+            return
+
+        self._process_ready_input_socket(sock, time.monotonic())
+
+    def _process_writable_socket(self, sock):
+        self._process_ready_output_socket(sock, time.monotonic())
+
+    # Networking Loop #
+
+    def _process_timer(self):
+
+        if self._want_abort:
+            self._event_loop.stop()
+            return
+
+        timeout = self._process_timers(time.monotonic())
+        self._timer_handle = self._event_loop.call_later(timeout, self._process_timer)
+
+    def _handle_loop_exception(self, event_loop, context):
+
+        # Stop networking on unhandled errors, like the selector loop does,
+        # instead of letting asyncio log them and carry on
+        self._loop_error = context.get("exception") or RuntimeError(context.get("message"))
+        event_loop.stop()
+
+    def run(self):
+
+        import asyncio
+
+        events.emit_main_thread("set-connection-stats")
+
+        event_loop = asyncio.SelectorEventLoop()
+        self._message_parser_pool.start()
+
+        try:
+            self._event_loop = event_loop
+            event_loop.set_exception_handler(self._handle_loop_exception)
+            event_loop.call_soon(self._process_timer)
+
+            # Process messages queued before the event loop existed
+            event_loop.call_soon(self._process_wakeup)
+            event_loop.run_forever()
+
+            if self._loop_error is not None:
+                raise self._loop_error
+
+        finally:
+            # Networking thread aborted
+            self._manual_server_disconnect = True
+            self._close_connection(self._server_conn)
+            self._message_parser_pool.stop()
+
+            if self._timer_handle is not None:
+                self._timer_handle.cancel()
+
+            self._event_loop = None
+            event_loop.close()
 
             # We're ready to quit
             events.emit_main_thread("quit")
+
+
+NETWORK_BACKENDS = {
+    "selectors": NetworkThread,
+    "asyncio": AsyncioNetworkThread
+}
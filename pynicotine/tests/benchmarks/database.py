@@ -0,0 +1,109 @@
+# SPDX-FileCopyrightText: 2026 Nicotine+ Contributors
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Benchmark opening share databases and looking up records, compared to
+the legacy pickle-based format, which required a scan of every record at
+open time.
+
+Usage: python3 -m pynicotine.tests.benchmarks.database [--records 200000]
+"""
+
+import argparse
+import mmap
+import os
+import pickle
+import random
+import shutil
+import tempfile
+import time
+
+from pynicotine.shares import FileDatabase
+from pynicotine.shares import RestrictedUnpickler
+
+
+def generate_records(num_records):
+
+    records = {}
+
+    for index in range(num_records):
+        quality = (320, 0, None, None) if index % 2 else (None, 0, 44100, 16)
+        records[f"/home/user/Music/Artist {index // 100}/Album/{index:02d} - Track.flac"] = [
+            f"Music\\Artist {index // 100}\\Album\\{index:02d} - Track.flac", random.randint(0, 1 << 32), quality, 240
+        ]
+
+    return records
+
+
+def benchmark(label, function, keys):
+
+    start_time = time.perf_counter()
+
+    for key in keys:
+        function(key)
+
+    elapsed = time.perf_counter() - start_time
+    print(f"{label:<20} {elapsed / len(keys) * 1e9:8.0f} ns/lookup")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=200000)
+    args = parser.parse_args()
+
+    temp_folder_path = tempfile.mkdtemp(prefix="nicotine-benchmark-")
+    db_path = os.path.join(temp_folder_path, "files.dbn").encode("utf-8")
+    legacy_db_path = os.path.join(temp_folder_path, "legacyfiles.dbn").encode("utf-8")
+
+    try:
+        records = generate_records(args.records)
+        keys = random.sample(list(records), k=min(len(records), 100000))
+
+        database = FileDatabase(db_path)
+        database.update(records)
+        database.close()
+
+        # Legacy format, pickled values
+        with open(legacy_db_path, "wb") as file_handle:
+            file_handle.write(FileDatabase.FILE_SIGNATURE + bytes([FileDatabase.LEGACY_VERSION]))
+
+            for key, value in records.items():
+                encoded_key = key.encode("utf-8")
+                pickled_value = pickle.dumps(value, protocol=5)
+
+                file_handle.write(FileDatabase.PACK_LENGTHS(len(encoded_key), len(pickled_value)))
+                file_handle.write(encoded_key + pickled_value)
+
+        start_time = time.perf_counter()
+
+        with open(legacy_db_path, "rb") as file_handle:
+            legacy_content = mmap.mmap(file_handle.fileno(), length=0, access=mmap.ACCESS_READ)
+
+        with memoryview(legacy_content) as legacy_content_view:
+            legacy_offsets = {
+                key: value_offset for key, _offset, value_offset, _value_length in FileDatabase._iter_items(
+                    legacy_content_view, len(legacy_content), version=FileDatabase.LEGACY_VERSION)
+            }
+
+        print(f"{'Legacy (pickle)':<20} {(time.perf_counter() - start_time) * 1000:8.1f} ms/open")
+
+        def legacy_lookup(key):
+            legacy_content.seek(legacy_offsets[key])
+            return RestrictedUnpickler(legacy_content).load()
+
+        start_time = time.perf_counter()
+        database = FileDatabase(db_path, overwrite=False)
+        print(f"{'Current':<20} {(time.perf_counter() - start_time) * 1000:8.1f} ms/open")
+
+        benchmark("Legacy (pickle)", legacy_lookup, keys)
+        benchmark("Current", database.__getitem__, keys)
+
+        database.close()
+        legacy_content.close()
+
+    finally:
+        shutil.rmtree(temp_folder_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# SPDX-FileCopyrightText: 2026 Nicotine+ Contributors
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Benchmark incoming search requests against synthetic shares.
+
+Shares are generated with words drawn from a Zipf distribution, and share
+databases are built with the scanner. A generated mix of single-word,
+multi-word, excluded-word and partial-word queries, or queries recorded
+in a file (one per line), is then replayed through the same lookup done
+for search requests from other users. Latency percentiles, throughput and
+peak memory usage are reported for each class of queries.
+
+Usage: python3 -m pynicotine.tests.benchmarks.incoming_search [--files 50000] [--vocabulary 20000]
+       [--zipf 1.1] [--depth 3] [--queries 2000] [--queries-file FILE] [--no-cache]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import string
+import tempfile
+import time
+
+from itertools import accumulate
+
+from pynicotine.config import config
+from pynicotine.core import core
+from pynicotine.events import events
+from pynicotine.shares import PermissionLevel
+
+FILE_EXTENSIONS = ("txt", "pdf", "zip", "iso", "jpg", "epub", "cue", "nfo")
+
+
+def generate_vocabulary(rng, num_words):
+
+    words = set()
+
+    while len(words) < num_words:
+        words.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))))
+
+    return sorted(words)
+
+
+def create_files(rng, folder_path, num_files, vocabulary, cum_weights, depth, files_per_folder=20):
+    """Create empty files in nested folders, and return the words of each
+    file path."""
+
+    def random_name(num_words):
+        return " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=num_words))
+
+    file_words = []
+    subfolder_path = folder_path
+
+    for index in range(num_files):
+        if index % files_per_folder == 0:
+            subfolder_path = os.path.join(folder_path, *(random_name(2) for _ in range(depth)))
+            os.makedirs(subfolder_path, exist_ok=True)
+
+        basename = f"{random_name(3)} {index}.{rng.choice(FILE_EXTENSIONS)}"
+
+        with open(os.path.join(subfolder_path, basename), "wb"):
+            pass
+
+        path_words = os.path.relpath(os.path.join(subfolder_path, basename), folder_path).replace(os.sep, " ")
+        file_words.append(path_words.replace(".", " ").split())
+
+    return file_words
+
+
+def generate_queries(rng, num_queries, vocabulary, cum_weights, file_words):
+
+    def random_file_words(num_words):
+        words = list(dict.fromkeys(rng.choice(file_words)))
+        return rng.sample(words, k=min(num_words, len(words)))
+
+    queries = {"single": [], "multi": [], "excluded": [], "partial": []}
+
+    for _ in range(num_queries):
+        queries["single"].append(rng.choices(vocabulary, cum_weights=cum_weights)[0])
+        queries["multi"].append(" ".join(random_file_words(rng.randint(2, 3))))
+
+        included_word, excluded_word = rng.choices(vocabulary, cum_weights=cum_weights, k=2)
+        queries["excluded"].append(f"{included_word} -{excluded_word}")
+
+        included_word, partial_word = random_file_words(2)
+        queries["partial"].append(f"{included_word} *{partial_word[-3:]}")
+
+    return queries
+
+
+def get_peak_memory_usage():
+    """Returns the peak resident set size of the process in MiB, or None if
+    unavailable on this platform."""
+
+    try:
+        import resource
+
+    except ImportError:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (1048576 if os.uname().sysname == "Darwin" else 1024)
+
+
+def replay_queries(label, queries, max_results):
+
+    latencies = []
+    start_time = time.perf_counter()
+
+    for query in queries:
+        query_start_time = time.perf_counter()
+        core.search._find_search_results(  # pylint: disable=protected-access
+            query, "benchmark", 1, PermissionLevel.PUBLIC, max_results)
+        latencies.append(time.perf_counter() - query_start_time)
+
+        # Discard responses queued for the main thread
+        events.process_thread_events()
+
+    elapsed = time.perf_counter() - start_time
+    latencies.sort()
+
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1000
+    peak_memory_usage = get_peak_memory_usage()
+    peak_memory_usage = "n/a" if peak_memory_usage is None else f"{peak_memory_usage:.0f} MiB"
+
+    print(f"{label:<10} p50 {p50:8.3f} ms   p99 {p99:8.3f} ms   {len(queries) / elapsed:10.0f} queries/s   "
+          f"peak RSS {peak_memory_usage}")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=50000)
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--zipf", type=float, default=1.1, help="exponent of the word frequency distribution")
+    parser.add_argument("--depth", type=int, default=3, help="number of folders in each file path")
+    parser.add_argument("--queries", type=int, default=2000, help="number of generated queries in each class")
+    parser.add_argument("--queries-file", help="replay queries from a file instead, one per line")
+    parser.add_argument("--no-cache", action="store_true", help="disable the search result cache")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    temp_folder_path = tempfile.mkdtemp(prefix="nicotine-benchmark-")
+    shares_folder_path = os.path.join(temp_folder_path, "shares")
+
+    try:
+        config.set_data_folder(os.path.join(temp_folder_path, "data"))
+        config.set_config_file(os.path.join(temp_folder_path, "data", "config"))
+        core.init_components(enabled_components={"search", "shares", "users"})
+
+        vocabulary = generate_vocabulary(rng, args.vocabulary)
+        cum_weights = list(accumulate(1 / (rank ** args.zipf) for rank in range(1, len(vocabulary) + 1)))
+
+        start_time = time.perf_counter()
+        file_words = create_files(rng, shares_folder_path, args.files, vocabulary, cum_weights, args.depth)
+        config.sections["transfers"]["shared"] = [("Benchmark", shares_folder_path)]
+
+        core.shares.rescan_shares(rebuild=True, use_thread=False)
+        core.shares.load_shares(
+            core.shares.share_dbs, core.shares.share_db_paths, destinations=core.shares.LOADED_DB_DESTINATIONS)
+        print(f"Generated and scanned {args.files} files in {time.perf_counter() - start_time:.1f} s")
+
+        if args.no_cache:
+            core.search.result_cache.max_size = 0
+
+        if args.queries_file:
+            with open(args.queries_file, encoding="utf-8") as file_handle:
+                queries = {"recorded": [line.strip() for line in file_handle if line.strip()]}
+        else:
+            queries = generate_queries(rng, args.queries, vocabulary, cum_weights, file_words)
+
+        max_results = config.sections["searches"]["maxresults"]
+
+        for label, class_queries in queries.items():
+            replay_queries(label, class_queries, max_results)
+
+        if not args.no_cache:
+            print(f"Result cache: {core.search.result_cache.hits} hits, {core.search.result_cache.misses} misses")
+
+    finally:
+        core.quit()
+        shutil.rmtree(temp_folder_path)
+
+
+if __name__ == "__main__":
+    main()
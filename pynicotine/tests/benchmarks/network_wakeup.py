@@ -0,0 +1,141 @@
+# SPDX-FileCopyrightText: 2026 Nicotine+ Contributors
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Benchmark how quickly the networking thread picks up messages queued by
+the main thread, and how much CPU time it uses while idle.
+
+The networking thread connects to a local dummy server that never replies,
+so the loop runs with a listening socket and a server connection, like an
+idle client. Messages are then queued one at a time, and the time until the
+networking thread starts processing each one is measured.
+
+Usage: python3 -m pynicotine.tests.benchmarks.network_wakeup [--messages 500] [--idle-duration 5]
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import tempfile
+import time
+
+from threading import Event
+
+from pynicotine.config import config
+from pynicotine.core import core
+from pynicotine.events import events
+from pynicotine.slskmessages import EmitNetworkMessageEvents
+from pynicotine.slskmessages import ServerConnect
+
+
+def instrument_network_thread(network_thread):
+    """Record when the networking thread picks up queued messages, and how
+    many times its loop waits for sockets."""
+
+    stats = {"loop_iterations": 0, "processed_time": 0.0}
+    processed_event = Event()
+    process_queue_messages = network_thread._process_queue_messages   # pylint: disable=protected-access
+    process_ready_sockets = network_thread._process_ready_sockets     # pylint: disable=protected-access
+    message_queue = network_thread._message_queue                     # pylint: disable=protected-access
+
+    def _process_queue_messages():
+        if not message_queue.empty():
+            stats["processed_time"] = time.perf_counter()
+            processed_event.set()
+
+        process_queue_messages()
+
+    def _process_ready_sockets(*args):
+        stats["loop_iterations"] += 1
+        process_ready_sockets(*args)
+
+    network_thread._process_queue_messages = _process_queue_messages  # pylint: disable=protected-access
+    network_thread._process_ready_sockets = _process_ready_sockets    # pylint: disable=protected-access
+    return stats, processed_event
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def benchmark_latency(stats, processed_event, num_messages):
+
+    latencies = []
+
+    for _ in range(num_messages):
+        processed_event.clear()
+        queued_time = time.perf_counter()
+        core.send_message_to_network_thread(EmitNetworkMessageEvents(msgs=[]))
+
+        if not processed_event.wait(timeout=5):
+            raise RuntimeError("Networking thread did not process queued message")
+
+        latencies.append(stats["processed_time"] - queued_time)
+
+        # Let the loop settle into waiting before queueing the next message
+        time.sleep(0.005)
+
+    latencies.sort()
+    print(f"Queue latency: p50 {percentile(latencies, 0.5) * 1000:.3f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.3f} ms, max {latencies[-1] * 1000:.3f} ms")
+
+
+def benchmark_idle(stats, duration):
+
+    start_iterations = stats["loop_iterations"]
+    start_cpu_time = time.process_time()
+
+    time.sleep(duration)
+
+    cpu_time = time.process_time() - start_cpu_time
+    num_iterations = stats["loop_iterations"] - start_iterations
+
+    print(f"Idle: {num_iterations / duration:.1f} wakeups/s, {cpu_time / duration * 100:.2f}% CPU")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--idle-duration", type=float, default=5)
+    args = parser.parse_args()
+
+    temp_folder_path = tempfile.mkdtemp(prefix="nicotine-benchmark-")
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+    try:
+        server_socket.bind(("127.0.0.1", 0))
+        server_socket.listen()
+
+        config.set_data_folder(os.path.join(temp_folder_path, "data"))
+        config.set_config_file(os.path.join(temp_folder_path, "data", "config"))
+        core.init_components(enabled_components={"network_thread"})
+        config.sections["server"]["upnp"] = False
+
+        stats, processed_event = instrument_network_thread(core._network_thread)  # pylint: disable=protected-access
+
+        core.start()
+        events.emit("enable-message-queue")
+        core.send_message_to_network_thread(
+            ServerConnect(addr=server_socket.getsockname(), login=("benchmark", "benchmark"), listen_port=0)
+        )
+        client_socket, _addr = server_socket.accept()
+
+        benchmark_latency(stats, processed_event, args.messages)
+        benchmark_idle(stats, args.idle_duration)
+
+        client_socket.close()
+
+    finally:
+        core.quit()
+
+        # Let the networking thread finish up, and process the quit event it emits
+        time.sleep(0.5)
+        events.process_thread_events()
+
+        server_socket.close()
+        shutil.rmtree(temp_folder_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# SPDX-FileCopyrightText: 2026 Nicotine+ Contributors
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Benchmark finding words ending with a partial search word (e.g. *ello),
+comparing a scan of every word in the word index with a binary search in
+the sorted table of reversed words.
+
+Usage: python3 -m pynicotine.tests.benchmarks.partial_search [--words 1000000]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import string
+import tempfile
+import time
+
+from pynicotine.shares import WordDatabase
+from pynicotine.shares import WordSuffixTable
+
+
+def generate_words(num_words):
+
+    words = set()
+    letters = string.ascii_lowercase + string.digits
+
+    while len(words) < num_words:
+        words.add("".join(random.choices(letters, k=random.randint(3, 12))))
+
+    return words
+
+
+def benchmark(label, function, partial_words):
+
+    start_time = time.perf_counter()
+    num_matches = 0
+
+    for partial_word in partial_words:
+        num_matches += function(partial_word)
+
+    elapsed = time.perf_counter() - start_time
+    print(f"{label:<20} {elapsed / len(partial_words) * 1000:10.3f} ms/search ({num_matches} matches)")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=1000000)
+    parser.add_argument("--searches", type=int, default=20)
+    args = parser.parse_args()
+
+    temp_folder_path = tempfile.mkdtemp(prefix="nicotine-benchmark-")
+    word_index_path = os.path.join(temp_folder_path, "words.dbn").encode("utf-8")
+    word_suffixes_path = os.path.join(temp_folder_path, "wordsuffixes.dbn").encode("utf-8")
+
+    try:
+        words = generate_words(args.words)
+        partial_words = [word[-random.randint(2, 4):] for word in random.sample(sorted(words), k=args.searches)]
+
+        word_index = WordDatabase(word_index_path)
+
+        for file_index, word in enumerate(words):
+            word_index[word] = [file_index]
+
+        word_index.close()
+
+        start_time = time.perf_counter()
+        word_suffixes = WordSuffixTable(word_suffixes_path)
+        word_suffixes.update(words)
+        word_suffixes.close()
+        print(f"{'Suffix table':<20} {(time.perf_counter() - start_time) * 1000:10.1f} ms/build")
+
+        word_index = WordDatabase(word_index_path, overwrite=False)
+        word_suffixes = WordSuffixTable(word_suffixes_path, overwrite=False)
+
+        def scan_word_index(partial_word):
+            return sum(1 for word in word_index if word.endswith(partial_word))
+
+        def search_word_suffixes(partial_word):
+            return sum(1 for _word in word_suffixes.iter_words_ending_with(partial_word))
+
+        benchmark("Word index scan", scan_word_index, partial_words)
+        benchmark("Suffix table", search_word_suffixes, partial_words)
+
+        word_index.close()
+        word_suffixes.close()
+
+    finally:
+        shutil.rmtree(temp_folder_path)
+
+
+if __name__ == "__main__":
+    main()
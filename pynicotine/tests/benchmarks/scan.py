@@ -0,0 +1,86 @@
+# SPDX-FileCopyrightText: 2026 Nicotine+ Contributors
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Benchmark share scanning throughput for different numbers of worker
+processes, rebuilds with cached audio metadata, as well as regular and
+incremental rescans of unchanged shares.
+
+Usage: python3 -m pynicotine.tests.benchmarks.scan [--files 5000] [--workers 1,2,4]
+"""
+
+import argparse
+import os
+import shutil
+import struct
+import tempfile
+import time
+import wave
+
+from pynicotine.config import config
+from pynicotine.core import core
+
+
+def create_audio_files(folder_path, num_files, files_per_folder=50):
+
+    for index in range(num_files):
+        subfolder_path = os.path.join(folder_path, f"album {index // files_per_folder}")
+        os.makedirs(subfolder_path, exist_ok=True)
+
+        with wave.open(os.path.join(subfolder_path, f"track {index}.wav"), "wb") as audio_file:
+            # pylint: disable=no-member
+            audio_file.setnchannels(2)
+            audio_file.setsampwidth(2)
+            audio_file.setframerate(44100)
+            audio_file.writeframes(struct.pack("h", 0) * 1024)
+
+
+def run_scan(num_workers, rebuild=True, incremental=False, metadata_cache=True):
+
+    config.sections["transfers"]["share_scan_workers"] = num_workers
+    config.sections["transfers"]["incremental_rescan"] = incremental
+
+    if not metadata_cache:
+        core.shares.remove_db_file(core.shares.share_db_paths["metadata"])
+
+    start_time = time.perf_counter()
+    core.shares.rescan_shares(rebuild=rebuild, use_thread=False)
+
+    return time.perf_counter() - start_time
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--workers", default=",".join(str(x) for x in (1, 2, 4, os.cpu_count() or 1)))
+    args = parser.parse_args()
+
+    temp_folder_path = tempfile.mkdtemp(prefix="nicotine-benchmark-")
+    shares_folder_path = os.path.join(temp_folder_path, "shares")
+
+    try:
+        config.set_data_folder(os.path.join(temp_folder_path, "data"))
+        config.set_config_file(os.path.join(temp_folder_path, "data", "config"))
+        core.init_components(enabled_components={"shares"})
+
+        create_audio_files(shares_folder_path, args.files)
+        config.sections["transfers"]["shared"] = [("Benchmark", shares_folder_path)]
+
+        for num_workers in sorted({int(x) for x in args.workers.split(",")}):
+            elapsed = run_scan(num_workers, metadata_cache=False)
+            print(f"Rebuild, {num_workers} worker(s): {elapsed:8.2f} s, {args.files / elapsed:10.0f} files/s")
+
+        elapsed = run_scan(num_workers=1)
+        print(f"Rebuild, cached metadata: {elapsed:8.2f} s, {args.files / elapsed:10.0f} files/s")
+
+        for incremental in (False, True):
+            elapsed = run_scan(num_workers=1, rebuild=False, incremental=incremental)
+            print(f"{'Incremental' if incremental else 'Regular'} rescan, unchanged shares: {elapsed:8.2f} s")
+
+    finally:
+        core.quit()
+        shutil.rmtree(temp_folder_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# SPDX-FileCopyrightText: 2026 Nicotine+ Contributors
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Benchmark building search responses from file records, comparing packing
+the file information of each decoded record with concatenating the file
+information packed in advance by the scanner.
+
+Usage: python3 -m pynicotine.tests.benchmarks.search_response [--results 5000]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from operator import itemgetter
+
+from pynicotine.shares import FileDatabase
+from pynicotine.slskmessages import FileSearchResponse
+
+
+def generate_records(num_records):
+
+    records = {}
+
+    for index in range(num_records):
+        quality = (320, 0, None, None) if index % 2 else (None, 0, 44100, 16)
+        records[f"/home/user/Music/Artist {index // 100}/Album/{index:02d} - Track.flac"] = [
+            f"Music\\Artist {index // 100}\\Album\\{index:02d} - Track.flac", random.randint(0, 1 << 32), quality, 240
+        ]
+
+    return records
+
+
+def benchmark(label, function, file_paths, duration=3):
+
+    start_time = time.perf_counter()
+    num_responses = 0
+
+    while time.perf_counter() - start_time < duration:
+        function(file_paths)
+        num_responses += 1
+
+    elapsed = time.perf_counter() - start_time
+    print(f"{label:<20} {num_responses / elapsed:8.1f} responses/s")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--results", type=int, default=5000)
+    args = parser.parse_args()
+
+    temp_folder_path = tempfile.mkdtemp(prefix="nicotine-benchmark-")
+    db_path = os.path.join(temp_folder_path, "files.dbn").encode("utf-8")
+
+    try:
+        records = generate_records(args.results)
+        file_paths = list(records)
+
+        database = FileDatabase(db_path)
+        database.update(records)
+        database.close()
+
+        database = FileDatabase(db_path, overwrite=False)
+
+        def pack_decoded_records(file_paths):
+            fileinfos = [database[file_path] for file_path in file_paths]
+            fileinfos.sort(key=itemgetter(0))
+
+            return FileSearchResponse(
+                search_username="nicotine", token=1, shares=fileinfos, freeulslots=True, ulspeed=0, inqueue=0
+            ).make_network_message()
+
+        def join_packed_records(file_paths):
+            fileinfos = [database.get_packed_file_info(file_path) for file_path in file_paths]
+            fileinfos.sort(key=itemgetter(0))
+
+            return FileSearchResponse(
+                search_username="nicotine", token=1, shares=FileSearchResponse.compress_result_list(fileinfos),
+                freeulslots=True, ulspeed=0, inqueue=0
+            ).make_network_message()
+
+        benchmark("Decode and pack", pack_decoded_records, file_paths)
+        benchmark("Packed records", join_packed_records, file_paths)
+
+        database.close()
+
+    finally:
+        shutil.rmtree(temp_folder_path)
+
+
+if __name__ == "__main__":
+    main()
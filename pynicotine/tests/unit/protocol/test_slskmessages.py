@@ -1,6 +1,9 @@
 # SPDX-FileCopyrightText: 2020-2026 Nicotine+ Contributors
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import zlib
+
+from io import BytesIO
 from unittest import TestCase
 
 from pynicotine.slskmessages import AckNotifyPrivileges
@@ -9,6 +12,8 @@ from pynicotine.slskmessages import CancelRoomMembership
 from pynicotine.slskmessages import CancelRoomOwnership
 from pynicotine.slskmessages import ChangePassword
 from pynicotine.slskmessages import FileSearch
+from pynicotine.slskmessages import FileListMessage
+from pynicotine.slskmessages import FileSearchResponse
 from pynicotine.slskmessages import GetPeerAddress
 from pynicotine.slskmessages import GetUserStatus
 from pynicotine.slskmessages import JoinGlobalRoom
@@ -21,6 +26,9 @@ from pynicotine.slskmessages import RoomSomething
 from pynicotine.slskmessages import SayChatroom
 from pynicotine.slskmessages import SetStatus
 from pynicotine.slskmessages import SetWaitPort
+from pynicotine.slskmessages import SharedFileListParser
+from pynicotine.slskmessages import SharedFileListResponse
+from pynicotine.slskmessages import SharesListSegment
 from pynicotine.slskmessages import SlskMessage
 from pynicotine.slskmessages import UnwatchUser
 from pynicotine.slskmessages import WatchUser
@@ -328,3 +336,129 @@ class RemoveRoomMemberMessageTest(TestCase):
         # Assert
         self.assertEqual(obj.room, "room7")
         self.assertEqual(obj.user, "admin")
+
+
+class SharedFileListResponseMessageTest(TestCase):
+
+    def test_make_network_message_from_segments(self):
+        # Arrange
+        file_content = b"\x01\x05\x00\x00\x00a.mp3\x10\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+        share_groups = (
+            {"Public\\folder": b"\x01\x00\x00\x00" + file_content, "Public\\empty": b"\x00\x00\x00\x00"},
+            {"Buddy\\folder": b"\x01\x00\x00\x00" + file_content},
+            {"Trusted\\folder": b"\x00\x00\x00\x00"}
+        )
+        segments = []
+
+        for shares in share_groups:
+            file_handle = BytesIO()
+            SharesListSegment.write(file_handle, shares)
+            segments.append(SharesListSegment.from_buffer(file_handle.getvalue()))
+
+        for permission_level in ("public", "buddy", "trusted"):
+            obj = SharedFileListResponse(*share_groups, permission_level=permission_level)
+            segment_obj = SharedFileListResponse(*segments, permission_level=permission_level)
+
+            # Act
+            message = obj.make_network_message()
+            segment_message = segment_obj.make_network_message()
+
+            # Assert
+            self.assertEqual(zlib.decompress(segment_message), zlib.decompress(message))
+
+            # Joined segments are reused for later responses
+            self.assertIs(segment_obj.make_network_message(), segment_message)
+
+    def test_parse_network_message_in_chunks(self):
+        # Arrange
+        def pack_folder(folder_index, num_files):
+            folder = bytearray(SharedFileListResponse.pack_uint32(num_files))
+
+            for file_index in reversed(range(num_files)):
+                folder += FileListMessage.pack_file_info(
+                    [f"{file_index:03d} - Track.flac", 30000000 + file_index, (None, 0, 44100, 16), 240])
+
+            return SharedFileListResponse.pack_string(f"Music/{folder_index:03d}") + folder
+
+        public_folders = [pack_folder(folder_index, folder_index % 40) for folder_index in reversed(range(100))]
+        private_folders = [pack_folder(folder_index, 3) for folder_index in range(100, 105)]
+        message = zlib.compress(
+            SharedFileListResponse.pack_uint32(len(public_folders)) + b"".join(public_folders)
+            + SharedFileListResponse.pack_uint32(0)
+            + SharedFileListResponse.pack_uint32(len(private_folders)) + b"".join(private_folders)
+        )
+
+        expected_obj = SharedFileListResponse(msg_content=memoryview(message))
+        expected_obj.parse_network_message()
+
+        def get_folders(folders):
+            return [
+                (folder_path, [(code, name, size, ext, attrs.as_dict()) for code, name, size, ext, attrs in files])
+                for folder_path, files in folders
+            ]
+
+        for chunk_size in (1, 7, 4096):
+            parser = SharedFileListParser(SharedFileListResponse())
+            num_public_folders = num_private_folders = 0
+
+            # Act
+            for offset in range(0, len(message), chunk_size):
+                new_public_folders, new_private_folders = parser.feed(message[offset:offset + chunk_size])
+                num_public_folders += len(new_public_folders)
+                num_private_folders += len(new_private_folders)
+
+            obj = parser.finish()
+
+            # Assert
+            self.assertEqual(num_public_folders, 100)
+            self.assertEqual(num_private_folders, 5)
+            self.assertEqual(get_folders(obj.list), get_folders(expected_obj.list))
+            self.assertEqual(get_folders(obj.privatelist), get_folders(expected_obj.privatelist))
+            self.assertEqual(obj.list[0][0], "Music\\000")
+
+    def test_parse_incomplete_network_message_in_chunks(self):
+        # Arrange
+        message = zlib.compress(SharedFileListResponse.pack_uint32(2) + SharedFileListResponse.pack_string("Music"))
+        parser = SharedFileListParser(SharedFileListResponse())
+
+        # Act
+        new_public_folders, _new_private_folders = parser.feed(message)
+
+        # Assert
+        self.assertEqual(new_public_folders, [])
+        self.assertRaises(ValueError, parser.finish)
+
+
+class FileSearchResponseMessageTest(TestCase):
+
+    def test_make_network_message_from_segments(self):
+        # Arrange
+        fileinfos = [
+            ["Music\\Artist\\01 - Track.flac", 30000000, (None, 0, 44100, 16), 240],
+            ["Music\\Artist\\02 - Track.mp3", 5000000, (320, 0, None, None), 180]
+        ]
+        private_fileinfos = [["Secrets\\03 - Track.ogg", 4000000, (None, 0, None, None), None]]
+
+        def pack_file_infos(fileinfos):
+            return [(fileinfo[0], FileListMessage.pack_file_info(fileinfo)) for fileinfo in fileinfos]
+
+        for private_list in (private_fileinfos, []):
+            obj = FileSearchResponse(
+                search_username="nicotine", token=1234, shares=fileinfos, freeulslots=True, ulspeed=50000,
+                inqueue=2, private_shares=private_list
+            )
+            segment_obj = FileSearchResponse(
+                search_username="nicotine", token=1234,
+                shares=FileSearchResponse.compress_result_list(pack_file_infos(fileinfos)),
+                freeulslots=True, ulspeed=50000, inqueue=2,
+                private_shares=(
+                    FileSearchResponse.compress_result_list(pack_file_infos(private_list)) if private_list else None
+                )
+            )
+
+            # Act
+            message = obj.make_network_message()
+            segment_message = segment_obj.make_network_message()
+
+            # Assert
+            self.assertEqual(zlib.decompress(segment_message), zlib.decompress(message))
@@ -2,12 +2,15 @@
 # SPDX-FileCopyrightText: 2020 Lene Preuss <lene.preuss@gmail.com>
 # SPDX-License-Identifier: GPL-3.0-or-later
 
+import io
 import os
 import pickle
 import selectors
 import shutil
 import socket
+import struct
 import sys
+import time
 
 from time import sleep
 from unittest import TestCase
@@ -18,11 +21,23 @@ from unittest.mock import patch
 from pynicotine.config import config
 from pynicotine.core import core
 from pynicotine.events import events
+from pynicotine.slskmessages import PEER_MESSAGE_CODES
+from pynicotine.slskmessages import SERVER_MESSAGE_CODES
+from pynicotine.slskmessages import FileListMessage
+from pynicotine.slskmessages import Login
+from pynicotine.slskmessages import PeerInit
 from pynicotine.slskmessages import ServerConnect, SetWaitPort
+from pynicotine.slskmessages import SharedFileListResponse
+from pynicotine.slskmessages import UploadFile
+from pynicotine.slskmessages import UserInfoResponse
+from pynicotine.slskproto import AsyncioNetworkThread
+from pynicotine.slskproto import NetworkThread
+from pynicotine.slskproto import PeerConnection
 from pynicotine.utils import encode_path
 
 DATA_FOLDER_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "temp_data")
 SLSKPROTO_RUN_TIME = 1.5  # Time (in s) needed for SoulseekNetworkThread main loop to run at least once
+DEFAULT_SELECTOR = selectors.DefaultSelector
 
 
 class MockSocket(Mock):
@@ -128,3 +143,360 @@ class SoulseekNetworkTest(TestCase):
         core.send_message_to_server(SetWaitPort(1))
 
         sleep(SLSKPROTO_RUN_TIME)
+
+
+class AsyncioNetworkTest(TestCase):
+
+    def setUp(self):
+
+        # Undo selector mocking in other tests, the asyncio event loop needs a real selector
+        selectors.DefaultSelector = DEFAULT_SELECTOR
+
+        config.set_data_folder(DATA_FOLDER_PATH)
+        config.set_config_file(os.path.join(DATA_FOLDER_PATH, "temp_config"))
+        os.makedirs(DATA_FOLDER_PATH, exist_ok=True)
+
+        with open(encode_path(config.config_file_path), "w", encoding="utf-8") as file_handle:
+            file_handle.write("[server]\nnetwork_backend = asyncio\nupnp = False\n")
+
+        core.init_components(enabled_components={"network_thread"})
+
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.settimeout(SLSKPROTO_RUN_TIME * 2)
+        self.server_socket.bind(("127.0.0.1", 0))
+        self.server_socket.listen()
+
+        core.start()
+        events.emit("enable-message-queue")
+
+    def tearDown(self):
+
+        core.quit()
+
+        # pylint: disable=protected-access
+        core._network_thread.join(timeout=SLSKPROTO_RUN_TIME)
+        self.assertFalse(core._network_thread.is_alive())
+
+        events.process_thread_events()
+        self.server_socket.close()
+
+        # Config values persist in memory between tests
+        config.sections["server"]["network_backend"] = "selectors"
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(DATA_FOLDER_PATH)
+
+    def test_server_login(self):
+
+        self.assertIsInstance(core._network_thread, AsyncioNetworkThread)  # pylint: disable=protected-access
+
+        core.send_message_to_network_thread(
+            ServerConnect(addr=self.server_socket.getsockname(), login=("dummy", "dummy"), listen_port=0)
+        )
+        client_socket, _addr = self.server_socket.accept()
+        client_socket.settimeout(SLSKPROTO_RUN_TIME * 2)
+
+        with client_socket:
+            data = client_socket.recv(8)
+
+        _msg_size, msg_code = struct.unpack("<II", data)
+        self.assertEqual(msg_code, SERVER_MESSAGE_CODES[Login])
+
+
+class FileUploadTest(TestCase):
+
+    def setUp(self):
+
+        config.set_data_folder(DATA_FOLDER_PATH)
+        config.set_config_file(os.path.join(DATA_FOLDER_PATH, "temp_config"))
+
+        core.init_components(enabled_components={"network_thread"})
+
+        # pylint: disable=protected-access
+        self.network_thread = core._network_thread
+        self.network_thread._selector = DEFAULT_SELECTOR()
+
+        self.file_path = os.path.join(DATA_FOLDER_PATH, "upload")
+        self.file_data = os.urandom(1000000)
+
+        with open(encode_path(self.file_path), "wb") as file_handle:
+            file_handle.write(self.file_data)
+
+    def tearDown(self):
+
+        self.network_thread._selector.close()  # pylint: disable=protected-access
+        os.remove(encode_path(self.file_path))
+
+        # Networking thread was never started, quit directly
+        events.emit("quit")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(DATA_FOLDER_PATH)
+
+    def upload_file(self, file_handle, upload_limit=0, max_writes=None):
+        """Upload the file over a socket pair, and return the received data,
+        number of writes needed, whether sendfile() was used and whether the
+        upload failed."""
+
+        # pylint: disable=protected-access
+        network_thread = self.network_thread
+        sender_sock, receiver_sock = socket.socketpair()
+        sender_sock.setblocking(False)
+        receiver_sock.setblocking(False)
+        received_data = bytearray()
+        num_writes = 0
+        is_failed = False
+
+        conn = network_thread._conns[sender_sock] = PeerConnection(
+            sock=sender_sock, addr=("127.0.0.1", 0), io_events=selectors.EVENT_READ,
+            init=PeerInit(init_user="dummy", target_user="user", conn_type="F")
+        )
+        network_thread._register_socket(sender_sock, conn.io_events)
+        network_thread._process_internal_messages(
+            UploadFile(sock=sender_sock, token=1, file=file_handle, size=len(self.file_data)))
+        network_thread._upload_limit_split = upload_limit
+
+        # Upload from an offset, like when resuming a partial upload
+        network_thread._process_file_offset_message(conn, bytearray(struct.pack("<Q", 1000)))
+        upload = network_thread._file_upload_msgs[conn]
+
+        with receiver_sock:
+            while conn.io_events & selectors.EVENT_WRITE:
+                is_failed = not network_thread._write_data(conn, 0)
+
+                try:
+                    received_data += receiver_sock.recv(len(self.file_data))
+
+                except BlockingIOError:
+                    # Nothing sent yet
+                    pass
+
+                if is_failed:
+                    break
+
+                num_writes += 1
+
+                if upload_limit:
+                    # Bandwidth limit cycle
+                    self.assertLessEqual(network_thread._conns_uploaded[conn], upload_limit)
+                    network_thread._conns_uploaded.clear()
+
+                if max_writes is not None and num_writes >= max_writes:
+                    break
+
+            is_sendfile_upload = (conn in network_thread._sendfile_upload_conns)
+            network_thread._close_connection(conn)
+
+        return received_data, num_writes, is_sendfile_upload, is_failed
+
+    def test_sendfile_upload(self):
+
+        with open(encode_path(self.file_path), "rb") as file_handle:
+            received_data, _num_writes, is_sendfile_upload, is_failed = self.upload_file(file_handle)
+
+        self.assertEqual(received_data, self.file_data[1000:])
+        self.assertEqual(is_sendfile_upload, NetworkThread.USE_SENDFILE)
+        self.assertFalse(is_failed)
+
+    def test_sendfile_upload_limit(self):
+
+        with open(encode_path(self.file_path), "rb") as file_handle:
+            received_data, num_writes, _is_sendfile_upload, _is_failed = self.upload_file(
+                file_handle, upload_limit=4096, max_writes=10)
+
+        self.assertEqual(received_data, self.file_data[1000:1000 + 40960])
+        self.assertEqual(num_writes, 10)
+
+    def test_sendfile_upload_truncated_file(self):
+        """Uploads fail when the file is truncated during the upload, instead
+        of waiting for more data forever."""
+
+        if not NetworkThread.USE_SENDFILE:
+            self.skipTest("sendfile() is not available")
+
+        upload_errors = []
+
+        def upload_file_error(username, token, error):
+            upload_errors.append((username, token, error))
+
+        events.connect("upload-file-error", upload_file_error)
+
+        with open(encode_path(self.file_path), "rb") as file_handle:
+            os.truncate(encode_path(self.file_path), 500000)
+            received_data, _num_writes, is_sendfile_upload, is_failed = self.upload_file(file_handle)
+
+        events.process_thread_events()
+        events.disconnect("upload-file-error", upload_file_error)
+
+        self.assertEqual(received_data, self.file_data[1000:500000])
+        self.assertTrue(is_sendfile_upload)
+        self.assertTrue(is_failed)
+        self.assertEqual(len(upload_errors), 1)
+        self.assertIsInstance(upload_errors[0][2], EOFError)
+
+    def test_buffered_upload_fallback(self):
+        """Uploads of files without a file descriptor fall back to reading the
+        file into the output buffer."""
+
+        received_data, _num_writes, is_sendfile_upload, _is_failed = self.upload_file(io.BytesIO(self.file_data))
+
+        self.assertEqual(received_data, self.file_data[1000:])
+        self.assertFalse(is_sendfile_upload)
+
+
+class PeerMessageParsingTest(TestCase):
+
+    def setUp(self):
+
+        config.set_data_folder(DATA_FOLDER_PATH)
+        config.set_config_file(os.path.join(DATA_FOLDER_PATH, "temp_config"))
+
+        core.init_components(enabled_components={"network_thread"})
+
+        self.network_thread = core._network_thread  # pylint: disable=protected-access
+        self.received_msgs = []
+        self.received_folders = []
+
+        events.connect("shared-file-list-folders", self.shared_file_list_folders)
+        events.connect("shared-file-list-response", self.received_msgs.append)
+        events.connect("user-info-response", self.received_msgs.append)
+
+    def tearDown(self):
+
+        self.network_thread._message_parser_pool.stop()  # pylint: disable=protected-access
+
+        events.disconnect("shared-file-list-folders", self.shared_file_list_folders)
+        events.disconnect("shared-file-list-response", self.received_msgs.append)
+        events.disconnect("user-info-response", self.received_msgs.append)
+
+        # Networking thread was never started, quit directly
+        events.emit("quit")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(DATA_FOLDER_PATH)
+
+    def shared_file_list_folders(self, username, public_folders, private_folders):
+        self.received_folders.append((username, public_folders, private_folders))
+
+    def create_peer_connection(self):
+
+        # pylint: disable=protected-access
+        sock, other_sock = socket.socketpair()
+        self.addCleanup(sock.close)
+        self.addCleanup(other_sock.close)
+
+        for msg_class in (SharedFileListResponse, UserInfoResponse):
+            self.network_thread._allowed_message_responses[msg_class].add("user")
+
+        return PeerConnection(
+            sock=sock, addr=("127.0.0.1", 0), init=PeerInit(init_user="dummy", target_user="user", conn_type="P"))
+
+    @staticmethod
+    def pack_peer_message(msg):
+        msg_content = msg.make_network_message()
+        return struct.pack("<II", len(msg_content) + 4, PEER_MESSAGE_CODES[msg.__class__]) + msg_content
+
+    def process_peer_messages(self, msgs):
+        """Feed packed messages to a peer connection, and return the
+        connection."""
+
+        conn = self.create_peer_connection()
+
+        for msg in msgs:
+            conn.in_buffer += self.pack_peer_message(msg)
+
+        self.network_thread._process_peer_input(conn)  # pylint: disable=protected-access
+        return conn
+
+    def wait_for_msgs(self, num_msgs):
+
+        end_time = time.monotonic() + SLSKPROTO_RUN_TIME
+
+        while len(self.received_msgs) < num_msgs and time.monotonic() < end_time:
+            events.process_thread_events()
+            sleep(0.01)
+
+    def test_parse_large_messages_in_worker(self):
+
+        small_pic = b"small"
+        large_pic = os.urandom(NetworkThread.MIN_WORKER_PARSED_MESSAGE_SIZE * 4)
+        conn = self.process_peer_messages([
+            UserInfoResponse(descr="first", pic=small_pic, totalupl=1, queuesize=0, slotsavail=True, uploadallowed=0),
+            UserInfoResponse(descr="second", pic=large_pic, totalupl=2, queuesize=0, slotsavail=True, uploadallowed=0),
+            UserInfoResponse(descr="third", pic=small_pic, totalupl=3, queuesize=0, slotsavail=True, uploadallowed=0)
+        ])
+        self.assertFalse(conn.in_buffer)
+
+        # Small messages are parsed right away, large messages wait for a parser worker.
+        # Later messages on the same connection wait for them too.
+        events.process_thread_events()
+        self.assertEqual([msg.descr for msg in self.received_msgs], ["first"])
+
+        self.network_thread._message_parser_pool.start()  # pylint: disable=protected-access
+        self.wait_for_msgs(3)
+        self.assertEqual([msg.descr for msg in self.received_msgs], ["first", "second", "third"])
+
+        msg = self.received_msgs[1]
+        self.assertEqual(msg.pic, large_pic)
+        self.assertEqual(msg.username, "user")
+        self.assertIs(msg.sock, conn.sock)
+
+    def test_parse_whole_buffer_in_worker(self):
+
+        large_pic = os.urandom(NetworkThread.MIN_WORKER_PARSED_MESSAGE_SIZE * 4)
+
+        self.network_thread._message_parser_pool.start()  # pylint: disable=protected-access
+        conn = self.process_peer_messages([
+            UserInfoResponse(descr="large", pic=large_pic, totalupl=1, queuesize=0, slotsavail=True, uploadallowed=0)
+        ])
+
+        # Buffer was handed over to the worker, and replaced with an empty one
+        self.assertEqual(conn.in_buffer, bytearray())
+
+        self.wait_for_msgs(1)
+        self.assertEqual(self.received_msgs[0].pic, large_pic)
+
+    def test_parse_shares_list_while_receiving(self):
+
+        # pylint: disable=protected-access
+        shares = {
+            f"Music\\{folder_index:04d}": SharedFileListResponse.pack_uint32(1) + FileListMessage.pack_file_info(
+                [f"{os.urandom(16).hex()}.mp3", folder_index, None, None])
+            for folder_index in reversed(range(2000))
+        }
+        data = (
+            self.pack_peer_message(SharedFileListResponse(public_shares=shares, permission_level="public"))
+            + self.pack_peer_message(
+                UserInfoResponse(descr="after", pic=None, totalupl=1, queuesize=0, slotsavail=True, uploadallowed=0))
+        )
+        self.assertGreater(len(data), NetworkThread.MIN_WORKER_PARSED_MESSAGE_SIZE * 2)
+
+        self.network_thread._message_parser_pool.start()
+        conn = self.create_peer_connection()
+        chunk_size = 4096
+
+        for offset in range(0, len(data), chunk_size):
+            conn.in_buffer += data[offset:offset + chunk_size]
+            self.network_thread._process_peer_input(conn)
+
+            if offset == 0:
+                self.assertIsNotNone(conn.shares_list_stream)
+
+        # Messages following the shares list are processed as usual
+        self.assertIsNone(conn.shares_list_stream)
+        self.assertFalse(conn.in_buffer)
+
+        self.wait_for_msgs(2)
+        msg, after_msg = self.received_msgs
+        folder_paths = [folder_path for _username, public_folders, _private_folders in self.received_folders
+                        for folder_path, _files in public_folders]
+
+        self.assertEqual(msg.username, "user")
+        self.assertIs(msg.sock, conn.sock)
+        self.assertEqual([folder_path for folder_path, _files in msg.list], sorted(shares))
+        self.assertEqual(sorted(folder_paths), sorted(shares))
+        self.assertEqual(msg.list[1][1][0][2], 1)
+        self.assertEqual(after_msg.descr, "after")
@@ -2,16 +2,27 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import os
+import random
 import shutil
 
-from collections import UserDict
+from threading import Event
 from unittest import TestCase
+from unittest.mock import patch
 
 from pynicotine.config import config
 from pynicotine.core import core
+from pynicotine.search import PhraseMatcher
 from pynicotine.search import ResultFilterMode
+from pynicotine.search import SearchRequestLimiter
+from pynicotine.search import SearchRequestQueue
+from pynicotine.search import SearchResultCache
+from pynicotine.shares import FileDatabase
 from pynicotine.shares import PermissionLevel
+from pynicotine.shares import StringTable
+from pynicotine.shares import WordSuffixTable
+from pynicotine.slskmessages import FileListMessage
 from pynicotine.slskmessages import increment_token
+from pynicotine.utils import encode_path
 
 CURRENT_FOLDER_PATH = os.path.dirname(os.path.realpath(__file__))
 DATA_FOLDER_PATH = os.path.join(CURRENT_FOLDER_PATH, "temp_data")
@@ -197,7 +208,7 @@ class SearchTest(TestCase):
 
         results = core.search._create_search_result_list(
             included_words, excluded_words, partial_words, max_results, word_index)
-        self.assertEqual(results, {37, 38})
+        self.assertEqual(results, [37, 38])
 
         included_words = {"lts", "iso"}
         excluded_words = {"linux", "game", "music", "cd"}
@@ -215,32 +226,255 @@ class SearchTest(TestCase):
             included_words, excluded_words, partial_words, max_results, word_index)
         self.assertIsNone(results)
 
+        # Results are limited to max_results
+        results = core.search._create_search_result_list({"iso"}, {"linux"}, set(), 2, word_index)
+        self.assertEqual(results, [34, 37])
+
+        results = core.search._create_search_result_list({"iso"}, set(), {"stem"}, 1, word_index)
+        self.assertEqual(results, [37])
+
+        # Partial words looked up in the sorted table of reversed words
+        table_path = encode_path(os.path.join(DATA_FOLDER_PATH, "wordsuffixes.dbn"))
+        word_suffixes = WordSuffixTable(table_path)
+        word_suffixes.update(word_index)
+        word_suffixes.close()
+
+        word_suffixes = WordSuffixTable(table_path, overwrite=False)
+        self.addCleanup(word_suffixes.close)
+
+        for partial_words, expected_results in (
+            ({"stem"}, [37, 38]),
+            ({"nux"}, [35, 36]),
+            ({"s"}, None),
+            ({"ibberish"}, None)
+        ):
+            with self.subTest(partial_words=partial_words):
+                results = core.search._create_search_result_list(
+                    {"iso"}, set(), partial_words, max_results, word_index, word_suffixes)
+                self.assertEqual(results, expected_results)
+
+    def test_match_sorted(self):
+        """Test matching sorted index sequences with galloping search,
+        compared to set operations."""
+
+        rng = random.Random(0)
+
+        for _ in range(50):
+            included_indices = [
+                sorted(rng.sample(range(2000), rng.randint(1, 1000))) for _ in range(rng.randint(1, 3))
+            ]
+            excluded_indices = [sorted(rng.sample(range(2000), rng.randint(1, 500))) for _ in range(rng.randint(0, 2))]
+            expected_results = set(included_indices[0]).intersection(*included_indices[1:])
+            expected_results = sorted(expected_results.difference(*excluded_indices))
+
+            included_indices.sort(key=len)
+            results = core.search._match_sorted(included_indices[0], included_indices[1:], excluded_indices)
+            self.assertEqual(results, expected_results)
+
+            results = core.search._match_sorted(included_indices[0], included_indices[1:], excluded_indices, 10)
+            self.assertEqual(results, expected_results[:10])
+
+            self.assertEqual(
+                core.search._intersect_sorted(included_indices[0], included_indices[-1]),
+                sorted(set(included_indices[0]).intersection(included_indices[-1]))
+            )
+
+    def test_search_result_cache(self):
+        """Test evicting least recently used results from the search result
+        cache, and clearing it when share databases change."""
+
+        result_cache = SearchResultCache(max_size=2)
+        word_index = {}
+
+        generation = result_cache.get_generation(word_index)
+        result_cache.add("iso", (1, None, None), generation)
+        result_cache.add("linux", (0, None, None), generation)
+
+        self.assertEqual(result_cache.get("iso"), (1, None, None))
+        self.assertIsNone(result_cache.get("lts"))
+
+        # Least recently used results are removed first
+        result_cache.add("lts", (3, None, None), generation)
+
+        self.assertEqual(len(result_cache), 2)
+        self.assertIsNone(result_cache.get("linux"))
+        self.assertEqual(result_cache.get("iso"), (1, None, None))
+        self.assertEqual(result_cache.get("lts"), (3, None, None))
+        self.assertEqual((result_cache.hits, result_cache.misses), (3, 2))
+        self.assertIs(result_cache.word_index, word_index)
+        self.assertEqual(result_cache.get_generation(word_index), generation)
+
+        new_word_index = {}
+        new_generation = result_cache.get_generation(new_word_index)
+
+        self.assertEqual(len(result_cache), 0)
+        self.assertIs(result_cache.word_index, new_word_index)
+        self.assertGreater(new_generation, generation)
+
+        # Results looked up before the cache was cleared, e.g. when excluded phrases
+        # changed, are not cached
+        result_cache.clear(new_word_index)
+        result_cache.add("iso", (1, None, None), new_generation)
+
+        self.assertEqual(len(result_cache), 0)
+
+    def test_excluded_phrases_clear_result_cache(self):
+        """Test that results looked up while excluded phrases change are not
+        cached."""
+
+        result_cache = core.search.result_cache
+        generation = result_cache.get_generation(result_cache.word_index)
+
+        core.search.excluded_phrases = ["linux"]
+        result_cache.add("linux", (1, None, None), generation)
+
+        self.assertIsNone(result_cache.get("linux"))
+
+    def test_search_request_queue(self):
+        """Test dropping the oldest search requests when the queue is full,
+        and processing the remaining ones in worker threads."""
+
+        processed_requests = []
+        all_processed = Event()
+
+        def process_request(search_term, username):
+            processed_requests.append((search_term, username))
+
+            if len(processed_requests) == 2:
+                all_processed.set()
+
+        request_queue = SearchRequestQueue(callback=process_request, num_workers=1, max_size=2)
+
+        request_queue.put("iso", "user1")
+        request_queue.put("linux", "user2")
+        request_queue.put("lts", "user3")
+
+        self.assertEqual(len(request_queue), 2)
+        self.assertEqual(request_queue.num_dropped, 1)
+
+        request_queue.start()
+        self.assertTrue(all_processed.wait(timeout=5))
+        request_queue.stop()
+
+        self.assertEqual(processed_requests, [("linux", "user2"), ("lts", "user3")])
+        self.assertEqual(request_queue.num_processed, 2)
+        self.assertGreater(request_queue.average_latency, 0)
+        self.assertGreaterEqual(request_queue.max_latency, request_queue.average_latency)
+
+    def test_search_request_limiter(self):
+        """Test rejecting search requests exceeding the per-user and global
+        rate limits."""
+
+        request_limiter = SearchRequestLimiter()
+        user_rate = 60  # 10 requests per burst, refills one token per second
+        global_rate = 120  # 20 requests per burst
+
+        for _ in range(10):
+            self.assertTrue(request_limiter.allow("user1", user_rate, global_rate, current_time=0))
+
+        self.assertFalse(request_limiter.allow("user1", user_rate, global_rate, current_time=0))
+        self.assertEqual(request_limiter.num_rejected_user, 1)
+
+        # Other users have their own bucket, until the global bucket is empty
+        for _ in range(10):
+            self.assertTrue(request_limiter.allow("user2", user_rate, global_rate, current_time=0))
+
+        self.assertFalse(request_limiter.allow("user3", user_rate, global_rate, current_time=0))
+        self.assertEqual(request_limiter.num_rejected_global, 1)
+
+        # Buckets refill over time
+        self.assertTrue(request_limiter.allow("user1", user_rate, global_rate, current_time=1))
+        self.assertFalse(request_limiter.allow("user1", user_rate, global_rate, current_time=1))
+
+        # Disabled limits
+        self.assertTrue(request_limiter.allow("user1", 0, 0, current_time=1))
+        self.assertEqual(request_limiter.num_accepted, 22)
+
+    def test_search_request_limiter_prune(self):
+        """Test that the least recently used buckets are removed when there
+        are too many of them, keeping the limits of users that are currently
+        searching."""
+
+        request_limiter = SearchRequestLimiter()
+        user_rate = 60
+        patcher = patch.object(SearchRequestLimiter, "MAX_USER_BUCKETS", 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        for _ in range(10):
+            self.assertTrue(request_limiter.allow("flooder", user_rate, 0, current_time=0))
+
+        for username in ("user1", "user2", "user3", "user4"):
+            self.assertTrue(request_limiter.allow(username, user_rate, 0, current_time=0))
+
+        # Bucket of the flooding user was used least recently, and removed
+        self.assertTrue(request_limiter.allow("flooder", user_rate, 0, current_time=0))
+
+        for _ in range(9):
+            self.assertTrue(request_limiter.allow("flooder", user_rate, 0, current_time=0))
+
+        # Requests from many other users don't reset the bucket of a user searching at the same time
+        for username in ("user5", "user6", "user7", "user8"):
+            self.assertTrue(request_limiter.allow(username, user_rate, 0, current_time=0))
+            self.assertFalse(request_limiter.allow("flooder", user_rate, 0, current_time=0))
+
+    def test_phrase_matcher(self):
+        """Test finding phrases with the Aho-Corasick automaton, compared to
+        searching for each phrase."""
+
+        rng = random.Random(0)
+        phrases = ["linux distro", "netbsd", "he", "she", "his", "hers", "distro x", "tro", "x86", "bsd iso"]
+        matcher = PhraseMatcher(phrases)
+        texts = ["".join(rng.choices("adehilnorstux 86b", k=rng.randint(0, 40))) for _ in range(2000)]
+        texts += ["virtual\\isos\\linux distro x86.iso", "ushers", "netbsd iso"]
+
+        for text in texts:
+            expected_phrases = {phrase for phrase in phrases if phrase in text}
+            phrase = matcher.find(text)
+
+            if expected_phrases:
+                self.assertIn(phrase, expected_phrases)
+            else:
+                self.assertIsNone(phrase)
+
+        self.assertIsNone(PhraseMatcher().find("linux"))
+        self.assertEqual(PhraseMatcher(["netbsd"]).find("virtual\\netbsd.iso"), "netbsd")
+
     def test_exclude_server_phrases(self):
         """Verify that results containing excluded phrases are not included."""
 
         core.search.excluded_phrases = ["linux distro", "netbsd"]
-        results = {0, 1, 2, 3, 4, 5}
-        public_share_db = core.shares.share_dbs["public_files"] = UserDict({
+        results = [0, 1, 2, 3, 4, 5]
+        public_files = {
             "real\\isos\\freebsd.iso": ["virtual\\isos\\freebsd.iso", 1000, None, None],
             "real\\isos\\linux.iso": ["virtual\\isos\\linux.iso", 2000, None, None],
             "real\\isos\\linux distro.iso": ["virtual\\isos\\linux distro.iso", 3000, None, None],
             "real\\isos\\Linux Distro.iso": ["virtual\\isos\\Linux Distro.iso", 4000, None, None],
             "real\\isos\\NetBSD.iso": ["virtual\\isos\\NetBSD.iso", 5000, None, None],
             "real\\isos\\openbsd.iso": ["virtual\\isos\\openbsd.iso", 6000, None, None]
-        })
-        core.shares.share_dbs["buddy_files"] = core.shares.share_dbs["trusted_files"] = UserDict()
-        core.shares.file_path_index = list(public_share_db)
+        }
+
+        for destination, files in (("public_files", public_files), ("buddy_files", {}), ("trusted_files", {})):
+            db_path = os.path.join(DATA_FOLDER_PATH, f"{destination}.dbn")
+            share_db = FileDatabase(encode_path(db_path))
+            share_db.update(files)
+            share_db.close()
+
+            core.shares.share_dbs[destination] = FileDatabase(encode_path(db_path), overwrite=False)
+
+        file_path_index_path = encode_path(os.path.join(DATA_FOLDER_PATH, "filepaths.dbn"))
+        file_path_index = StringTable(file_path_index_path)
+        file_path_index.update(public_files)
+        file_path_index.close()
 
-        for share_db in core.shares.share_dbs.values():
-            share_db.close = lambda: None
+        core.shares.share_dbs["file_paths"] = StringTable(file_path_index_path, overwrite=False)
 
         num_results, fileinfos, private_fileinfos = core.search._create_file_info_list(
-            results, max_results=100, permission_level=PermissionLevel.PUBLIC
+            results, max_results=100, permission_level=PermissionLevel.PUBLIC, share_dbs=core.shares.share_dbs
         )
         self.assertEqual(num_results, 3)
         self.assertEqual(fileinfos, [
-            ["virtual\\isos\\freebsd.iso", 1000, None, None],
-            ["virtual\\isos\\linux.iso", 2000, None, None],
-            ["virtual\\isos\\openbsd.iso", 6000, None, None]
+            (public_files[file_path][0], FileListMessage.pack_file_info(public_files[file_path]))
+            for file_path in ("real\\isos\\freebsd.iso", "real\\isos\\linux.iso", "real\\isos\\openbsd.iso")
         ])
         self.assertEqual(private_fileinfos, [])
@@ -2,14 +2,30 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import os
+import pickle
 import shutil
 import struct
+import time
 import wave
 
+from threading import Event
 from unittest import TestCase
+from unittest.mock import patch
 
 from pynicotine.config import config
 from pynicotine.core import core
+from pynicotine.events import events
+from pynicotine.shares import Database
+from pynicotine.shares import DatabaseError
+from pynicotine.shares import FileDatabase
+from pynicotine.shares import MetadataDatabase
+from pynicotine.shares import PermissionLevel
+from pynicotine.shares import Scanner
+from pynicotine.shares import Shares
+from pynicotine.shares import SharesWatcher
+from pynicotine.shares import StringTable
+from pynicotine.shares import WordSuffixTable
+from pynicotine.utils import encode_path
 
 CURRENT_FOLDER_PATH = os.path.dirname(os.path.realpath(__file__))
 DATA_FOLDER_PATH = os.path.join(CURRENT_FOLDER_PATH, "temp_data")
@@ -24,6 +40,11 @@ AUDIO_FILES = (
 )
 
 
+def get_db_contents(destination):
+    share_db = core.shares.share_dbs[destination]
+    return {key: share_db[key] for key in share_db}
+
+
 class SharesTest(TestCase):
 
     def setUp(self):
@@ -196,3 +217,453 @@ class SharesTest(TestCase):
         self.assertNotIn(os.path.join(TRUSTED_SHARES_FOLDER_PATH, ".hidden_folder", "nothing"), trusted_files)
         self.assertIn(os.path.join(TRUSTED_SHARES_FOLDER_PATH, "dummy_file3"), trusted_files)
         self.assertEqual(len(trusted_files), 3)
+
+    def test_incremental_rescan(self):
+        """Test that an incremental rescan reuses unchanged folders, and picks
+        up files added to a folder."""
+
+        old_public_files = get_db_contents("public_files")
+        old_public_streams = get_db_contents("public_streams")
+        old_words = get_db_contents("words")
+        new_file_path = os.path.join(SHARES_FOLDER_PATH, "folder1", "new_file")
+
+        config.sections["transfers"]["incremental_rescan"] = True
+
+        # Unchanged shares
+        core.shares.rescan_shares(use_thread=False)
+        core.shares.load_shares(core.shares.share_dbs, core.shares.share_db_paths)
+
+        self.assertEqual(get_db_contents("public_files"), old_public_files)
+        self.assertEqual(get_db_contents("public_streams"), old_public_streams)
+        self.assertEqual(get_db_contents("words"), old_words)
+
+        # New file in folder
+        with open(new_file_path, "wb"):
+            pass
+
+        self.addCleanup(os.remove, new_file_path)
+
+        core.shares.rescan_shares(use_thread=False)
+        core.shares.load_shares(core.shares.share_dbs, core.shares.share_db_paths)
+
+        self.assertEqual(
+            core.shares.share_dbs["public_files"][new_file_path],
+            ["Shares\\folder1\\new_file", 0, None, None]
+        )
+        self.assertEqual(len(core.shares.share_dbs["public_files"]), len(old_public_files) + 1)
+        self.assertIn("new", core.shares.share_dbs["words"])
+
+    def test_incremental_rescan_filters_changed(self):
+        """Test that an incremental rescan picks up files in unchanged folders
+        after removing the share filter that excluded them."""
+
+        file_path = os.path.join(SHARES_FOLDER_PATH, "folder1", "nothing")
+        share_filters = config.sections["transfers"]["share_filters"]
+
+        config.sections["transfers"]["incremental_rescan"] = True
+        config.sections["transfers"]["share_filters"] = share_filters + ["nothing"]
+        self.addCleanup(config.sections["transfers"].__setitem__, "share_filters", share_filters)
+
+        core.shares.rescan_shares(use_thread=False)
+        core.shares.load_shares(core.shares.share_dbs, core.shares.share_db_paths)
+        self.assertNotIn(file_path, core.shares.share_dbs["public_files"])
+
+        config.sections["transfers"]["share_filters"] = share_filters
+
+        core.shares.rescan_shares(use_thread=False)
+        core.shares.load_shares(core.shares.share_dbs, core.shares.share_db_paths)
+        self.assertIn(file_path, core.shares.share_dbs["public_files"])
+
+    def test_changed_folder_rescan(self):
+        """Test that a rescan of folders reported as changed picks up files
+        rewritten in place, which leaves the folder modification time
+        unchanged."""
+
+        folder_path = os.path.join(SHARES_FOLDER_PATH, "folder1")
+        file_path = os.path.join(folder_path, "rewritten_file")
+
+        with open(file_path, "wb") as file_handle:
+            file_handle.write(b"partial")
+
+        self.addCleanup(os.remove, file_path)
+
+        core.shares.rescan_shares(use_thread=False)
+        core.shares.load_shares(core.shares.share_dbs, core.shares.share_db_paths)
+        self.assertEqual(core.shares.share_dbs["public_files"][file_path][1], 7)
+
+        folder_mtime_ns = os.stat(folder_path).st_mtime_ns
+        file_mtime_ns = os.stat(file_path).st_mtime_ns
+
+        with open(file_path, "r+b") as file_handle:
+            file_handle.write(b"complete file")
+
+        # Only the size changed
+        os.utime(file_path, ns=(file_mtime_ns, file_mtime_ns))
+        self.assertEqual(os.stat(folder_path).st_mtime_ns, folder_mtime_ns)
+
+        core.shares.rescan_shares(use_thread=False, changed_folder_paths={folder_path})
+        core.shares.load_shares(core.shares.share_dbs, core.shares.share_db_paths)
+
+        self.assertEqual(core.shares.share_dbs["public_files"][file_path][1], 13)
+
+    def test_compressed_shares(self):
+        """Test that compressed shares lists are joined from segment files
+        written by the scanner."""
+
+        public_shares = core.shares.compressed_shares[PermissionLevel.PUBLIC]
+        trusted_shares = core.shares.compressed_shares[PermissionLevel.TRUSTED]
+
+        self.assertTrue(os.path.isfile(core.shares.get_shares_list_segment_path(
+            os.path.dirname(core.shares.share_db_paths["public_streams"]), PermissionLevel.PUBLIC
+        )))
+
+        for compressed_shares in (public_shares, trusted_shares):
+            compressed_shares.parse_local_message()
+            compressed_shares.finish_parsing()
+
+        public_folder_paths = [folder_path for folder_path, _files in public_shares.list]
+        trusted_folder_paths = [folder_path for folder_path, _files in trusted_shares.list]
+
+        self.assertEqual(len(public_folder_paths), len(core.shares.share_dbs["public_streams"]))
+        self.assertIn("Shares\\folder1", public_folder_paths)
+        self.assertNotIn("Secrets", public_folder_paths)
+        self.assertIn("Secrets", trusted_folder_paths)
+        self.assertIn("Trusted", trusted_folder_paths)
+
+    def test_serve_shares_while_rescanning(self):
+        """Test that shares of the current generation are served while the
+        scanner rescans shares at startup."""
+
+        loaded_shares = []
+        current_shares_loaded = Shares._current_shares_loaded  # pylint: disable=protected-access
+
+        def _current_shares_loaded(shares, process):
+            current_shares_loaded(shares, process)
+            loaded_shares.append((
+                shares.rescanning, len(shares.share_dbs.get("public_files", {})),
+                shares.compressed_shares[PermissionLevel.PUBLIC]
+            ))
+
+        # The users component is not enabled, don't send share stats to the server
+        for patcher in (
+            patch.object(Shares, "_current_shares_loaded", _current_shares_loaded),
+            patch.object(Shares, "send_num_shared_folders_files")
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        num_public_files = len(core.shares.share_dbs["public_files"])
+        old_public_shares = core.shares.compressed_shares[PermissionLevel.PUBLIC]
+        core.shares.close_shares(core.shares.share_dbs)
+
+        core.shares.rescan_shares(init=True, use_thread=True)
+        end_time = time.monotonic() + 10
+
+        while core.shares.rescanning and time.monotonic() < end_time:
+            events.process_thread_events()
+            time.sleep(0.01)
+
+        self.assertFalse(core.shares.rescanning)
+        self.assertEqual(len(loaded_shares), 1)
+
+        is_rescanning, num_loaded_public_files, public_shares = loaded_shares[0]
+
+        self.assertTrue(is_rescanning)
+        self.assertEqual(num_loaded_public_files, num_public_files)
+        self.assertIsNot(public_shares, old_public_shares)
+
+    def test_share_generations(self):
+        """Test that a rescan writes a new generation of share databases, and
+        removes previous and incomplete generations afterwards."""
+
+        old_generation_folder_path = os.path.dirname(core.shares.share_db_paths["words"])
+        generations_folder_path = os.path.dirname(old_generation_folder_path)
+        incomplete_generation_folder_path = os.path.join(generations_folder_path, "1000")
+        os.makedirs(incomplete_generation_folder_path)
+
+        core.shares.rescan_shares(use_thread=False)
+
+        new_generation_folder_path = os.path.dirname(core.shares.share_db_paths["words"])
+
+        with open(os.path.join(generations_folder_path, "current"), encoding="ascii") as file_handle:
+            self.assertEqual(file_handle.read(), os.path.basename(new_generation_folder_path))
+
+        self.assertNotEqual(new_generation_folder_path, old_generation_folder_path)
+        self.assertTrue(os.path.isfile(core.shares.share_db_paths["public_files"]))
+        self.assertFalse(os.path.exists(old_generation_folder_path))
+        self.assertFalse(os.path.exists(incomplete_generation_folder_path))
+
+    def test_share_generation_in_use(self):
+        """Test that databases of a previous generation stay open while a
+        worker thread reads them, and are closed and removed once
+        released."""
+
+        old_generation_folder_path = os.path.dirname(core.shares.share_db_paths["words"])
+        old_share_dbs = core.shares.acquire_share_dbs()
+        old_file_paths = list(old_share_dbs["file_paths"])
+
+        core.shares.rescan_shares(use_thread=False)
+
+        self.assertIsNot(core.shares.share_dbs, old_share_dbs)
+        self.assertTrue(os.path.isdir(old_generation_folder_path))
+        self.assertEqual(list(old_share_dbs["file_paths"]), old_file_paths)
+
+        core.shares.release_share_dbs(old_share_dbs)
+        events.process_thread_events()
+
+        self.assertFalse(old_share_dbs)
+        self.assertFalse(os.path.exists(old_generation_folder_path))
+
+    def test_file_path_index(self):
+        """Test that the file path index is read from a string table, and
+        recreated for a generation of share databases without one."""
+
+        expected_file_paths = [
+            *core.shares.share_dbs["public_files"],
+            *core.shares.share_dbs["buddy_files"],
+            *core.shares.share_dbs["trusted_files"]
+        ]
+
+        self.assertIsInstance(core.shares.file_path_index, StringTable)
+        self.assertEqual(list(core.shares.file_path_index), expected_file_paths)
+
+        core.shares.close_shares(core.shares.share_dbs)
+        os.remove(core.shares.share_db_paths["file_paths"])
+
+        core.shares.rescan_shares(init=True, rescan=False, use_thread=False)
+        core.shares.load_shares(core.shares.share_dbs, core.shares.share_db_paths)
+
+        self.assertEqual(list(core.shares.file_path_index), expected_file_paths)
+
+    def test_metadata_cache(self):
+        """Test that rebuilding shares reuses cached audio metadata of files
+        with an unchanged identity, instead of parsing them again."""
+
+        file_path = os.path.join(SHARES_FOLDER_PATH, "audiofile.wav")
+        file_stat = os.stat(file_path)
+        metadata_key = Scanner.get_metadata_key(
+            os.stat(SHARES_FOLDER_PATH).st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+
+        self.assertEqual(core.shares.share_dbs["metadata"][metadata_key], ((706, 0, 44100, 16), 1))
+
+        # Replace cached metadata, to verify that the file is not parsed again
+        core.shares.close_shares(core.shares.share_dbs)
+
+        metadata_db = MetadataDatabase(encode_path(core.shares.share_db_paths["metadata"]))
+        metadata_db[metadata_key] = ((706, 0, 48000, 24), 5)
+        metadata_db.close()
+
+        core.shares.rescan_shares(rebuild=True, use_thread=False)
+        core.shares.load_shares(core.shares.share_dbs, core.shares.share_db_paths)
+
+        self.assertEqual(
+            core.shares.share_dbs["public_files"][file_path],
+            ["Shares\\audiofile.wav", 100044, (706, 0, 48000, 24), 5]
+        )
+        self.assertEqual(core.shares.share_dbs["metadata"][metadata_key], ((706, 0, 48000, 24), 5))
+
+    def test_shares_watcher(self):
+        """Test that the shares watcher reports folders with new files."""
+
+        changed_event = Event()
+        reported_folder_paths = set()
+        new_file_path = os.path.join(SHARES_FOLDER_PATH, "something", "new_file")
+
+        def _shares_changed(changed_folder_paths):
+            reported_folder_paths.update(changed_folder_paths)
+            changed_event.set()
+
+        watcher = SharesWatcher([SHARES_FOLDER_PATH], _shares_changed, debounce_delay=0.2, poll_interval=0.2)
+        watcher.start()
+        self.addCleanup(watcher.stop)
+
+        # Wait for folders to be watched
+        time.sleep(0.5)
+
+        with open(new_file_path, "wb"):
+            pass
+
+        self.addCleanup(os.remove, new_file_path)
+
+        self.assertTrue(changed_event.wait(timeout=5))
+        self.assertIn(os.path.dirname(new_file_path), reported_folder_paths)
+
+    def test_database_index(self):
+        """Test looking up keys through the database index, and rejecting
+        database files without an index."""
+
+        db_path = encode_path(os.path.join(DATA_FOLDER_PATH, "indexed.dbn"))
+        items = {f"key{i}": f"value{i}".encode() for i in range(1000)}
+        self.addCleanup(os.remove, db_path)
+
+        database = Database(db_path)
+        database.update(items)
+        database.close()
+
+        database = Database(db_path, overwrite=False)
+
+        self.assertEqual(len(database), len(items))
+        self.assertEqual(list(database), list(items))
+        self.assertEqual({key: database[key] for key in items}, items)
+        self.assertNotIn("key1000", database)
+        self.assertIsNone(database.get("key1000"))
+
+        with self.assertRaises(KeyError):
+            database["key1000"]  # pylint: disable=pointless-statement
+
+        database.close()
+
+        # Database files not closed by the scanner lack an index
+        with open(db_path, "r+b") as file_handle:
+            file_handle.truncate(os.path.getsize(db_path) - Database.TRAILER.size)
+
+        with self.assertRaises(DatabaseError):
+            Database(db_path, overwrite=False)
+
+        # Database files from an older version without an index
+        with open(db_path, "wb") as file_handle:
+            file_handle.write(Database.FILE_SIGNATURE + bytes([Database.UNINDEXED_VERSION]))
+
+            for key, value in items.items():
+                file_handle.write(Database.PACK_LENGTHS(len(key), len(value)) + key.encode() + value)
+
+        self.assertTrue(Database.upgrade_file(db_path))
+
+        database = Database(db_path, overwrite=False)
+        self.addCleanup(database.close)
+
+        self.assertEqual({key: database[key] for key in database}, items)
+
+    def test_word_suffix_table(self):
+        """Test looking up words ending with a suffix in the sorted table of
+        reversed words."""
+
+        table_path = encode_path(os.path.join(DATA_FOLDER_PATH, "wordsuffixes.dbn"))
+        words = ["hello", "jello", "yellow", "ello", "llo", "cello", "über", "tuber", "wav"]
+        self.addCleanup(os.remove, table_path)
+
+        table = WordSuffixTable(table_path)
+        table.update(words)
+        table.close()
+
+        table = WordSuffixTable(table_path, overwrite=False)
+        self.addCleanup(table.close)
+
+        self.assertEqual(len(table), len(words))
+        self.assertEqual(list(table), sorted(word[::-1] for word in words))
+        self.assertEqual(set(table.iter_words_ending_with("ello")), {"hello", "jello", "ello", "cello"})
+        self.assertEqual(set(table.iter_words_ending_with("ber")), {"über", "tuber"})
+        self.assertEqual(set(table.iter_words_ending_with("wav")), {"wav"})
+        self.assertEqual(list(table.iter_words_ending_with("zzz")), [])
+        self.assertEqual(list(table.iter_words_ending_with("awav")), [])
+
+        with self.assertRaises(IndexError):
+            table[len(words)]  # pylint: disable=pointless-statement
+
+    def test_path_translation(self):
+        """Test that translating between virtual and real paths with the
+        prefix tries gives the same results as testing every shared folder."""
+
+        def real2virtual(share_groups, real_path):
+
+            real_path = real_path.replace("/", "\\")
+
+            for shared_folder_paths in share_groups:
+                for virtual_name, folder_path, *_unused in shared_folder_paths:
+                    folder_path = folder_path.replace("/", "\\")
+
+                    if real_path == folder_path:
+                        return virtual_name
+
+                    folder_path = folder_path.rstrip("\\") + "\\"
+
+                    if real_path.startswith(folder_path):
+                        return f"{virtual_name}\\{real_path[len(folder_path):]}"
+
+            return None
+
+        def virtual2real(share_groups, virtual_path):
+
+            for shares in share_groups:
+                for virtual_name, folder_path, *_unused in shares:
+                    if virtual_path == virtual_name:
+                        return folder_path
+
+                    if virtual_path.startswith(virtual_name + "\\"):
+                        return folder_path.rstrip(os.sep) + virtual_path[len(virtual_name):].replace("\\", os.sep)
+
+            return "__INVALID_SHARE__" + virtual_path
+
+        share_groups = (
+            [("Music", "/home/user/Music"), ("Rock", "/home/user/Music/Rock"), ("Root", "/")],
+            [("Music", "/srv/music/"), ("Music2", "/srv/music"), ("Drive", "C:\\")],
+            [("Home", "/home/user"), ("Trailing", "/home/other/")]
+        )
+        real_paths = (
+            "/", "/home", "/home/user", "/home/user/", "/home/user/Music", "/home/user/Music/",
+            "/home/user/Music/Rock/song.flac", "/home/user/Musicals/song.flac", "/srv/music", "/srv/music/",
+            "/srv/music/album/song.mp3", "/home/other", "/home/other/", "/home/other/file", "C:\\",
+            "C:\\Music\\song.mp3", "C:", "D:\\file", "relative/path", ""
+        )
+        virtual_paths = (
+            "Music", "Music\\", "Music\\Rock\\song.flac", "Musical\\song.flac", "Music2\\album\\song.mp3",
+            "Root\\etc\\file", "Drive\\file", "Home", "Trailing\\file", "Unknown\\file", "", "\\Music"
+        )
+
+        scanner = Scanner(writer=None, share_groups=share_groups, share_db_paths={})
+
+        for real_path in real_paths:
+            expected_virtual_path = real2virtual(share_groups, real_path)
+
+            if expected_virtual_path is None:
+                with self.assertRaises(ValueError):
+                    scanner.real2virtual(real_path)
+                continue
+
+            self.assertEqual(scanner.real2virtual(real_path), expected_virtual_path, real_path)
+
+        config.sections["transfers"]["shared"] = share_groups[0]
+        config.sections["transfers"]["buddyshared"] = share_groups[1]
+        config.sections["transfers"]["trustedshared"] = share_groups[2]
+
+        for virtual_path in virtual_paths:
+            self.assertEqual(
+                core.shares.virtual2real(virtual_path), virtual2real(share_groups, virtual_path), virtual_path)
+
+        # Trie is rebuilt when shares change
+        core.shares.add_share("/tmp/new", virtual_name="New", validate_path=False)
+        self.assertEqual(core.shares.virtual2real("New\\file"), os.path.normpath("/tmp/new") + os.sep + "file")
+
+        core.shares.remove_share("Rock")
+        self.assertEqual(
+            core.shares.virtual2real("Rock\\song.flac"), virtual2real(share_groups, "Rock\\song.flac"))
+
+    def test_upgrade_legacy_database(self):
+        """Test converting a database file from the legacy pickle-based format."""
+
+        db_path = encode_path(os.path.join(DATA_FOLDER_PATH, "legacyfiles.dbn"))
+        files = {
+            "/real/path/file.txt": ["Shares\\file.txt", 1000, None, None],
+            "/real/path/audio.flac": ["Shares\\audio.flac", 2000, (None, 0, 44100, 16), 300],
+            "/real/path/audio.mp3": ["Shares\\audio.mp3", 3000, (320, 1, None, None), None]
+        }
+
+        with open(db_path, "wb") as file_handle:
+            file_handle.write(FileDatabase.FILE_SIGNATURE + bytes([FileDatabase.LEGACY_VERSION]))
+
+            for key, value in files.items():
+                encoded_key = key.encode("utf-8")
+                pickled_value = pickle.dumps(value)
+
+                file_handle.write(FileDatabase.PACK_LENGTHS(len(encoded_key), len(pickled_value)))
+                file_handle.write(encoded_key + pickled_value)
+
+        self.addCleanup(os.remove, db_path)
+
+        self.assertTrue(FileDatabase.upgrade_file(db_path))
+        self.assertFalse(FileDatabase.upgrade_file(db_path))
+
+        database = FileDatabase(db_path, overwrite=False)
+        self.addCleanup(database.close)
+
+        self.assertEqual({key: database[key] for key in database}, files)
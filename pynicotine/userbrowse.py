@@ -58,6 +58,7 @@ class UserBrowse:
             ("peer-connection-error", self._peer_connection_error),
             ("quit", self._quit),
             ("server-login", self._server_login),
+            ("shared-file-list-folders", self._shared_file_list_folders),
             ("shared-file-list-response", self._shared_file_list_response)
         ):
             events.connect(event_name, callback)
@@ -448,6 +449,29 @@ class UserBrowse:
                 events.emit("shared-file-list-failed", username, is_offline)
                 break
 
+    def _shared_file_list_folders(self, username, public_folders, private_folders):
+        """Folders of a large shares list that is still being received."""
+
+        browsed_user = self.users.get(username)
+
+        if browsed_user is None:
+            return
+
+        num_files = 0
+        shared_size = 0
+
+        for _folder_path, files in chain(public_folders, private_folders):
+            for file_info in files:
+                shared_size += file_info[2]
+
+            num_files += len(files)
+
+        browsed_user.public_folders.update(public_folders)
+        browsed_user.private_folders.update(private_folders)
+        browsed_user.num_folders = (browsed_user.num_folders or 0) + len(public_folders) + len(private_folders)
+        browsed_user.num_files = (browsed_user.num_files or 0) + num_files
+        browsed_user.shared_size = (browsed_user.shared_size or 0) + shared_size
+
     def _shared_file_list_response(self, msg):
 
         username = msg.username